@@ -0,0 +1,546 @@
+import os
+import sys
+import json
+import time
+import gzip
+import base64
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Dynamically determine the project root (one directory up from this script)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+OUTPUT_FILE = os.path.join(ROOT_DIR, "bench_results.json")
+
+SEND_SIZES = [1000, 10000, 100000, 1000000]
+QUICK_SEND_SIZES = [1000, 10000]
+RENDER_COUNT = 100000
+SITEMAP_FILES = 100000
+MANUSCRIPT_MB = 100
+FROM_ADDRESS = "newsletter@example.com"
+PERSONALIZED_TEMPLATE = ("<html><body><h1>The Compendium of Universal Record</h1><p>Hello {recipient_name},</p>"
+                         "<p>New entries were published on {timestamp}.</p>" + "<p>Lorem ipsum dolor sit amet.</p>" * 40 +
+                         "<p>Sent to {recipient_email}.</p></body></html>")
+# Metrics compared against a previous results file (higher_is_better)
+COMPARED_METRICS = {"recipients_per_second": True, "p50_ms": False, "p99_ms": False, "peak_rss_mb": False,
+                    "seconds": False, "per_second": True, "mb_per_second": True, "importtime_ms": False}
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+# ---------------------------------------------------------------------------
+# Stand-in services
+# ---------------------------------------------------------------------------
+
+def make_jwt(claims):
+    # Unsigned JWT-shaped token; the newsletter only reads its 'exp' claim
+    def encode(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode("utf-8")).decode("ascii").rstrip("=")
+    return f"{encode({'alg': 'none'})}.{encode(claims)}.sig"
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Serves the Microsoft identity token endpoint and Graph sendMail/$batch from one port.
+    protocol_version = "HTTP/1.1" # keep-alive, so the client's connection pool is exercised
+    disable_nagle_algorithm = True # headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload=None, headers=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        server = self.server
+        if self.path.endswith("/oauth2/v2.0/token"):
+            server.count(token_fetches=1)
+            now = int(time.time())
+            token = make_jwt({"aud": "https://graph.microsoft.com", "iat": now, "exp": now + server.token_ttl,
+                              "jti": f"{now}-{random.random()}"})
+            self._reply(200, {"access_token": token, "token_type": "Bearer", "expires_in": server.token_ttl})
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        server.count(requests=1)
+        if self.path.endswith("/$batch"):
+            responses = [self._send_mail(sub_request["body"], sub_request["id"])
+                         for sub_request in json.loads(body)["requests"]]
+            self._reply(200, {"responses": responses})
+        elif self.path.endswith("/sendMail"):
+            result = self._send_mail(json.loads(body))
+            self._reply(result["status"], result.get("body"), result.get("headers"))
+        else:
+            self._reply(404, {"error": {"code": "NotFound", "message": self.path}})
+
+    def _send_mail(self, mail, request_id=None):
+        server = self.server
+        message = mail["message"]
+        recipients = sum(len(message.get(field, ())) for field in ("toRecipients", "ccRecipients", "bccRecipients"))
+        if server.recipient_cap and recipients > server.recipient_cap:
+            server.count(rejected=1)
+            return {"id": request_id, "status": 400, "body": {"error": {"code": "ErrorExceededMessageLimit",
+                    "message": f"{recipients} recipients exceeds the limit of {server.recipient_cap}"}}}
+        if server.throttle_rate and server.rng.random() < server.throttle_rate:
+            server.count(throttled=1)
+            return {"id": request_id, "status": 429, "headers": {"Retry-After": str(server.retry_after)},
+                    "body": {"error": {"code": "ApplicationThrottled", "message": "Too many requests"}}}
+        server.count(messages=1, recipients=recipients)
+        return {"id": request_id, "status": 202}
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, retry_after=0, recipient_cap=500, token_ttl=3600, seed=0):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.recipient_cap = recipient_cap
+        self.token_ttl = token_ttl
+        self.rng = random.Random(seed)
+        self.counters = {"token_fetches": 0, "requests": 0, "messages": 0, "recipients": 0, "throttled": 0, "rejected": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.counters[key] += value
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class FakeFirestoreDocument:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+class FakeSubscriberQuery:
+    # Generates subscriber documents on demand for the order_by/limit/start_after/stream
+    # calls the recipient sources make, so a million-document collection costs nothing to hold.
+    def __init__(self, client, start=0, page_size=None):
+        self.client = client
+        self.start = start
+        self.page_size = page_size
+
+    def where(self, field, op, value):
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, count):
+        return FakeSubscriberQuery(self.client, self.start, count)
+
+    def start_after(self, doc):
+        return FakeSubscriberQuery(self.client, int(doc.id) + 1, self.page_size)
+
+    def stream(self):
+        if self.client.page_latency:
+            time.sleep(self.client.page_latency)
+        end = self.client.size if self.page_size is None else min(self.client.size, self.start + self.page_size)
+        self.client.pages_read += 1
+        for i in range(self.start, end):
+            yield FakeFirestoreDocument(str(i), {"email": f"reader{i:07d}@example.com", "updated_at": i,
+                                                 "subscribed": True})
+
+class FakeSubscriberClient:
+    def __init__(self, size, page_latency=0.0):
+        self.size = size
+        self.page_latency = page_latency
+        self.pages_read = 0
+
+    def collection(self, name):
+        return FakeSubscriberQuery(self)
+
+# ---------------------------------------------------------------------------
+# Scenarios (each runs in its own process so peak RSS belongs to that scenario alone)
+# ---------------------------------------------------------------------------
+
+def run_send(params):
+    # Stream params['recipients'] subscribers from the fake Firestore client and send them
+    # through the real SendEngine against the stand-in server named by GRAPH_API_URL.
+    import requests
+    from newsletter import SendEngine, TokenProvider, create_session, send_newsletter, stream_recipients_from_firestore
+
+    latencies = []
+    statuses = {}
+
+    class TimedSession(requests.Session):
+        def request(self, method, url, *args, **kwargs):
+            started = time.perf_counter()
+            response = super().request(method, url, *args, **kwargs)
+            if "/oauth2/" not in url:
+                latencies.append(time.perf_counter() - started)
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            return response
+
+    concurrency = params.get("concurrency", 4)
+    session = create_session(concurrency)
+    timed = TimedSession()
+    timed.adapters = session.adapters
+    provider = TokenProvider(client_id="bench", client_secret="bench", tenant_id="bench", cache_path="",
+                             refresh_margin=min(300, params.get("token_ttl", 3600) / 2), session=timed)
+    client = FakeSubscriberClient(params["recipients"], params.get("page_latency", 0.0))
+    error = None
+    started = time.perf_counter()
+    with SendEngine(token_provider=provider, session=timed, max_workers=concurrency, backoff_base=0.05,
+                    compress=params.get("compress", False)) as engine:
+        recipients = stream_recipients_from_firestore(client=client, page_size=params.get("page_size", 500))
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            try:
+                send_newsletter(recipients=recipients, subject="Benchmark", content_html="<p>Benchmark body</p>",
+                                from_address=FROM_ADDRESS, delivery_mode=params.get("mode", "bcc"),
+                                chunk_size=params.get("chunk_size", 50), engine=engine)
+            except Exception as e:
+                error = str(e)[:200]
+        stats = dict(engine.stats)
+    elapsed = time.perf_counter() - started
+    return {
+        "recipients": params["recipients"],
+        "mode": params.get("mode", "bcc"),
+        "seconds": round(elapsed, 3),
+        "recipients_per_second": round(stats["recipients"] / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "status_codes": statuses,
+        "engine": stats,
+        "firestore_pages": client.pages_read,
+        "token_fetches": provider.fetch_count,
+        "peak_rss_mb": peak_rss_mb(),
+        "error": error,
+    }
+
+def run_render(params):
+    # Personalized body rendering: compiled template vs. str.format on the raw source.
+    from newsletter import CompiledTemplate, default_template_context, recipient_context, render_many
+    count = params["count"]
+    template = CompiledTemplate(PERSONALIZED_TEMPLATE)
+    shared = default_template_context()
+    contexts = [recipient_context(f"reader{i:07d}@example.com", shared, {"name": f"Reader {i}"}) for i in range(count)]
+
+    started = time.perf_counter()
+    for context in contexts:
+        template.render(context)
+    compiled = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for context in contexts:
+        PERSONALIZED_TEMPLATE.format(**context)
+    baseline = time.perf_counter() - started
+
+    processes = os.cpu_count() or 1
+    started = time.perf_counter()
+    for _ in render_many(template, contexts, processes=processes):
+        pass
+    pooled = time.perf_counter() - started
+    return {
+        "count": count,
+        "seconds": round(compiled, 3),
+        "per_second": round(count / compiled, 1),
+        "str_format_per_second": round(count / baseline, 1),
+        "render_many_processes": processes,
+        "render_many_per_second": round(count / pooled, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_encode(params):
+    # $batch request encoding for a params['body_kb'] KB body: json.dumps of the payload
+    # dicts (the old path) vs. splicing pre-encoded fragments.
+    import json as json_module
+    from newsletter import build_batch_requests, build_encoded_batches, plan_messages
+    html = ("<p>" + "Lorem ipsum dolor sit amet, “consectetur” adipiscing elit. " * 20 + "</p>\n") * \
+        max(1, params["body_kb"] * 1024 // 1300)
+    recipients = [f"reader{i:07d}@example.com" for i in range(params["recipients"])]
+
+    started = time.perf_counter()
+    size = 0
+    for payload, _ in build_batch_requests(FROM_ADDRESS, "Benchmark", html, plan_messages(recipients, "bcc", 50), "bcc"):
+        size += len(json_module.dumps(payload).encode("utf-8"))
+    baseline = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for batch, _ in build_encoded_batches(FROM_ADDRESS, "Benchmark", html, plan_messages(recipients, "bcc", 50), "bcc"):
+        batch.body()
+    encoded = time.perf_counter() - started
+    return {
+        "body_kb": params["body_kb"],
+        "recipients": params["recipients"],
+        "megabytes": round(size / (1024 * 1024), 1),
+        "seconds": round(encoded, 3),
+        "json_dumps_seconds": round(baseline, 3),
+        "speedup": round(baseline / encoded, 1) if encoded else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_clean(params):
+    # Normalize, validate, dedupe and suppression-filter params['recipients'] addresses (10%
+    # duplicates, 1% malformed) against a suppression index of params['suppressed'] of them.
+    from recipient_filter import SuppressionList, build_suppression_index, clean_recipients
+    count = params["recipients"]
+    def addresses():
+        for i in range(count):
+            yield f" Reader{i:07d}@Example.COM " if i % 100 else f"reader{i:07d}.example.com"
+            if i % 10 == 0:
+                yield f"Reader{i:07d}@example.com"
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, "suppression.idx")
+        step = max(1, count // max(1, params["suppressed"]))
+        started = time.perf_counter()
+        build_suppression_index((f"Reader{i:07d}@example.com" for i in range(0, count, step)), index_path)
+        build_seconds = time.perf_counter() - started
+        stats = {}
+        with SuppressionList(index_path) as suppression:
+            started = time.perf_counter()
+            for _ in clean_recipients(addresses(), suppression, stats):
+                pass
+            elapsed = time.perf_counter() - started
+    return dict(stats, recipients=count, seconds=round(elapsed, 3), per_second=round(count / elapsed, 1),
+                index_seconds=round(build_seconds, 3), peak_rss_mb=peak_rss_mb())
+
+def run_sitemap(params):
+    # generate_sitemap over synthetic paths, cold and with the per-URL cache warm.
+    from generate_sitemap import generate_sitemap
+    count = params["files"]
+    files = [f"archive/{i // 1000:03d}/entry-{i:06d}.html" for i in range(count)]
+    lastmods = {name: f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}" for i, name in enumerate(files)}
+    cache = {}
+    started = time.perf_counter()
+    size = len(generate_sitemap(files, lastmods, cache))
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    generate_sitemap(files, lastmods, cache)
+    warm = time.perf_counter() - started
+    return {
+        "files": count,
+        "bytes": size,
+        "seconds": round(cold, 3),
+        "per_second": round(count / cold, 1),
+        "warm_seconds": round(warm, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def write_synthetic_manuscript(path, megabytes, seed=0):
+    # Entries shaped like src/Fantasy.txt: marker, quoted title, wrapped paragraphs.
+    rng = random.Random(seed)
+    words = ("the of and to in record compendium universal city sea river elder archive keeper "
+             "Cassisus Tyrannius empire northern southern council decree year age").split()
+    target = megabytes * 1024 * 1024
+    written = 0
+    index = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            lines = [f"●\n\n“Of Record {index}.”\n\n"]
+            for _ in range(rng.randint(3, 8)):
+                paragraph = [" ".join(rng.choice(words) for _ in range(12)) for _ in range(rng.randint(2, 6))]
+                lines.append("\n".join(paragraph) + "\n\n")
+            block = "".join(lines)
+            f.write(block)
+            written += len(block.encode("utf-8"))
+            index += 1
+    return written
+
+def run_entries(params):
+    # Stream-split a synthetic manuscript of params['megabytes'] MB into entries.
+    from entries import iter_entries
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "Fantasy.txt")
+        size = write_synthetic_manuscript(path, params["megabytes"])
+        started = time.perf_counter()
+        count = sum(1 for _ in iter_entries(path))
+        elapsed = time.perf_counter() - started
+    return {
+        "megabytes": params["megabytes"],
+        "entries": count,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(size / (1024 * 1024) / elapsed, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_import(params):
+    # Startup cost of the sender: wall time of `import newsletter` in a fresh interpreter
+    # (best of params['repeat'], minus a bare interpreter start) and -X importtime's total.
+    def best_of(code, extra=()):
+        times = []
+        for _ in range(params["repeat"]):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, *extra, "-c", code], cwd=SCRIPT_DIR, check=True, capture_output=True)
+            times.append(time.perf_counter() - started)
+        return min(times)
+    baseline = best_of("pass")
+    with_import = best_of("import newsletter")
+    trace = subprocess.run([sys.executable, "-X", "importtime", "-c", "import newsletter"], cwd=SCRIPT_DIR,
+                           check=True, capture_output=True, text=True).stderr
+    cumulative_us = next((int(line.split("|")[1]) for line in trace.splitlines() if line.rstrip().endswith("| newsletter")), None)
+    loaded = subprocess.run([sys.executable, "-c", "import sys, newsletter; print(len(sys.modules))"], cwd=SCRIPT_DIR,
+                            check=True, capture_output=True, text=True).stdout.strip()
+    return {
+        "seconds": round(with_import - baseline, 4),
+        "interpreter_seconds": round(baseline, 4),
+        "importtime_ms": round(cumulative_us / 1000, 1) if cumulative_us is not None else None,
+        "modules_loaded": int(loaded),
+    }
+
+SCENARIOS = {"send": run_send, "render": run_render, "encode": run_encode, "clean": run_clean, "sitemap": run_sitemap, "entries": run_entries}
+
+def run_child(kind, params, env=None):
+    # Run one scenario in a fresh interpreter and return its result dict.
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = os.path.join(tmp, "result.json")
+        child_env = dict(os.environ)
+        child_env.update(env or {})
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--child", kind, json.dumps(params), result_path],
+                       env=child_env, check=True)
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+def run_send_benchmark(params):
+    # Start a stand-in server configured from params, send through it and merge its counters.
+    server = StandInServer(latency=params.get("latency_ms", 0) / 1000, throttle_rate=params.get("throttle_rate", 0.0),
+                           retry_after=params.get("retry_after", 0), recipient_cap=params.get("recipient_cap", 500),
+                           token_ttl=params.get("token_ttl", 3600)).start()
+    try:
+        result = run_child("send", params, env={"GRAPH_API_URL": f"{server.url}/v1.0", "GRAPH_LOGIN_URL": server.url})
+    finally:
+        server.stop()
+    result["server"] = dict(server.counters)
+    return result
+
+def plan(args):
+    # Return [(name, kind, params)] for the requested run.
+    send_sizes = QUICK_SEND_SIZES if args.quick else SEND_SIZES
+    send_common = {"latency_ms": args.latency_ms, "throttle_rate": args.throttle_rate, "recipient_cap": args.recipient_cap,
+                   "token_ttl": args.token_ttl, "concurrency": args.concurrency, "mode": args.mode, "compress": args.gzip}
+    runs = []
+    for size in send_sizes:
+        label = f"{size // 1000000}m" if size >= 1000000 else f"{size // 1000}k"
+        runs.append((f"send-{label}", "send", dict(send_common, recipients=size)))
+    scale = 10 if args.quick else 1
+    runs.append(("render", "render", {"count": RENDER_COUNT // scale}))
+    runs.append(("encode", "encode", {"body_kb": 100, "recipients": 100000 // scale}))
+    runs.append(("clean", "clean", {"recipients": 1000000 // scale, "suppressed": 50000 // scale}))
+    runs.append(("sitemap", "sitemap", {"files": SITEMAP_FILES // scale}))
+    runs.append(("entries", "entries", {"megabytes": max(1, MANUSCRIPT_MB // scale)}))
+    runs.append(("import", "import", {"repeat": 3 if args.quick else 10}))
+    if args.only:
+        wanted = set(args.only.split(","))
+        runs = [run for run in runs if run[0] in wanted]
+    return runs
+
+def compare(results, baseline_path):
+    # Print the change of each compared metric against an earlier results file.
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f).get("results", {})
+    print(f"\nComparison with {baseline_path}:")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            better = change > 0 if higher_is_better else change < 0
+            flag = "" if abs(change) < 5 else (" (better)" if better else " (WORSE)")
+            print(f"  {name:<12} {metric:<22} {old:>12} → {new:<12} {change:+6.1f}%{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the newsletter sender and site build scripts.")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    parser.add_argument("--only", help="comma-separated scenario names, e.g. send-10k,render")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="stand-in Graph latency per HTTP request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of sendMail calls answered with 429")
+    parser.add_argument("--recipient-cap", type=int, default=500, help="recipients per message before Graph rejects it")
+    parser.add_argument("--token-ttl", type=int, default=3600, help="lifetime of stand-in access tokens in seconds")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", default="bcc", choices=["bcc", "individual"])
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress $batch request bodies")
+    parser.add_argument("--child", nargs=3, metavar=("KIND", "PARAMS", "RESULT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, params, result_path = args.child
+        result = SCENARIOS[kind](json.loads(params))
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    results = {}
+    for name, kind, params in plan(args):
+        print(f"Running {name}...", flush=True)
+        if kind == "send":
+            result = run_send_benchmark(params)
+        elif kind == "import":
+            result = run_import(params)
+        else:
+            result = run_child(kind, params)
+        results[name] = result
+        summary = ", ".join(f"{key}={result[key]}" for key in
+                            ("recipients_per_second", "per_second", "mb_per_second", "p50_ms", "p99_ms", "seconds",
+                             "importtime_ms", "speedup",
+                             "token_fetches", "peak_rss_mb", "error") if result.get(key) is not None)
+        print(f"  {summary}")
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": {key: value for key, value in vars(args).items() if key not in ("child", "output", "compare")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    sys.path.append(SCRIPT_DIR)
+    main()
@@ -0,0 +1,229 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+
+# Dynamically determine the project root (one directory up from this script)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+SITE_DIR = os.path.join(ROOT_DIR, "_site")
+ASSETS_SUBDIR = "assets"
+MANIFEST_NAME = "asset-manifest.json"
+
+FONT_PATH = "fonts/Novela-Regular.otf"
+STYLESHEET_PATH = "styles/styles.css"
+SCRIPT_PATH = "scripts/script.js"
+PAGE_PATH = "index.html"
+GLYPH_SOURCES = ["src/Fantasy.txt", "index.html", "scripts/script.js"]
+# Copied into the site unchanged (files or directories, skipped when absent)
+PASSTHROUGH = ["robots.txt", "sitemap.xml", "entries", "search"]
+PASSTHROUGH_PATTERNS = [re.compile(r"^sitemap-\d+\.xml\.gz$")]
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".json", ".xml", ".txt", ".svg")
+FONT_FORMATS = {".woff2": "woff2", ".woff": "woff", ".otf": "opentype", ".ttf": "truetype"}
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def hashed_name(rel_path, data):
+    # styles/styles.css -> assets/styles.<hash>.css
+    stem, ext = os.path.splitext(os.path.basename(rel_path))
+    return f"{ASSETS_SUBDIR}/{stem}.{content_hash(data)[:10]}{ext}"
+
+def _read(root_dir, rel_path):
+    with open(os.path.join(root_dir, rel_path), "rb") as f:
+        return f.read()
+
+def _write_if_changed(path, data):
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+def collect_glyphs(root_dir, sources=GLYPH_SOURCES):
+    # Every character the site can show: the manuscript, the page chrome and printable ASCII.
+    chars = {chr(c) for c in range(0x20, 0x7f)}
+    for rel_path in sources:
+        path = os.path.join(root_dir, rel_path)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    chars.update(line)
+    chars.discard("\n")
+    chars.discard("\r")
+    return "".join(sorted(chars))
+
+def subset_font(font_data, text):
+    # Subset the font to the given characters. Returns (data, extension): WOFF2 when
+    # fontTools and brotli are installed, WOFF with fontTools alone, otherwise the
+    # original font unchanged.
+    try:
+        from fontTools import subset
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        print("# WARNING: fontTools is not installed; shipping the full font. pip install fonttools brotli")
+        return font_data, None
+    try:
+        import brotli # noqa: F401 -- required by fontTools for WOFF2
+        flavor = "woff2"
+    except ImportError:
+        print("# WARNING: brotli is not installed; writing WOFF instead of WOFF2.")
+        flavor = "woff"
+
+    import io
+    options = subset.Options()
+    options.flavor = flavor
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    font = TTFont(io.BytesIO(font_data))
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    out = io.BytesIO()
+    subset.save_font(font, out, options)
+    return out.getvalue(), f".{flavor}"
+
+def compress_variants(data):
+    # Return {'.gz': bytes, '.br': bytes} precompressed variants (brotli only if installed).
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        variants[".br"] = brotli.compress(data, quality=11)
+    except ImportError:
+        pass
+    return variants
+
+def _load_manifest(site_dir):
+    path = os.path.join(site_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _is_passthrough(name):
+    # Top-level site names owned by the pass-through copy, including .gz/.br variants
+    base = name[:-3] if name.endswith((".gz", ".br")) else name
+    return base in PASSTHROUGH or any(p.match(n) for p in PASSTHROUGH_PATTERNS for n in (name, base))
+
+def _prune_passthrough(site_dir, emitted):
+    for name in os.listdir(site_dir):
+        if not _is_passthrough(name):
+            continue
+        path = os.path.join(site_dir, name)
+        if not os.path.isdir(path):
+            if name not in emitted:
+                os.remove(path)
+            continue
+        for dirpath, _, filenames in os.walk(path, topdown=False):
+            for filename in filenames:
+                file_path = os.path.join(dirpath, filename)
+                if os.path.relpath(file_path, site_dir) not in emitted:
+                    os.remove(file_path)
+            if not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+def build_assets(root_dir=ROOT_DIR, site_dir=SITE_DIR):
+    # Build the deployable site into site_dir: a glyph-subset font, content-hashed CSS/JS
+    # referenced from a rewritten index.html, .gz/.br variants of text assets and a
+    # manifest mapping source paths to hashed URLs. Work is skipped for inputs whose
+    # hash matches the previous manifest. Returns {'written', 'skipped'} counts.
+    previous = _load_manifest(site_dir)
+    prev_inputs = previous.get("inputs", {})
+    prev_assets = previous.get("assets", {})
+    inputs = {}
+    assets = {}
+    stats = {"written": 0, "skipped": 0}
+    emitted = set()
+
+    def emit(rel_out, data, compress=True):
+        written = _write_if_changed(os.path.join(site_dir, rel_out), data)
+        emitted.add(os.path.normpath(rel_out))
+        if compress and rel_out.endswith(COMPRESSIBLE_EXTENSIONS):
+            for ext, variant in compress_variants(data).items():
+                written |= _write_if_changed(os.path.join(site_dir, rel_out + ext), variant)
+                emitted.add(os.path.normpath(rel_out + ext))
+        stats["written" if written else "skipped"] += 1
+
+    def unchanged(key, digest):
+        inputs[key] = digest
+        out = prev_assets.get(key)
+        return prev_inputs.get(key) == digest and out and os.path.exists(os.path.join(site_dir, out))
+
+    # Font: subsetting is the expensive step, keyed on the font bytes plus the glyph set
+    font_data = _read(root_dir, FONT_PATH)
+    glyphs = collect_glyphs(root_dir)
+    font_key = content_hash(font_data + glyphs.encode("utf-8"))
+    if unchanged(FONT_PATH, font_key):
+        assets[FONT_PATH] = prev_assets[FONT_PATH]
+        stats["skipped"] += 1
+    else:
+        subset_data, ext = subset_font(font_data, glyphs)
+        out = hashed_name(FONT_PATH, subset_data)
+        if ext:
+            out = os.path.splitext(out)[0] + ext
+        assets[FONT_PATH] = out
+        emit(out, subset_data, compress=False)
+        print(f"Font {FONT_PATH}: {len(font_data)} → {len(subset_data)} bytes ({len(glyphs)} glyphs) → {out}")
+
+    # Stylesheet: point @font-face at the hashed font before hashing the CSS itself
+    css = _read(root_dir, STYLESHEET_PATH).decode("utf-8")
+    font_out = assets[FONT_PATH]
+    font_format = FONT_FORMATS[os.path.splitext(font_out)[1]]
+    css = re.sub(r"url\((['\"]?)[^)'\"]*" + re.escape(os.path.basename(FONT_PATH)) + r"\1\)\s*format\([^)]*\)",
+                 f"url('../{font_out}') format('{font_format}')", css)
+    css_data = css.encode("utf-8")
+    for rel_path, data in ((STYLESHEET_PATH, css_data), (SCRIPT_PATH, _read(root_dir, SCRIPT_PATH))):
+        if unchanged(rel_path, content_hash(data)):
+            assets[rel_path] = prev_assets[rel_path]
+            stats["skipped"] += 1
+        else:
+            assets[rel_path] = hashed_name(rel_path, data)
+            emit(assets[rel_path], data)
+
+    # Page: rewrite references to the hashed URLs and preload the font
+    html = _read(root_dir, PAGE_PATH).decode("utf-8")
+    for rel_path in (STYLESHEET_PATH, SCRIPT_PATH):
+        html = html.replace(f'"{rel_path}"', f'"{assets[rel_path]}"')
+    preload = (f'<link rel="preload" href="{font_out}" as="font" '
+               f'type="font/{os.path.splitext(font_out)[1][1:]}" crossorigin>')
+    html = html.replace('<link rel="stylesheet"', f'{preload}\n    <link rel="stylesheet"', 1)
+    emit(PAGE_PATH, html.encode("utf-8"))
+
+    # Pass-through files (entry shards, search index, sitemap, robots.txt)
+    passthrough = [p for p in PASSTHROUGH if os.path.exists(os.path.join(root_dir, p))]
+    passthrough += [name for name in os.listdir(root_dir) if any(p.match(name) for p in PASSTHROUGH_PATTERNS)]
+    for rel_path in passthrough:
+        src = os.path.join(root_dir, rel_path)
+        if os.path.isdir(src):
+            for dirpath, _, filenames in os.walk(src):
+                for filename in filenames:
+                    file_rel = os.path.relpath(os.path.join(dirpath, filename), root_dir)
+                    emit(file_rel, _read(root_dir, file_rel))
+        else:
+            emit(rel_path, _read(root_dir, rel_path), compress=not rel_path.endswith(".gz"))
+
+    # Remove hashed assets from earlier builds
+    assets_dir = os.path.join(site_dir, ASSETS_SUBDIR)
+    current = {os.path.basename(out) for out in assets.values()}
+    for name in os.listdir(assets_dir):
+        base = name[:-3] if name.endswith((".gz", ".br")) else name
+        if base not in current:
+            os.remove(os.path.join(assets_dir, name))
+
+    # Remove pass-through files (deleted shards, shrunken sitemaps) this run did not emit
+    _prune_passthrough(site_dir, emitted)
+
+    manifest = {"inputs": inputs, "assets": assets}
+    _write_if_changed(os.path.join(site_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return stats
+
+if __name__ == "__main__":
+    stats = build_assets()
+    print(f"Site assets built → {SITE_DIR} ({stats['written']} written, {stats['skipped']} unchanged)")
@@ -0,0 +1,376 @@
+import os
+import re
+import sys
+import json
+import argparse
+import tempfile
+from collections import deque
+from datetime import datetime, timezone
+
+# Sibling scripts are importable both when run directly and as scripts.campaigns
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from metrics import configure_metrics, get_metrics
+from newsletter import (DEFAULT_CHUNK_SIZE, DEFAULT_DELIVERY_MODE, DELIVERY_MODES, StartupPipeline, campaign_id_for,
+                        get_token_provider, message_size, open_journal, open_scheduler, prepare_batches,
+                        prepare_template, read_recipients_file, write_run_metrics)
+from recipient_filter import normalize_address
+
+SEGMENT_KEYS = ('domains', 'exclude_domains', 'match', 'include', 'exclude')
+DEFAULT_CAMPAIGN_BUFFER = 20000 # Recipients kept in memory between the slowest and fastest campaign
+
+# A campaign manifest is a JSON file like:
+#   {"campaigns": [
+#     {"id": "spring-announcement", "subject": "New in the Compendium", "template": "announcement.html",
+#      "context": {"headline": "..."}, "segment": {"exclude": "unsubscribed-from-announcements.txt"}},
+#     {"id": "weekly-digest", "subject": "This week", "content_html": "<html>...</html>",
+#      "segment": {"domains": ["example.com"]}, "delivery_mode": "individual"}
+#   ]}
+# Paths are relative to the manifest. Each campaign needs a subject and a template or
+# content_html; id (default: a hash of the campaign and its template) names its journal.
+
+class Segment:
+    # Recipient filter from a campaign's "segment" object. Any of: "domains" and
+    # "exclude_domains" (lists of domains), "match" (a regular expression searched in the
+    # address), "include" and "exclude" (address files, text or CSV, read like
+    # NEWSLETTER_RECIPIENTS_FILE). An address must pass every rule given; an empty
+    # segment matches every recipient.
+    def __init__(self, spec=None, base_dir='.'):
+        spec = spec or {}
+        unknown = set(spec) - set(SEGMENT_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown segment rule(s) {', '.join(sorted(unknown))}. Expected: {', '.join(SEGMENT_KEYS)}")
+        for key in ('domains', 'exclude_domains'):
+            if key in spec and not (isinstance(spec[key], list) and all(isinstance(d, str) for d in spec[key])):
+                raise ValueError(f"Segment rule '{key}' must be a list of domains, not {json.dumps(spec[key])}.")
+        self.domains = {domain.lower() for domain in spec.get('domains', [])} or None
+        self.exclude_domains = {domain.lower() for domain in spec.get('exclude_domains', [])}
+        try:
+            self.pattern = re.compile(spec['match']) if spec.get('match') else None
+        except (re.error, TypeError) as e:
+            raise ValueError(f"Segment rule 'match' is not a valid regular expression: {e}")
+        self.include = self._load(spec.get('include'), base_dir)
+        self.exclude = self._load(spec.get('exclude'), base_dir) or set()
+
+    @staticmethod
+    def _load(path, base_dir):
+        if not path:
+            return None
+        addresses = {normalize_address(address) for address in read_recipients_file(os.path.join(base_dir, path))}
+        addresses.discard(None)
+        return addresses
+
+    def __call__(self, address):
+        # address is normalized (see load_recipients), so its domain is already lower-case
+        domain = address.rpartition('@')[2]
+        if self.domains is not None and domain not in self.domains:
+            return False
+        if domain in self.exclude_domains or address in self.exclude:
+            return False
+        if self.include is not None and address not in self.include:
+            return False
+        return self.pattern is None or self.pattern.search(address) is not None
+
+class Campaign:
+    # One manifest entry: its content, delivery settings and segment, plus per-run
+    # delivery counts kept as its batches' results come in.
+    def __init__(self, spec, base_dir='.', position=0):
+        self.spec = spec
+        self.subject = spec.get('subject')
+        if not self.subject:
+            raise ValueError(f"Campaign {position + 1} in the manifest has no subject.")
+        self.name = spec.get('id') or f"campaign {position + 1}"
+        if spec.get('id') and not re.fullmatch(r'[\w.-]+', spec['id']):
+            raise ValueError(f"Campaign id '{spec['id']}' may only contain letters, digits, '.', '_' and '-'.")
+        self.template_path = os.path.join(base_dir, spec['template']) if spec.get('template') else None
+        self.content_html = spec.get('content_html')
+        if not self.template_path and not self.content_html:
+            raise ValueError(f"Campaign '{self.name}' needs a template or content_html.")
+        if self.template_path and not os.path.exists(self.template_path):
+            raise ValueError(f"Template {self.template_path} for campaign '{self.name}' does not exist.")
+        self.delivery_mode = spec.get('delivery_mode') or os.environ.get('NEWSLETTER_DELIVERY_MODE', DEFAULT_DELIVERY_MODE)
+        if self.delivery_mode not in DELIVERY_MODES or self.delivery_mode == 'single':
+            raise ValueError(f"Campaign '{self.name}' has delivery mode '{self.delivery_mode}'; "
+                             f"campaign runs send in 'bcc' or 'individual' mode.")
+        self.chunk_size = int(spec.get('chunk_size') or os.environ.get('NEWSLETTER_CHUNK_SIZE') or DEFAULT_CHUNK_SIZE)
+        try:
+            self.segment = Segment(spec.get('segment'), base_dir)
+        except ValueError as e:
+            raise ValueError(f"Campaign '{self.name}': {e}")
+        self.campaign_id = spec.get('id')
+        self.render_body = None
+        self.journal = None
+        self.scheduler = None
+        self.exhausted = False
+        self.stats = {'sent': 0, 'failed': 0, 'messages': 0}
+        self.first_error = None
+
+    def prepare(self):
+        # Render (or compile) the content. Runs on the startup pipeline.
+        source = self.content_html
+        if self.template_path:
+            self.content_html, self.render_body = prepare_template(self.template_path, self.spec.get('context'))
+            with open(self.template_path, 'r', encoding='utf-8') as f:
+                source = f.read()
+        if self.render_body and self.delivery_mode != 'individual':
+            print(f"Campaign '{self.name}' has per-recipient placeholders; switching from '{self.delivery_mode}' "
+                  f"to 'individual' delivery.")
+            self.delivery_mode = 'individual'
+        if not self.campaign_id:
+            # Stable across runs (unlike the rendered content, which carries a timestamp)
+            self.campaign_id = campaign_id_for(self.subject, source + json.dumps(self.spec, sort_keys=True))
+
+    def _segment(self, recipients):
+        # The campaign's recipients; exhausted is set once every one was handed on, so a
+        # stream cut short by the daily quota leaves the campaign deferred.
+        segment = self.segment
+        for address in recipients:
+            if segment(address):
+                yield address
+        self.exhausted = True
+
+    def batches(self, recipients, from_address, scheduler=None):
+        # (payload, groups, handler) triples for SendEngine.run_batches.
+        self.scheduler = scheduler
+        batches = prepare_batches(from_address, self.subject, self.content_html, self._segment(recipients),
+                                  self.delivery_mode, self.chunk_size, self.render_body, self.journal, scheduler)
+        for payload, groups in batches:
+            yield payload, groups, self.record
+
+    def record(self, results):
+        if self.journal is not None:
+            self.journal.record(results)
+        if self.scheduler is not None:
+            self.scheduler.refund(results)
+        for result in results:
+            if result['error']:
+                self.stats['failed'] += len(result['recipients'])
+                self.first_error = self.first_error or f"{result['status']} {result['error']}"
+            else:
+                self.stats['sent'] += len(result['recipients'])
+                self.stats['messages'] += 1
+
+    def summary(self, deferred=False):
+        line = f"Campaign '{self.name}': {self.stats['sent']} recipient(s) in {self.stats['messages']} message(s)"
+        if self.journal is not None and self.journal.skipped:
+            line += f", {self.journal.skipped} already delivered earlier"
+        if self.stats['failed']:
+            line += f", {self.stats['failed']} failed (first error: {self.first_error})"
+        if deferred:
+            line += ", the rest deferred to the next quota window"
+        return line + "."
+
+def load_campaigns(manifest_path):
+    # Parse a campaign manifest (see above) into Campaigns.
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    specs = data.get('campaigns') if isinstance(data, dict) else data
+    if not specs:
+        raise ValueError(f"No campaigns in {manifest_path}.")
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    campaigns = [Campaign(spec, base_dir, position) for position, spec in enumerate(specs)]
+    names = [campaign.name for campaign in campaigns]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate campaign id(s) in {manifest_path}: {', '.join(duplicates)}")
+    return campaigns
+
+class RecipientCache:
+    # Replays one recipient stream to several readers, pulling each address from the
+    # source only once: the reader furthest ahead fetches, the others read what it kept.
+    # Addresses every reader has passed are dropped. At most max_buffered addresses stay
+    # in memory: when the readers drift further apart (a narrow segment scanning far
+    # ahead for its next batch while a broad one is still sending), the oldest ones spill
+    # to an unnamed temporary file and the trailing readers read them back from there.
+    # Readers must all run on one thread (the interleaved batch stream does).
+    def __init__(self, source, max_buffered=None):
+        if not max_buffered:
+            max_buffered = int(os.environ.get('NEWSLETTER_CAMPAIGN_BUFFER') or DEFAULT_CAMPAIGN_BUFFER)
+        self.max_buffered = max_buffered
+        self._source = iter(source)
+        self._buffer = deque()
+        self._base = 0 # Stream position of _buffer[0]; earlier positions still needed are spilled
+        self._positions = {} # Reader -> stream position of its next address
+        self._spill = None
+        self._spill_offsets = {} # Reader -> file offset of its next spilled address
+        self.loaded = 0
+        self.spilled = 0
+        self.complete = False
+
+    def readers(self, count):
+        # count independent iterators over the whole stream. They are registered now, before
+        # any of them is read, so none can miss an address another one has dropped.
+        readers = []
+        for _ in range(count):
+            reader = object()
+            self._positions[reader] = self._base
+            readers.append(self._read(reader))
+        return readers
+
+    def _read(self, reader):
+        positions = self._positions
+        buffer = self._buffer
+        try:
+            while True:
+                position = positions[reader]
+                offset = position - self._base
+                if offset < 0:
+                    address = self._read_spilled(reader)
+                elif offset < len(buffer):
+                    address = buffer[offset]
+                elif self.complete:
+                    return
+                else:
+                    try:
+                        address = next(self._source)
+                    except StopIteration:
+                        self.complete = True
+                        return
+                    buffer.append(address)
+                    self.loaded += 1
+                positions[reader] = position + 1
+                if offset <= 0:
+                    self._trim()
+                if len(buffer) > self.max_buffered:
+                    self._spill_oldest()
+                yield address
+        finally:
+            del positions[reader]
+            self._spill_offsets.pop(reader, None)
+            self._trim()
+
+    def _read_spilled(self, reader):
+        spill = self._spill
+        spill.seek(self._spill_offsets[reader])
+        address = spill.readline()[:-1].decode('utf-8')
+        self._spill_offsets[reader] = spill.tell()
+        return address
+
+    def _spill_oldest(self):
+        # Move _buffer[0] to the end of the spill file; readers about to read it follow it there.
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+        spill = self._spill
+        spill.seek(0, os.SEEK_END)
+        offset = spill.tell()
+        spill.write(self._buffer.popleft().encode('utf-8') + b'\n')
+        for reader, position in self._positions.items():
+            if position == self._base:
+                self._spill_offsets[reader] = offset
+        self._base += 1
+        self.spilled += 1
+
+    def _trim(self):
+        low = min(self._positions.values(), default=self._base + len(self._buffer))
+        if self._spill is not None and low >= self._base:
+            # Every reader is back in memory, so nothing spilled is needed any more
+            self._spill.close()
+            self._spill = None
+            self._spill_offsets.clear()
+        buffer = self._buffer
+        while self._base < low:
+            buffer.popleft()
+            self._base += 1
+
+def interleave(streams):
+    # Round-robin over iterables, one item from each in turn, until all are exhausted.
+    active = deque(iter(stream) for stream in streams)
+    while active:
+        stream = active.popleft()
+        try:
+            item = next(stream)
+        except StopIteration:
+            continue
+        yield item
+        active.append(stream)
+
+def run_campaigns(campaigns, from_address, token_provider=None, recipient_source=None, engine_factory=None,
+                  journal_dir=None, scheduler=None):
+    # Send several campaigns in one run: one token provider, one send engine (and so one
+    # connection pool) and one recipient load, filtered per campaign. Batches are taken
+    # from the campaigns in turn, so a large campaign does not hold up a small one. With a
+    # journal_dir (default NEWSLETTER_JOURNAL_DIR) each campaign resumes its own journal;
+    # a QuotaScheduler (opened in NEWSLETTER_QUOTA_DIR when set) is shared by all of them,
+    # and once it defers one campaign every campaign still sending is deferred with it.
+    # Returns {campaign name: stats}; raises when any recipient failed.
+    journal_dir = journal_dir or os.environ.get('NEWSLETTER_JOURNAL_DIR')
+    if scheduler is None and os.environ.get('NEWSLETTER_QUOTA_DIR'):
+        scheduler = open_scheduler(os.environ['NEWSLETTER_QUOTA_DIR'])
+    if scheduler is not None and not journal_dir:
+        print("# WARNING: a quota is set without NEWSLETTER_JOURNAL_DIR; "
+              "deferred recipients cannot be resumed without delivery journals.")
+    token_provider = token_provider or get_token_provider()
+
+    def prepare_content():
+        for campaign in campaigns:
+            campaign.prepare()
+
+    print(f"Running {len(campaigns)} campaign(s): {', '.join(campaign.name for campaign in campaigns)}")
+    with StartupPipeline(token_provider, prepare_content=prepare_content, recipient_source=recipient_source,
+                         engine_factory=engine_factory) as pipeline:
+        engine = pipeline.engine()
+        pipeline.token()
+        pipeline.content()
+        recipients = RecipientCache(pipeline.recipients)
+        readers = recipients.readers(len(campaigns))
+        try:
+            if journal_dir:
+                for campaign in campaigns:
+                    campaign.journal = open_journal(journal_dir, campaign.campaign_id)
+            if scheduler is not None:
+                print(scheduler.plan())
+            with get_metrics().span('send'):
+                engine.run_batches(interleave(campaign.batches(reader, from_address, scheduler)
+                                              for campaign, reader in zip(campaigns, readers)))
+        finally:
+            pipeline.report()
+            for campaign in campaigns:
+                if campaign.journal is not None:
+                    campaign.journal.close()
+            if scheduler is not None:
+                scheduler.save()
+        engine.report()
+
+    spilled = f" ({recipients.spilled} spilled to disk while campaigns drifted apart)" if recipients.spilled else ""
+    print(f"Loaded {recipients.loaded} recipient(s) once for {len(campaigns)} campaign(s){spilled}.")
+    deferred = [campaign for campaign in campaigns if not campaign.exhausted]
+    for campaign in campaigns:
+        print(campaign.summary(deferred=campaign in deferred))
+    if deferred:
+        window = ""
+        if scheduler is not None:
+            # The window opens once the smallest pending message fits the allowance again
+            smallest = min(message_size(campaign.delivery_mode, campaign.chunk_size) for campaign in deferred)
+            window = datetime.fromtimestamp(scheduler.next_window_at(smallest), timezone.utc).strftime(' (from %Y-%m-%d %H:%M UTC)')
+        print(f"Daily recipient allowance reached; rerun the manifest after the next window opens{window} to continue "
+              f"{len(deferred)} campaign(s).")
+    failed = [campaign for campaign in campaigns if campaign.stats['failed']]
+    if failed:
+        error_msg = (f"Failed to send to {sum(campaign.stats['failed'] for campaign in failed)} recipient(s) in "
+                     f"{len(failed)} campaign(s): {', '.join(campaign.name for campaign in failed)}")
+        print(f"ERROR: {error_msg}")
+        raise Exception(error_msg)
+    return {campaign.name: dict(campaign.stats, deferred=campaign in deferred) for campaign in campaigns}
+
+def main():
+    parser = argparse.ArgumentParser(description="Send every campaign in a manifest in one run, sharing the Graph token, "
+                                                 "connection pool and recipient load.")
+    parser.add_argument("manifest", help="JSON campaign manifest")
+    parser.add_argument("--source", help="recipient source (default: NEWSLETTER_RECIPIENT_SOURCE or the implied one)")
+    args = parser.parse_args()
+
+    metrics = configure_metrics()
+    try:
+        from_address = os.environ.get('ONEDRIVE_EMAIL') # Sender email
+        if not from_address:
+            print("ONEDRIVE_EMAIL environment variable (for sender email) is not set.")
+            exit(1)
+        campaigns = load_campaigns(args.manifest)
+        run_campaigns(campaigns, from_address, recipient_source=args.source)
+    except Exception as e:
+        print(f"Error: {e}")
+        exit(1)
+    finally:
+        write_run_metrics(metrics)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import io
+import os
+import re
+import json
+import hashlib
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+# Dynamically determine the project root (one directory up from this script)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+MANUSCRIPT_PATH = os.path.join(ROOT_DIR, "src", "Fantasy.txt")
+ENTRIES_DIR = os.path.join(ROOT_DIR, "entries")
+ENTRY_MARKER = "●"
+MARKER_BYTES = ENTRY_MARKER.encode('utf-8')
+# A marker at the start of a line after an empty line: the manuscript can be split here and
+# both halves parsed separately with the same result as parsing it whole
+ENTRY_BOUNDARY_RE = re.compile(rb"\n\n(?=" + re.escape(MARKER_BYTES) + rb")")
+
+def preprocess_text(text):
+    # Collapse single newlines into spaces (same rule as preprocessText in scripts/script.js)
+    return re.sub(r'([^\n])\n([^\n])', r'\1 \2', text)
+
+def split_entries(text):
+    # Split on the entry marker, keeping it at the start of each entry (same rule as splitEntries in scripts/script.js)
+    return [entry.strip() for entry in re.split(f'(?={ENTRY_MARKER})', text) if entry.strip()]
+
+def iter_preprocessed(lines):
+    # Streaming equivalent of preprocess_text over an iterable of lines (as read from a file).
+    # A newline becomes a space when the lines on both sides are non-empty, unless the line
+    # before is a single character already consumed by the previous replacement -- exactly
+    # what the global regex does, since its matches cannot overlap.
+    prev = None
+    prev_replaced = False
+    ends_with_newline = False
+    for raw in lines:
+        ends_with_newline = raw.endswith('\n')
+        line = raw[:-1] if ends_with_newline else raw
+        if prev is not None:
+            replace = bool(prev) and bool(line) and not (len(prev) == 1 and prev_replaced)
+            yield ' ' if replace else '\n'
+            prev_replaced = replace
+        yield line
+        prev = line
+    if ends_with_newline:
+        yield '\n'
+
+def iter_split_entries(chunks):
+    # Streaming equivalent of split_entries over chunks of preprocessed text.
+    buffer = []
+    for chunk in chunks:
+        if ENTRY_MARKER not in chunk:
+            buffer.append(chunk)
+            continue
+        parts = chunk.split(ENTRY_MARKER)
+        buffer.append(parts[0])
+        for part in parts[1:]:
+            entry = ''.join(buffer).strip()
+            if entry:
+                yield entry
+            buffer = [ENTRY_MARKER, part]
+    entry = ''.join(buffer).strip()
+    if entry:
+        yield entry
+
+def iter_entries(path=MANUSCRIPT_PATH):
+    # Yield the manuscript's preprocessed entries in order, reading it line by line.
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        yield from iter_split_entries(iter_preprocessed(f))
+
+def parse_entries_bytes(data):
+    # Entries of raw (UTF-8) manuscript bytes, parsed exactly as iter_entries reads the file.
+    return list(iter_split_entries(iter_preprocessed(io.StringIO(data.decode('utf-8'), newline=''))))
+
+def _first_difference(old, new, block=1 << 16):
+    # Offset of the first differing byte (the shorter length when one is a prefix of the other).
+    limit = min(len(old), len(new))
+    pos = 0
+    while pos < limit:
+        end = min(pos + block, limit)
+        if old[pos:end] != new[pos:end]:
+            while old[pos] == new[pos]:
+                pos += 1
+            return pos
+        pos = end
+    return limit
+
+class ManuscriptCache:
+    # The manuscript's entries kept in memory between reads. refresh() re-parses only from the
+    # last entry boundary before the first changed byte -- for an appended entry, just the
+    # tail after the last known entry -- and reuses the entries before it.
+    def __init__(self, path=MANUSCRIPT_PATH):
+        self.path = path
+        self.data = b""
+        self.entries = []
+        self.boundaries = [0] # Byte offsets where parsing may restart, ascending
+
+    def refresh(self):
+        # Re-read the file. Returns (first_changed, reparsed): the index of the first entry
+        # that differs from the previous read (len(entries) when none does) and how many
+        # entries were parsed again.
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if data == self.data and self.entries:
+            return len(self.entries), 0
+        changed_at = _first_difference(self.data, data)
+        # The boundary's marker itself must be unchanged, or the entry before it runs on
+        position = max(0, bisect_right(self.boundaries, changed_at - len(MARKER_BYTES)) - 1)
+        start = self.boundaries[position]
+        kept = self._entries_before(data, start)
+        tail = parse_entries_bytes(data[start:])
+
+        first_changed = kept
+        for old_entry, new_entry in zip(self.entries[kept:], tail):
+            if old_entry != new_entry:
+                break
+            first_changed += 1
+
+        self.boundaries = self.boundaries[:position + 1] + [match.end() for match in ENTRY_BOUNDARY_RE.finditer(data, start)
+                                                             if match.end() > start]
+        self.entries = self.entries[:kept] + tail
+        self.data = data
+        return first_changed, len(tail)
+
+    def _entries_before(self, data, offset):
+        # Every marker starts an entry; text before the first one is an entry when not blank.
+        if offset == 0:
+            return 0
+        first_marker = data.find(MARKER_BYTES)
+        preamble = bool(data[:first_marker].decode('utf-8').strip())
+        return data.count(MARKER_BYTES, 0, offset) + preamble
+
+def load_entries(path=MANUSCRIPT_PATH):
+    # Read the manuscript and return its preprocessed entries in order.
+    return list(iter_entries(path))
+
+def entry_hash(entry):
+    return hashlib.sha256(entry.encode('utf-8')).hexdigest()
+
+def entry_title(entry):
+    # First non-empty line after the marker, e.g. the quoted document heading.
+    for line in entry.lstrip(ENTRY_MARKER).splitlines():
+        if line.strip():
+            return line.strip()
+    return ""
+
+def load_announced_manifest(manifest_path):
+    # Return {entry_hash: {...}} for entries already announced, or None if no manifest exists yet.
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('entries', {})
+
+def save_announced_manifest(manifest_path, announced):
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'entries': announced}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def find_unannounced_entries(entries, announced):
+    # Return [(index, entry, status)] for entries whose content hash has not been announced.
+    # status is 'new' for entries past the last announced index, otherwise 'updated'.
+    last_index = max((info.get('index', -1) for info in announced.values()), default=-1)
+    changes = []
+    for index, entry in enumerate(entries):
+        if entry_hash(entry) not in announced:
+            changes.append((index, entry, 'new' if index > last_index else 'updated'))
+    return changes
+
+def mark_announced(announced, changes):
+    # Record announced entries in the manifest mapping (in place) and return it.
+    announced_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    for index, entry, _ in changes:
+        announced[entry_hash(entry)] = {'index': index, 'title': entry_title(entry), 'announced_at': announced_at}
+    return announced
+
+def entry_html(entry):
+    # Render an entry the way renderEntry in scripts/script.js does.
+    return entry.replace('\n', '<br>')
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def build_entry_shards(manuscript_path=MANUSCRIPT_PATH, output_dir=ENTRIES_DIR):
+    # Stream the manuscript once and write its entry shards (see write_entry_shards).
+    return write_entry_shards(iter_entries(manuscript_path), output_dir)
+
+def write_entry_shards(entries, output_dir=ENTRIES_DIR):
+    # Write entries/<index>.json per entry, entries/all.json for the full view and
+    # entries/manifest.json (index, title, byte size, hash, path) for an iterable of entries.
+    # Shards whose content hash matches the previous manifest are left untouched.
+    # Returns {'entries', 'written', 'removed'} counts.
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = {item['index']: item['hash'] for item in json.load(f).get('entries', [])}
+
+    items = []
+    written = 0
+    for index, entry in enumerate(entries):
+        digest = entry_hash(entry)
+        shard_name = f"{index}.json"
+        shard_path = os.path.join(output_dir, shard_name)
+        html = entry_html(entry)
+        if previous.get(index) != digest or not os.path.exists(shard_path):
+            _write_json(shard_path, {'index': index, 'title': entry_title(entry), 'hash': digest, 'html': html})
+            written += 1
+        items.append({'index': index, 'title': entry_title(entry), 'bytes': len(html.encode('utf-8')),
+                      'hash': digest, 'path': shard_name})
+
+    # Drop shards for entries that no longer exist
+    removed = 0
+    for index in previous:
+        if index >= len(items):
+            stale_path = os.path.join(output_dir, f"{index}.json")
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+                removed += 1
+
+    # The combined view is rebuilt from the shards only when something changed
+    all_path = os.path.join(output_dir, 'all.json')
+    if written or removed or not os.path.exists(all_path):
+        parts = []
+        for item in items:
+            with open(os.path.join(output_dir, item['path']), 'r', encoding='utf-8') as f:
+                parts.append(json.load(f)['html'])
+        _write_json(all_path, {'html': '<br><br>'.join(parts)})
+
+    # Hash of the entry list so clients can cache-bust the combined view
+    version = hashlib.sha256(''.join(item['hash'] for item in items).encode('ascii')).hexdigest()[:16]
+    _write_json(manifest_path, {'version': version, 'count': len(items), 'entries': items})
+    return {'entries': len(items), 'written': written, 'removed': removed}
+
+if __name__ == "__main__":
+    stats = build_entry_shards()
+    print(f"Entry shards built: {stats['entries']} entries, {stats['written']} shard(s) written, "
+          f"{stats['removed']} removed → {ENTRIES_DIR}")
@@ -1,29 +1,75 @@
 import os
-from datetime import datetime
+import gzip
+import json
+import subprocess
+from datetime import datetime, timezone
 
 # Dynamically determine the project root (one directory up from this script)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(SCRIPT_DIR)
 BASE_URL = "https://wllclngn.github.io/SomeKindofFiction"
 OUTPUT_FILE = os.path.join(ROOT_DIR, "sitemap.xml")
-EXCLUDED_DIRS = {"tests", "test"}
+CACHE_FILE = os.environ.get("SITEMAP_CACHE_FILE", os.path.join(ROOT_DIR, ".sitemap-cache.json"))
+EXCLUDED_DIRS = {"tests", "test", "_site"} # _site: the deployable copy written by build_assets.py
+MAX_URLS_PER_SITEMAP = 50000 # Sitemap protocol limit per file
+SHARD_PREFIX = "sitemap-"
 
 def find_html_files(root_dir):
     html_files = []
     for dirpath, dirnames, filenames in os.walk(root_dir):
         # Exclude unwanted directories in-place (modifies os.walk traversal)
         dirnames[:] = [d for d in dirnames if d not in EXCLUDED_DIRS and not d.startswith('.')]
-        rel_dir = os.path.relpath(dirpath, root_dir)
         for filename in filenames:
             if filename.endswith(".html"):
                 rel_file = os.path.relpath(os.path.join(dirpath, filename), root_dir)
                 html_files.append(rel_file.replace("\\", "/"))
     return html_files
 
-def get_lastmod(filepath):
+def _git(root_dir, *args):
+    result = subprocess.run(["git", "-c", "core.quotePath=false", *args], cwd=root_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+def git_head(root_dir=ROOT_DIR):
+    output = _git(root_dir, "rev-parse", "HEAD")
+    return output.strip() if output else None
+
+def git_lastmod_index(root_dir=ROOT_DIR, files=None, since=None):
+    # Map each path to the date of the last commit touching it, from a single
+    # `git log --name-only` pass (newest first, so the first date seen per path wins).
+    # With files, the log is abandoned as soon as all of them have a date.
+    # With since, only commits after that revision are read.
+    args = ["git", "-c", "core.quotePath=false", "log", "--format=%x00%cs", "--name-only", "--no-renames"]
+    if since:
+        args.append(f"{since}..HEAD")
+    wanted = set(files) if files is not None else None
+    lastmods = {}
     try:
-        mtime = os.path.getmtime(os.path.join(ROOT_DIR, filepath))
-        return datetime.utcfromtimestamp(mtime).strftime("%Y-%m-%d")
+        proc = subprocess.Popen(args, cwd=root_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    current_date = None
+    for line in proc.stdout:
+        line = line.rstrip("\n")
+        if line.startswith("\0"):
+            current_date = line[1:]
+        elif line and line not in lastmods and (wanted is None or line in wanted):
+            lastmods[line] = current_date
+            if wanted is not None and len(lastmods) == len(wanted):
+                break
+    proc.stdout.close()
+    proc.kill()
+    proc.wait()
+    if proc.returncode not in (0, -9) and not lastmods:
+        return None
+    return lastmods
+
+def get_lastmod(filepath, root_dir=ROOT_DIR):
+    # Filesystem fallback for files git knows nothing about (e.g. uncommitted or generated).
+    try:
+        mtime = os.path.getmtime(os.path.join(root_dir, filepath))
+        return datetime.fromtimestamp(mtime, timezone.utc).strftime("%Y-%m-%d")
     except Exception:
         return None
 
@@ -33,15 +79,67 @@ def url_for_file(filepath):
         return f"{BASE_URL}/"
     return f"{BASE_URL}/{filepath.lstrip('/')}"
 
-def generate_sitemap(files):
+def url_entry_for(filepath, lastmod):
+    url = url_for_file(filepath)
+    url_entry = f"  <url>\n    <loc>{url}</loc>"
+    if lastmod:
+        url_entry += f"\n    <lastmod>{lastmod}</lastmod>"
+    url_entry += "\n    <changefreq>Occasionally</changefreq>\n    <priority>0.8</priority>\n  </url>"
+    return url_entry
+
+def load_cache(cache_file=CACHE_FILE):
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache, cache_file=CACHE_FILE):
+    if not cache_file:
+        return
+    tmp_path = f"{cache_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_file)
+
+def resolve_lastmods(files, root_dir=ROOT_DIR, cache=None):
+    # Return {path: lastmod} for files using git history, reusing the cached index when
+    # HEAD has not moved and reading only the new commits when it has. Files git does not
+    # track fall back to their mtime. Updates cache in place.
+    cache = cache if cache is not None else {}
+    head = git_head(root_dir)
+    cached = cache.get("lastmod", {})
+    if head is None:
+        lastmods = {}
+    elif cache.get("head") == head:
+        lastmods = dict(cached)
+    elif cache.get("head") and _git(root_dir, "merge-base", "--is-ancestor", cache["head"], head) is not None:
+        lastmods = dict(cached)
+        lastmods.update(git_lastmod_index(root_dir, since=cache["head"]) or {})
+    else:
+        lastmods = git_lastmod_index(root_dir, files=files) or {}
+
+    cache["head"] = head
+    cache["lastmod"] = lastmods
+    return {f: lastmods.get(f) or get_lastmod(f, root_dir) for f in files}
+
+def generate_sitemap(files, lastmods=None, cache=None):
+    # Build one <urlset> document. Per-URL entries are reused from cache["urls"] when
+    # the file's lastmod is unchanged.
+    if lastmods is None:
+        lastmods = {file: get_lastmod(file) for file in files}
+    url_cache = cache.setdefault("urls", {}) if cache is not None else {}
     urls = []
     for file in files:
-        lastmod = get_lastmod(file)
-        url = url_for_file(file)
-        url_entry = f"  <url>\n    <loc>{url}</loc>"
-        if lastmod:
-            url_entry += f"\n    <lastmod>{lastmod}</lastmod>"
-        url_entry += "\n    <changefreq>Occasionally</changefreq>\n    <priority>0.8</priority>\n  </url>"
+        lastmod = lastmods.get(file)
+        cached = url_cache.get(file)
+        if cached and cached[0] == lastmod:
+            urls.append(cached[1])
+            continue
+        url_entry = url_entry_for(file, lastmod)
+        url_cache[file] = [lastmod, url_entry]
         urls.append(url_entry)
     sitemap = '<?xml version="1.0" encoding="UTF-8"?>\n'
     sitemap += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
@@ -49,10 +147,68 @@ def generate_sitemap(files):
     sitemap += '\n</urlset>\n'
     return sitemap
 
+def generate_sitemap_index(shard_names, lastmod=None):
+    entries = []
+    for name in shard_names:
+        entry = f"  <sitemap>\n    <loc>{BASE_URL}/{name}</loc>"
+        if lastmod:
+            entry += f"\n    <lastmod>{lastmod}</lastmod>"
+        entry += "\n  </sitemap>"
+        entries.append(entry)
+    index = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    index += '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    index += "\n".join(entries)
+    index += '\n</sitemapindex>\n'
+    return index
+
+def _write_if_changed(path, data):
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+def write_sitemaps(files, output_file=OUTPUT_FILE, root_dir=ROOT_DIR, cache_file=CACHE_FILE,
+                   max_urls=MAX_URLS_PER_SITEMAP):
+    # Write sitemap.xml, switching to a sitemap index plus gzipped shards once the URL count
+    # passes max_urls. Unchanged outputs are not rewritten. Returns the paths written.
+    cache = load_cache(cache_file)
+    files = sorted(files)
+    lastmods = resolve_lastmods(files, root_dir, cache)
+    output_dir = os.path.dirname(output_file)
+    written = []
+    shard_names = []
+
+    if len(files) <= max_urls:
+        if _write_if_changed(output_file, generate_sitemap(files, lastmods, cache).encode("utf-8")):
+            written.append(output_file)
+    else:
+        for start in range(0, len(files), max_urls):
+            shard_files = files[start:start + max_urls]
+            name = f"{SHARD_PREFIX}{start // max_urls + 1}.xml.gz"
+            shard_names.append(name)
+            xml = generate_sitemap(shard_files, lastmods, cache).encode("utf-8")
+            # mtime=0 keeps the gzip bytes stable so unchanged shards are not rewritten
+            if _write_if_changed(os.path.join(output_dir, name), gzip.compress(xml, mtime=0)):
+                written.append(os.path.join(output_dir, name))
+        newest = max((lastmods[f] for f in files if lastmods.get(f)), default=None)
+        if _write_if_changed(output_file, generate_sitemap_index(shard_names, newest).encode("utf-8")):
+            written.append(output_file)
+
+    # Remove shards left over from a larger previous run
+    for name in os.listdir(output_dir):
+        if name.startswith(SHARD_PREFIX) and name.endswith(".xml.gz") and name not in shard_names:
+            os.remove(os.path.join(output_dir, name))
+
+    # Only keep per-URL entries for files that still exist
+    cache["urls"] = {f: entry for f, entry in cache.get("urls", {}).items() if f in lastmods}
+    save_cache(cache, cache_file)
+    return written
+
 if __name__ == "__main__":
     html_files = find_html_files(ROOT_DIR)
-    print("HTML files found:", html_files)  # Debugging aid
-    sitemap_content = generate_sitemap(html_files)
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        f.write(sitemap_content)
-    print(f"Sitemap generated with {len(html_files)} URLs → {OUTPUT_FILE}")
\ No newline at end of file
+    print("HTML files found:", html_files[:20], "..." if len(html_files) > 20 else "")  # Debugging aid
+    written = write_sitemaps(html_files)
+    print(f"Sitemap generated with {len(html_files)} URLs → {OUTPUT_FILE} ({len(written)} file(s) updated)")
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds (milliseconds) of the HTTP latency histogram buckets; slower calls land in "+Inf"
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Metrics:
+    # Collects phase spans, per-endpoint HTTP latency histograms with status codes and
+    # plain counters for one run. Spans and calls with the same name are aggregated, so
+    # per-batch phases (serialization, Firestore pages) cost one dict update each.
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.spans = {}
+        self.http = {}
+        self.counters = {}
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, time.perf_counter() - started)
+
+    def record_span(self, name, seconds):
+        with self._lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+            span['count'] += 1
+            span['seconds'] += seconds
+            span['max_seconds'] = max(span['max_seconds'], seconds)
+
+    def observe_http(self, endpoint, status, seconds, bytes_sent=0):
+        # Record one HTTP call; status is the response code or an exception name.
+        elapsed_ms = seconds * 1000
+        bucket = next((str(bound) for bound in LATENCY_BUCKETS_MS if elapsed_ms <= bound), '+Inf')
+        with self._lock:
+            entry = self.http.get(endpoint)
+            if entry is None:
+                entry = self.http[endpoint] = {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'statuses': {},
+                                               'buckets_ms': {}}
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+            entry['buckets_ms'][bucket] = entry['buckets_ms'].get(bucket, 0) + 1
+            if bytes_sent:
+                self.counters['bytes_sent'] = self.counters.get('bytes_sent', 0) + bytes_sent
+
+    def count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self):
+        with self._lock:
+            spans = {name: dict(span, seconds=round(span['seconds'], 6), max_seconds=round(span['max_seconds'], 6))
+                     for name, span in self.spans.items()}
+            http = {}
+            for endpoint, entry in self.http.items():
+                buckets = {str(bound): entry['buckets_ms'].get(str(bound), 0) for bound in LATENCY_BUCKETS_MS}
+                buckets['+Inf'] = entry['buckets_ms'].get('+Inf', 0)
+                http[endpoint] = dict(entry, seconds=round(entry['seconds'], 6), max_seconds=round(entry['max_seconds'], 6),
+                                      statuses=dict(entry['statuses']), buckets_ms=buckets)
+            return {
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started_at)),
+                'elapsed_seconds': round(time.perf_counter() - self._started, 6),
+                'spans': spans,
+                'http': http,
+                'counters': dict(self.counters),
+            }
+
+    def write(self, json_path=None, step_summary_path=None):
+        # Write the JSON summary and/or append a Markdown report to a GitHub Actions step summary.
+        summary = self.summary()
+        if json_path:
+            directory = os.path.dirname(os.path.abspath(json_path))
+            os.makedirs(directory, exist_ok=True)
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+        if step_summary_path:
+            with open(step_summary_path, 'a', encoding='utf-8') as f:
+                f.write(format_markdown(summary))
+        return summary
+
+class NullMetrics:
+    # Stand-in used when instrumentation is off: every call is a no-op.
+    enabled = False
+    _null_span = nullcontext()
+
+    def span(self, name):
+        return self._null_span
+
+    def record_span(self, name, seconds):
+        pass
+
+    def observe_http(self, endpoint, status, seconds, bytes_sent=0):
+        pass
+
+    def count(self, **increments):
+        pass
+
+    def summary(self):
+        return None
+
+    def write(self, json_path=None, step_summary_path=None):
+        return None
+
+def format_markdown(summary):
+    # Render a summary as the Markdown tables shown on the workflow run page.
+    lines = [f"### Newsletter run metrics ({summary['elapsed_seconds']:.2f}s)", ""]
+    if summary['spans']:
+        lines += ["| Phase | Calls | Total (s) | Max (s) |", "| --- | ---: | ---: | ---: |"]
+        for name, span in summary['spans'].items():
+            lines.append(f"| {name} | {span['count']} | {span['seconds']:.3f} | {span['max_seconds']:.3f} |")
+        lines.append("")
+    if summary['http']:
+        lines += ["| Endpoint | Calls | Avg (ms) | Max (ms) | Statuses |", "| --- | ---: | ---: | ---: | --- |"]
+        for endpoint, entry in summary['http'].items():
+            average = entry['seconds'] / entry['count'] * 1000 if entry['count'] else 0.0
+            statuses = ", ".join(f"{status}: {count}" for status, count in sorted(entry['statuses'].items()))
+            lines.append(f"| {endpoint} | {entry['count']} | {average:.1f} | {entry['max_seconds'] * 1000:.1f} | {statuses} |")
+        lines.append("")
+    if summary['counters']:
+        lines += ["| Counter | Value |", "| --- | ---: |"]
+        lines += [f"| {name} | {value} |" for name, value in sorted(summary['counters'].items())]
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+_metrics = None
+
+def metrics_enabled_from_env():
+    return bool(os.environ.get('NEWSLETTER_METRICS_FILE')) or \
+        os.environ.get('NEWSLETTER_METRICS', '').lower() in ('1', 'true', 'yes')
+
+def configure_metrics(enabled=None):
+    # Start a fresh collector (enabled per NEWSLETTER_METRICS / NEWSLETTER_METRICS_FILE by default).
+    global _metrics
+    if enabled is None:
+        enabled = metrics_enabled_from_env()
+    _metrics = Metrics() if enabled else NullMetrics()
+    return _metrics
+
+def get_metrics():
+    return _metrics if _metrics is not None else configure_metrics()
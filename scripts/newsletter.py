@@ -1,60 +1,231 @@
 import os
+import re
+import sys
 import json
-import requests
-from google.cloud import firestore
+import time
+import string
+import hashlib
+import itertools
+import sqlite3
+import random
+import threading
+import subprocess
+from html import escape
+from collections import ChainMap, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import base64
+import gzip
+from json.encoder import encode_basestring_ascii
 
-def get_access_token():
-    # Get OAuth2 access token from Microsoft Graph API (for sending email).
-    client_id = os.environ.get('ONEDRIVE_CLIENT_ID')
-    client_secret = os.environ.get('ONEDRIVE_CLIENT_SECRET')
-    tenant_id = os.environ.get('ONEDRIVE_TENANT_ID')
-    
-    if not all([client_id, client_secret, tenant_id]):
-        raise ValueError("Missing required environment variables for MS Graph Auth: ONEDRIVE_CLIENT_ID, ONEDRIVE_CLIENT_SECRET, ONEDRIVE_TENANT_ID")
-    
-    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
-    token_data = {
-        'grant_type': 'client_credentials',
-        'client_id': client_id,
-        'client_secret': client_secret,
-        'scope': 'https://graph.microsoft.com/.default'
-    }
-    
-    token_r = requests.post(token_url, data=token_data)
-    token_r.raise_for_status()
-    access_token = token_r.json().get('access_token')
-    
-    if not access_token:
-        raise ValueError("Failed to get MS Graph access token")
-    
-    # Print access token claims for debugging (base64 decode JWT payload)
-    # This helps diagnose 401 errors by showing what the token is valid for
-    try:
-        parts = access_token.split('.')
-        if len(parts) > 1:
-            claims_json = base64.urlsafe_b64decode(parts[1] + '=' * (-len(parts[1]) % 4)).decode('utf-8')
-            claims = json.loads(claims_json)
+# Sibling scripts are importable both when run directly and as scripts.newsletter
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from entries import (MANUSCRIPT_PATH, entry_title, find_unannounced_entries, load_announced_manifest,
+                     load_entries, mark_announced, preprocess_text, save_announced_manifest, split_entries)
+from metrics import configure_metrics, get_metrics
+from recipient_filter import SUPPRESSION_INDEX_SUFFIX, SuppressionList, build_suppression_index, clean_recipients, is_suppression_index
+
+GRAPH_SCOPE = 'https://graph.microsoft.com/.default'
+# Endpoint overrides let local stand-ins (scripts/benchmark.py) take the place of Microsoft's services
+GRAPH_LOGIN_URL = os.environ.get('GRAPH_LOGIN_URL', 'https://login.microsoftonline.com')
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+def decode_token_claims(access_token):
+    # Decode the JWT payload of an access token without verifying it.
+    parts = access_token.split('.')
+    if len(parts) < 2:
+        raise ValueError("Access token is not a JWT")
+    claims_json = base64.urlsafe_b64decode(parts[1] + '=' * (-len(parts[1]) % 4)).decode('utf-8')
+    return json.loads(claims_json)
+
+class TokenProvider:
+    # Client-credentials token source for MS Graph.
+    # The token is kept in memory (and optionally in a JSON cache file keyed by
+    # tenant/client/scope) and is only re-fetched when it is within
+    # refresh_margin seconds of its 'exp' claim. Safe to share across threads.
+    def __init__(self, client_id=None, client_secret=None, tenant_id=None, scope=GRAPH_SCOPE,
+                 cache_path=None, refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS, debug_claims=None, session=None):
+        self.client_id = client_id or os.environ.get('ONEDRIVE_CLIENT_ID')
+        self.client_secret = client_secret or os.environ.get('ONEDRIVE_CLIENT_SECRET')
+        self.tenant_id = tenant_id or os.environ.get('ONEDRIVE_TENANT_ID')
+        if not all([self.client_id, self.client_secret, self.tenant_id]):
+            raise ValueError("Missing required environment variables for MS Graph Auth: ONEDRIVE_CLIENT_ID, ONEDRIVE_CLIENT_SECRET, ONEDRIVE_TENANT_ID")
+        self.scope = scope
+        self.cache_path = cache_path if cache_path is not None else os.environ.get('NEWSLETTER_TOKEN_CACHE')
+        self.refresh_margin = refresh_margin
+        if debug_claims is None:
+            debug_claims = os.environ.get('NEWSLETTER_DEBUG_TOKEN', '').lower() in ('1', 'true', 'yes')
+        self.debug_claims = debug_claims
+        self.session = session
+        self.fetch_count = 0
+        self._lock = threading.Lock()
+        self._access_token = None
+        self._expires_at = 0.0
+
+    @property
+    def cache_key(self):
+        return f"{self.tenant_id}:{self.client_id}:{self.scope}"
+
+    def _is_fresh(self, expires_at):
+        return time.time() < expires_at - self.refresh_margin
+
+    def get_token(self, force_refresh=False):
+        # Return a valid access token, fetching a new one only when needed.
+        with self._lock:
+            if not force_refresh and self._access_token and self._is_fresh(self._expires_at):
+                return self._access_token
+            if not force_refresh:
+                cached = self._read_cache()
+                if cached:
+                    self._access_token, self._expires_at = cached
+                    return self._access_token
+            self._access_token, self._expires_at = self._fetch()
+            self._write_cache()
+            return self._access_token
+
+    def invalidate(self):
+        # Drop the token after a 401 from Graph, on disk as well, so the next
+        # get_token() fetches a new one instead of reloading the rejected one.
+        with self._lock:
+            rejected = self._access_token
+            self._access_token = None
+            self._expires_at = 0.0
+            self._drop_cache_entry(rejected)
+
+    def _fetch(self):
+        token_url = f"{GRAPH_LOGIN_URL}/{self.tenant_id}/oauth2/v2.0/token"
+        token_data = {
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'scope': self.scope
+        }
+
+        if self.session is not None:
+            post = self.session.post
+        else:
+            import requests
+            post = requests.post
+        metrics = get_metrics()
+        with metrics.span('token'):
+            started = time.perf_counter()
+            token_r = post(token_url, data=token_data)
+            metrics.observe_http('POST token', token_r.status_code, time.perf_counter() - started)
+        token_r.raise_for_status()
+        payload = token_r.json()
+        access_token = payload.get('access_token')
+
+        if not access_token:
+            raise ValueError("Failed to get MS Graph access token")
+        self.fetch_count += 1
+
+        # Read the expiry from the 'exp' claim once; fall back to expires_in
+        claims = None
+        try:
+            claims = decode_token_claims(access_token)
+        except Exception as e:
+            print(f"# WARNING: Could not decode access token claims: {e}")
+        if claims and claims.get('exp'):
+            expires_at = float(claims['exp'])
+        else:
+            expires_at = time.time() + float(payload.get('expires_in', 3600))
+
+        # Claim dump helps diagnose 401 errors; opt in with NEWSLETTER_DEBUG_TOKEN=1
+        if self.debug_claims and claims:
             print("# DEBUG: Access Token Claims:")
             print(json.dumps(claims, indent=2))
-    except Exception as e:
-        print(f"# WARNING: Could not decode access token claims: {e}")
-    
-    return access_token
 
-def fetch_recipients_from_firestore(project_id=None, collection_name="config", document_id="email_recipients", field_name="recipients"):
-    # Fetch email recipients from a Firestore document.
+        return access_token, expires_at
+
+    def _read_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f).get(self.cache_key)
+        except (OSError, ValueError) as e:
+            print(f"# WARNING: Ignoring unreadable token cache {self.cache_path}: {e}")
+            return None
+        if entry and entry.get('access_token') and self._is_fresh(entry.get('expires_at', 0)):
+            return entry['access_token'], float(entry['expires_at'])
+        return None
+
+    def _load_cache_file(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _drop_cache_entry(self, rejected):
+        # Remove this key's entry, unless another process already replaced the rejected token.
+        if not self.cache_path:
+            return
+        cache = self._load_cache_file()
+        entry = cache.get(self.cache_key)
+        if not entry or (rejected and entry.get('access_token') != rejected):
+            return
+        del cache[self.cache_key]
+        self._save_cache_file(cache)
+
+    def _write_cache(self):
+        if not self.cache_path:
+            return
+        cache = self._load_cache_file()
+        cache[self.cache_key] = {'access_token': self._access_token, 'expires_at': self._expires_at}
+        self._save_cache_file(cache)
+
+    def _save_cache_file(self, cache):
+        # Write owner-only and swap into place so readers never see a partial file
+        tmp_path = f"{self.cache_path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+_token_providers = {}
+_token_providers_lock = threading.Lock()
+
+def get_token_provider(scope=GRAPH_SCOPE):
+    # Return the process-wide TokenProvider for the current environment credentials.
+    key = (os.environ.get('ONEDRIVE_TENANT_ID'), os.environ.get('ONEDRIVE_CLIENT_ID'),
+           os.environ.get('ONEDRIVE_CLIENT_SECRET'), scope)
+    with _token_providers_lock:
+        provider = _token_providers.get(key)
+        if provider is None:
+            provider = TokenProvider(scope=scope)
+            _token_providers[key] = provider
+        return provider
+
+def get_access_token():
+    # Get OAuth2 access token from Microsoft Graph API (for sending email).
+    # Tokens are cached per tenant/client/scope and refreshed shortly before expiry.
+    return get_token_provider().get_token()
+
+def firestore_client(project_id=None):
+    # Create a Firestore client. google.cloud.firestore pulls in gRPC and protobuf, so it
+    # is imported here, on first use, rather than at module import.
     # Assumes GOOGLE_APPLICATION_CREDENTIALS environment variable is set for authentication.
     if not project_id:
         project_id = os.environ.get('FIREBASE_PROJECT_ID')
     if not project_id:
         raise ValueError("Firebase project_id must be provided or set as FIREBASE_PROJECT_ID environment variable.")
+    from google.cloud import firestore
+    return firestore.Client(project=project_id)
 
-    db = firestore.Client(project=project_id)
+def fetch_recipients_from_firestore(project_id=None, collection_name="config", document_id="email_recipients", field_name="recipients"):
+    # Fetch email recipients from a Firestore document.
+    if not project_id:
+        project_id = os.environ.get('FIREBASE_PROJECT_ID')
+    db = firestore_client(project_id)
     print(f"Attempting to fetch recipient list from Firestore project '{project_id}', path: '{collection_name}/{document_id}', field: '{field_name}'")
 
     doc_ref = db.collection(collection_name).document(document_id)
-    doc = doc_ref.get()
+    with get_metrics().span('recipients.firestore_document'):
+        doc = doc_ref.get()
 
     if doc.exists:
         data = doc.to_dict()
@@ -64,7 +235,7 @@ def fetch_recipients_from_firestore(project_id=None, collection_name="config", d
             raise ValueError(f"Field '{field_name}' in Firestore document '{collection_name}/{document_id}' is not a list.")
         
         # Filter out empty strings and ensure all are strings
-        to_addresses = [str(addr).strip() for addr in to_addresses if isinstance(addr, str) and str(addr).strip()]
+        to_addresses = normalize_recipients(to_addresses)
 
         if not to_addresses:
             raise ValueError(f"Recipient list from Firestore ('{collection_name}/{document_id}' field '{field_name}') is empty or contains no valid email addresses.")
@@ -74,28 +245,1296 @@ def fetch_recipients_from_firestore(project_id=None, collection_name="config", d
     else:
         raise Exception(f"Firestore document '{collection_name}/{document_id}' not found in project '{project_id}'. Please ensure it exists and contains the recipient list.")
 
+DEFAULT_PAGE_SIZE = 500
+
+def normalize_recipients(addresses):
+    # Strip whitespace and drop empty or non-string entries.
+    return [addr.strip() for addr in addresses if isinstance(addr, str) and addr.strip()]
+
+def stream_recipients_from_firestore(project_id=None, collection_name="subscribers", field_name="email",
+                                     page_size=None, client=None):
+    # Yield subscriber addresses from a Firestore collection (one document per subscriber),
+    # reading page_size documents at a time with a start_after cursor so sending can
+    # begin on the first page and memory stays flat regardless of list size.
+    if client is None:
+        client = firestore_client(project_id)
+    if not page_size:
+        page_size = int(os.environ.get('FIRESTORE_PAGE_SIZE', DEFAULT_PAGE_SIZE))
+
+    print(f"Streaming recipients from Firestore collection '{collection_name}', field: '{field_name}', page size {page_size}")
+    metrics = get_metrics()
+    query = client.collection(collection_name).order_by(field_name).limit(page_size)
+    last_doc = None
+    pages = 0
+    total = 0
+    while True:
+        page_query = query.start_after(last_doc) if last_doc is not None else query
+        with metrics.span('recipients.firestore_page'):
+            docs = list(page_query.stream())
+        pages += 1
+        addresses = normalize_recipients((doc.to_dict() or {}).get(field_name) for doc in docs)
+        total += len(addresses)
+        yield from addresses
+        if len(docs) < page_size:
+            break
+        last_doc = docs[-1]
+    metrics.count(firestore_documents=total)
+    print(f"Recipients streamed from Firestore: {total} address(es) in {pages} page(s).")
+
+def _encode_sync_marker(value):
+    if isinstance(value, datetime):
+        return json.dumps({'datetime': value.isoformat()})
+    return json.dumps({'value': value})
+
+def _decode_sync_marker(raw):
+    marker = json.loads(raw)
+    if 'datetime' in marker:
+        return datetime.fromisoformat(marker['datetime'])
+    return marker['value']
+
+class RecipientSnapshot:
+    # Local SQLite copy of a Firestore subscriber collection plus the last-sync marker.
+    # sync() only pulls documents whose updated_field is at or after the marker, so a
+    # steady-state run reads a handful of documents instead of the whole list.
+    # Firestore queries cannot see hard deletes: unsubscribes must be written as a
+    # change (e.g. 'subscribed': False or an empty address) to reach the snapshot.
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS recipients (doc_id TEXT PRIMARY KEY, email TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS recipients_email ON recipients (email)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _state_key(self, collection_name):
+        return f"marker:{collection_name}"
+
+    def get_marker(self, collection_name):
+        row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (self._state_key(collection_name),)).fetchone()
+        return _decode_sync_marker(row[0]) if row else None
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(DISTINCT email) FROM recipients").fetchone()[0]
+
+    def iter_addresses(self):
+        # Yield the deduplicated addresses in sorted order straight from the database cursor.
+        for (email,) in self.conn.execute("SELECT DISTINCT email FROM recipients ORDER BY email"):
+            yield email
+
+    def sync(self, client, collection_name="subscribers", field_name="email", updated_field="updated_at",
+             active_field="subscribed", page_size=None, full=False):
+        # Apply subscriber changes since the last sync (or everything when full=True or on
+        # the first run). Returns {'read', 'upserted', 'removed'} counts.
+        if not page_size:
+            page_size = int(os.environ.get('FIRESTORE_PAGE_SIZE', DEFAULT_PAGE_SIZE))
+        marker = None if full else self.get_marker(collection_name)
+
+        query = client.collection(collection_name)
+        if marker is not None:
+            # >= rather than > so writes sharing the marker's timestamp are not missed;
+            # re-applying them is idempotent.
+            query = query.where(updated_field, '>=', marker)
+        query = query.order_by(updated_field).limit(page_size)
+
+        stats = {'read': 0, 'upserted': 0, 'removed': 0}
+        new_marker = marker
+        last_doc = None
+        with self.conn:
+            if full:
+                self.conn.execute("DELETE FROM recipients")
+            while True:
+                page_query = query.start_after(last_doc) if last_doc is not None else query
+                docs = list(page_query.stream())
+                for doc in docs:
+                    data = doc.to_dict() or {}
+                    stats['read'] += 1
+                    address = normalize_recipients([data.get(field_name)])
+                    if address and data.get(active_field, True) is not False:
+                        self.conn.execute("INSERT OR REPLACE INTO recipients (doc_id, email) VALUES (?, ?)", (doc.id, address[0]))
+                        stats['upserted'] += 1
+                    else:
+                        stats['removed'] += self.conn.execute("DELETE FROM recipients WHERE doc_id = ?", (doc.id,)).rowcount
+                    if data.get(updated_field) is not None:
+                        new_marker = data[updated_field]
+                if len(docs) < page_size:
+                    break
+                last_doc = docs[-1]
+            if new_marker is not None:
+                self.conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+                                  (self._state_key(collection_name), _encode_sync_marker(new_marker)))
+
+        mode = "full" if marker is None else "incremental"
+        print(f"Recipient snapshot {mode} sync: read {stats['read']} document(s), "
+              f"{stats['upserted']} upserted, {stats['removed']} removed, {self.count()} address(es) total.")
+        return stats
+
+def recipients_from_snapshot(snapshot_path, project_id=None, collection_name="subscribers", field_name="email",
+                             updated_field="updated_at", client=None):
+    # Sync the local snapshot with Firestore, then stream its addresses.
+    if client is None:
+        client = firestore_client(project_id)
+    snapshot = RecipientSnapshot(snapshot_path)
+    try:
+        with get_metrics().span('recipients.snapshot_sync'):
+            snapshot.sync(client, collection_name=collection_name, field_name=field_name, updated_field=updated_field)
+        yield from snapshot.iter_addresses()
+    finally:
+        snapshot.close()
+
+def ensure_recipients(recipients):
+    # Fail fast on an empty recipient source without materializing a streamed one.
+    if isinstance(recipients, (list, tuple)):
+        if not recipients:
+            raise ValueError("No recipients specified or found in Firestore.")
+        return recipients
+    iterator = iter(recipients or ())
+    first = next(iterator, None)
+    if first is None:
+        raise ValueError("No recipients specified or found in Firestore.")
+    return itertools.chain([first], iterator)
+
+# Recipient sources by name, selected with NEWSLETTER_RECIPIENT_SOURCE. Each factory takes
+# no arguments (it reads its own settings from the environment) and returns an iterable of
+# addresses; backends import their client libraries only when called.
+RECIPIENT_SOURCES = {}
+EMAIL_COLUMNS = ('email', 'address', 'recipient')
+
+def recipient_source(name):
+    # Register a recipient source factory under name.
+    def register(factory):
+        RECIPIENT_SOURCES[name] = factory
+        return factory
+    return register
+
+def read_recipients_file(path):
+    # Yield addresses from a text file (one per line, blank lines and # comments skipped) or,
+    # for .csv files, from the email/address/recipient column (the first column if none).
+    import csv
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if not path.lower().endswith('.csv'):
+            for line in f:
+                address = line.strip()
+                if address and not address.startswith('#'):
+                    yield address
+            return
+        rows = csv.reader(f)
+        header = next(rows, None)
+        if header is None:
+            return
+        lowered = [column.strip().lower() for column in header]
+        column = next((lowered.index(name) for name in EMAIL_COLUMNS if name in lowered), None)
+        if column is None:
+            # No recognizable header: the first row is data
+            column = 0
+            rows = itertools.chain([header], rows)
+        for row in rows:
+            if len(row) > column and row[column].strip():
+                yield row[column].strip()
+
+@recipient_source('file')
+def recipients_from_file():
+    path = os.environ.get('NEWSLETTER_RECIPIENTS_FILE')
+    if not path:
+        raise ValueError("NEWSLETTER_RECIPIENTS_FILE must be set for the 'file' recipient source.")
+    print(f"Reading recipients from {path}")
+    return read_recipients_file(path)
+
+@recipient_source('firestore')
+def recipients_from_firestore():
+    # project_id is read from FIREBASE_PROJECT_ID by the Firestore helpers. A configured
+    # subscriber collection is streamed page by page; otherwise the legacy
+    # config/email_recipients document is read in one go.
+    subscriber_collection = os.environ.get('FIRESTORE_RECIPIENTS_COLLECTION')
+    if subscriber_collection:
+        return stream_recipients_from_firestore(collection_name=subscriber_collection)
+    return fetch_recipients_from_firestore()
+
+@recipient_source('snapshot')
+def recipients_from_snapshot_source():
+    # The local SQLite snapshot, synced from FIRESTORE_RECIPIENTS_COLLECTION first when one
+    # is configured; otherwise read as-is without touching Firestore.
+    snapshot_path = os.environ.get('NEWSLETTER_RECIPIENT_SNAPSHOT')
+    if not snapshot_path:
+        raise ValueError("NEWSLETTER_RECIPIENT_SNAPSHOT must be set for the 'snapshot' recipient source.")
+    subscriber_collection = os.environ.get('FIRESTORE_RECIPIENTS_COLLECTION')
+    if subscriber_collection:
+        return recipients_from_snapshot(snapshot_path, collection_name=subscriber_collection)
+    if not os.path.exists(snapshot_path):
+        raise ValueError(f"Recipient snapshot {snapshot_path} does not exist.")
+    return _read_snapshot(snapshot_path)
+
+def _read_snapshot(snapshot_path):
+    with RecipientSnapshot(snapshot_path) as snapshot:
+        yield from snapshot.iter_addresses()
+
+def default_recipient_source():
+    # NEWSLETTER_RECIPIENT_SOURCE, or the source implied by the other settings.
+    source = os.environ.get('NEWSLETTER_RECIPIENT_SOURCE')
+    if source:
+        return source
+    if os.environ.get('NEWSLETTER_RECIPIENTS_FILE'):
+        return 'file'
+    if os.environ.get('NEWSLETTER_RECIPIENT_SNAPSHOT') and os.environ.get('FIRESTORE_RECIPIENTS_COLLECTION'):
+        return 'snapshot'
+    return 'firestore'
+
+_END_OF_STREAM = object()
+
+def load_suppression_list(path=None):
+    # SuppressionList for NEWSLETTER_SUPPRESSION_LIST, or None when it is not set. The list is
+    # either a compiled index or a text/CSV address list (unsubscribes, hard bounces), which is
+    # compiled to <path>.idx whenever the list is newer than its index.
+    path = path or os.environ.get('NEWSLETTER_SUPPRESSION_LIST')
+    if not path:
+        return None
+    if not os.path.exists(path):
+        raise ValueError(f"Suppression list {path} does not exist.")
+    if is_suppression_index(path):
+        return SuppressionList(path)
+    index_path = path + SUPPRESSION_INDEX_SUFFIX
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+        with get_metrics().span('recipients.suppression_index'):
+            count = build_suppression_index(read_recipients_file(path), index_path)
+        print(f"Suppression index rebuilt: {count} address(es) → {index_path}")
+    return SuppressionList(index_path)
+
+def timed_stream(factory, name, metrics=None, clock=time.perf_counter):
+    # Yield from factory() and record the time spent in the factory and in fetching each item
+    # (not in the consumer between items) as span name once the stream is drained or closed.
+    metrics = metrics if metrics is not None else get_metrics()
+    if not metrics.enabled:
+        yield from factory()
+        return
+    perf_counter = clock
+    waited = 0.0
+    fetching_since = perf_counter()
+    try:
+        iterator = iter(factory())
+        while True:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            waited += perf_counter() - fetching_since
+            fetching_since = None
+            yield item
+            fetching_since = perf_counter()
+    finally:
+        if fetching_since is not None:
+            waited += perf_counter() - fetching_since
+        metrics.record_span(name, waited)
+
+def cleaned_recipients(addresses, open_suppression=load_suppression_list):
+    # Normalize, validate, dedupe and suppression-filter a recipient stream, reporting the
+    # counts once it has been read to the end. The suppression list (open_suppression()) is
+    # opened, and its index rebuilt when stale, only once the source has produced its first
+    # address, so a stream that fails or is never read leaves it untouched. Deduplication
+    # keeps a fingerprint per unique address, so memory grows with the unique recipients.
+    stats = {}
+    addresses = iter(addresses)
+    first = next(addresses, _END_OF_STREAM)
+    suppression = None
+    try:
+        if first is not _END_OF_STREAM:
+            suppression = open_suppression() if open_suppression else None
+            addresses = itertools.chain((first,), addresses)
+        yield from clean_recipients(addresses, suppression, stats)
+    finally:
+        if suppression is not None:
+            suppression.close()
+    get_metrics().count(**{f'recipients_{key}': value for key, value in stats.items()})
+    print(f"Recipients cleaned: {stats['accepted']} accepted, {stats['duplicate']} duplicate(s), "
+          f"{stats['invalid']} invalid, {stats['suppressed']} suppressed.")
+
+def load_recipients(source=None):
+    # Return the cleaned addresses from the named (or configured) recipient source.
+    source = source or default_recipient_source()
+    if source not in RECIPIENT_SOURCES:
+        raise ValueError(f"Unknown recipient source '{source}'. Expected one of: {', '.join(sorted(RECIPIENT_SOURCES))}")
+    addresses = timed_stream(RECIPIENT_SOURCES[source], f'recipients.{source}')
+    return cleaned_recipients(addresses)
+
+DEFAULT_RECIPIENT_NAME = "Valued Subscriber"
+
+class CompiledTemplate:
+    # A str.format-style template split once into static text and placeholder
+    # segments. Rendering is a single join over the segments, so per-recipient
+    # bodies never re-parse the HTML. Supports {{ }} escapes, !r/!s/!a
+    # conversions, format specs and dotted/indexed field names like format().
+    def __init__(self, source):
+        self.source = source
+        statics = ['']
+        placeholders = []
+        formatter = string.Formatter()
+        for literal, field_name, format_spec, conversion in formatter.parse(source):
+            statics[-1] += literal
+            if field_name is None:
+                continue
+            if field_name == '' or field_name.isdigit():
+                raise ValueError("Positional placeholders are not supported in templates; use named fields.")
+            simple = not format_spec and not conversion and '.' not in field_name and '[' not in field_name
+            placeholders.append((field_name, format_spec, conversion, simple))
+            statics.append('')
+        self._statics = tuple(statics)
+        self._placeholders = tuple(placeholders)
+        self._segments = tuple(zip(placeholders, statics[1:]))
+        self._formatter = formatter
+        # Top-level names a render context has to supply, including nested format-spec fields
+        names = [name for name, _, _, _ in placeholders]
+        names += [nested for _, spec, _, _ in placeholders if '{' in spec
+                  for _, nested, _, _ in formatter.parse(spec) if nested]
+        self.fields = frozenset(re.split(r'[.\[]', name, 1)[0] for name in names)
+
+    def _value(self, placeholder, context):
+        field_name, format_spec, conversion, simple = placeholder
+        if simple:
+            value = context[field_name]
+            return value if type(value) is str else format(value)
+        value = self._formatter.get_field(field_name, (), context)[0]
+        value = self._formatter.convert_field(value, conversion)
+        return format(value, self._formatter.format(format_spec, **context) if '{' in format_spec else format_spec)
+
+    def render(self, context):
+        # Render the template with values looked up in the context mapping.
+        parts = [self._statics[0]]
+        append = parts.append
+        for placeholder, static in self._segments:
+            append(self._value(placeholder, context))
+            append(static)
+        return ''.join(parts)
+
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+
+def load_compiled_template(template_path):
+    # Return the CompiledTemplate for a file, re-reading it only when its mtime or size
+    # changed and recompiling only when its content hash changed.
+    path = os.path.abspath(template_path)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _template_cache_lock:
+        entry = _template_cache.get(path)
+        if entry and entry['stamp'] == stamp:
+            return entry['template']
+
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    with _template_cache_lock:
+        entry = _template_cache.get(path)
+        if not entry or entry['digest'] != digest:
+            entry = {'digest': digest, 'template': CompiledTemplate(source)}
+            _template_cache[path] = entry
+        entry['stamp'] = stamp
+        return entry['template']
+
 def load_template(template_path):
     # Load email template from file.
     if template_path and os.path.exists(template_path):
-        with open(template_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return load_compiled_template(template_path).source
     return None
 
-def send_newsletter(recipients=None, subject=None, content_html=None, template_path=None, access_token=None, from_address=None):
+def default_template_context(extra=None):
+    # Campaign-wide values available to every template render.
+    context = {
+        'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'recipient_name': DEFAULT_RECIPIENT_NAME
+    }
+    if extra:
+        context.update(extra)
+    return context
+
+def recipient_context(address, shared_context, recipient_fields=None):
+    # Layer one recipient's fields over the shared context without copying it.
+    fields = {'recipient_email': address}
+    if recipient_fields:
+        fields.update(recipient_fields)
+        if 'name' in recipient_fields and 'recipient_name' not in recipient_fields:
+            fields['recipient_name'] = recipient_fields['name']
+    return ChainMap(fields, shared_context)
+
+_worker_template = None
+
+def _init_render_worker(source):
+    global _worker_template
+    _worker_template = CompiledTemplate(source)
+
+def _render_chunk(contexts):
+    return [_worker_template.render(context) for context in contexts]
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def render_many(template, contexts, processes=None, chunksize=2000):
+    # Render one body per context mapping, in order. With processes > 1 the contexts
+    # are rendered in chunks on a process pool whose workers compile the template once.
+    if not processes or processes < 2:
+        for context in contexts:
+            yield template.render(context)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_render_worker,
+                             initargs=(template.source,)) as pool:
+        plain_chunks = ([dict(context) for context in chunk] for chunk in _chunked(contexts, chunksize))
+        for bodies in pool.map(_render_chunk, plain_chunks):
+            yield from bodies
+
+GRAPH_API_URL = os.environ.get('GRAPH_API_URL', 'https://graph.microsoft.com/v1.0')
+GRAPH_BATCH_URL = f"{GRAPH_API_URL}/$batch"
+GRAPH_BATCH_LIMIT = 20 # Max sub-requests per JSON $batch call
+DELIVERY_MODES = ('single', 'individual', 'bcc')
+DEFAULT_DELIVERY_MODE = 'bcc'
+DEFAULT_CHUNK_SIZE = 50 # BCC recipients per message, well under Exchange's 500 cap
+
+def chunk_recipients(recipients, chunk_size):
+    # Yield successive lists of at most chunk_size addresses.
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    chunk = []
+    for addr in recipients:
+        chunk.append(addr.strip())
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def build_message(subject, content_html, to_addresses=(), bcc_addresses=()):
+    # Build a sendMail request body.
+    message = {
+        'subject': subject,
+        'body': {'contentType': 'HTML', 'content': content_html}
+    }
+    if to_addresses:
+        message['toRecipients'] = [{'emailAddress': {'address': addr}} for addr in to_addresses]
+    if bcc_addresses:
+        message['bccRecipients'] = [{'emailAddress': {'address': addr}} for addr in bcc_addresses]
+    return {'message': message, 'saveToSentItems': 'true'}
+
+def plan_messages(recipients, delivery_mode=DEFAULT_DELIVERY_MODE, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Split recipients into per-message groups: one address each in 'individual'
+    # mode, chunk_size BCC addresses each in 'bcc' mode.
+    if delivery_mode == 'individual':
+        return chunk_recipients(recipients, 1)
+    if delivery_mode == 'bcc':
+        return chunk_recipients(recipients, chunk_size)
+    raise ValueError(f"Unsupported delivery mode for batched sending: {delivery_mode}")
+
+def message_size(delivery_mode, chunk_size):
+    # Recipients in one full message: chunk_size in 'bcc' mode, otherwise one.
+    return chunk_size if delivery_mode == 'bcc' else 1
+
+def build_batch_requests(from_address, subject, content_html, recipient_groups, delivery_mode=DEFAULT_DELIVERY_MODE,
+                         render_body=None):
+    # Pack recipient groups into $batch payloads of up to GRAPH_BATCH_LIMIT sendMail sub-requests.
+    # render_body(group), if given, returns a personalized body for each group.
+    # Yields (batch_payload, {sub_request_id: recipients}) pairs.
+    send_mail_path = f"/users/{from_address}/sendMail"
+    metrics = get_metrics()
+    sub_requests = []
+    groups = {}
+    for group in recipient_groups:
+        request_id = str(len(sub_requests) + 1)
+        if render_body:
+            with metrics.span('template.render'):
+                html = render_body(group)
+        else:
+            html = content_html
+        if delivery_mode == 'individual':
+            body = build_message(subject, html, to_addresses=group)
+        else:
+            body = build_message(subject, html, bcc_addresses=group)
+        sub_requests.append({
+            'id': request_id,
+            'method': 'POST',
+            'url': send_mail_path,
+            'headers': {'Content-Type': 'application/json'},
+            'body': body
+        })
+        groups[request_id] = group
+        if len(sub_requests) == GRAPH_BATCH_LIMIT:
+            yield {'requests': sub_requests}, groups
+            sub_requests = []
+            groups = {}
+    if sub_requests:
+        yield {'requests': sub_requests}, groups
+
+class EncodedMessage:
+    # A campaign's sendMail sub-request split into JSON fragments that are encoded once.
+    # Per message only the request id and the recipient block are encoded; the subject and
+    # HTML body are spliced in as bytes, so the body is never re-escaped per batch.
+    # The result parses to the same structure build_message() produces.
+    def __init__(self, from_address, subject, content_html, delivery_mode=DEFAULT_DELIVERY_MODE):
+        field = 'toRecipients' if delivery_mode == 'individual' else 'bccRecipients'
+        self._head = (',"method":"POST","url":' + encode_basestring_ascii(f"/users/{from_address}/sendMail") +
+                      ',"headers":{"Content-Type":"application/json"},"body":{"message":{"subject":' +
+                      encode_basestring_ascii(subject) + ',"body":{"contentType":"HTML","content":').encode('ascii')
+        self._content = self.encode_content(content_html)
+        self._recipients = f'}},"{field}":['.encode('ascii')
+        self._tail = b']},"saveToSentItems":"true"}}'
+
+    @staticmethod
+    def encode_content(content_html):
+        return encode_basestring_ascii(content_html).encode('ascii')
+
+    def sub_request(self, request_id, recipients, encoded_content=None):
+        # Return the JSON bytes of one sub-request; encoded_content overrides the shared body.
+        addresses = ','.join('{"emailAddress":{"address":' + encode_basestring_ascii(addr) + '}}' for addr in recipients)
+        return b''.join((b'{"id":', encode_basestring_ascii(request_id).encode('ascii'), self._head,
+                         self._content if encoded_content is None else encoded_content,
+                         self._recipients, addresses.encode('ascii'), self._tail))
+
+class EncodedBatch:
+    # A $batch request held as its sub-requests' JSON bytes keyed by id, so a retry of
+    # some sub-requests reuses their bytes instead of re-encoding them.
+    def __init__(self, parts):
+        self.parts = parts
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls({req['id']: json.dumps(req, separators=(',', ':')).encode('ascii') for req in payload['requests']})
+
+    def subset(self, request_ids):
+        return EncodedBatch({request_id: part for request_id, part in self.parts.items() if request_id in request_ids})
+
+    def body(self):
+        return b'{"requests":[' + b','.join(self.parts.values()) + b']}'
+
+def build_encoded_batches(from_address, subject, content_html, recipient_groups, delivery_mode=DEFAULT_DELIVERY_MODE,
+                          render_body=None):
+    # Same packing as build_batch_requests, but yields (EncodedBatch, groups) pairs assembled
+    # from fragments encoded once per campaign. Only personalized bodies are encoded per message.
+    message = EncodedMessage(from_address, subject, content_html, delivery_mode)
+    metrics = get_metrics()
+    parts = {}
+    groups = {}
+    for group in recipient_groups:
+        request_id = str(len(parts) + 1)
+        encoded_content = None
+        if render_body:
+            with metrics.span('template.render'):
+                encoded_content = EncodedMessage.encode_content(render_body(group))
+        parts[request_id] = message.sub_request(request_id, group, encoded_content)
+        groups[request_id] = group
+        if len(parts) == GRAPH_BATCH_LIMIT:
+            yield EncodedBatch(parts), groups
+            parts = {}
+            groups = {}
+    if parts:
+        yield EncodedBatch(parts), groups
+
+def parse_batch_response(response, groups):
+    # Map each $batch sub-response back to its recipients.
+    # Returns a list of {'id', 'recipients', 'status', 'error', 'headers'} dicts, one per sub-request.
+    if response.status_code != 200:
+        error = f"$batch request failed: {response.status_code} - {response.text}"
+        return [{'id': request_id, 'recipients': group, 'status': response.status_code, 'error': error,
+                 'headers': dict(response.headers)} for request_id, group in groups.items()]
+
+    results = []
+    seen = set()
+    for sub_response in response.json().get('responses', []):
+        request_id = str(sub_response.get('id'))
+        if request_id not in groups:
+            continue
+        seen.add(request_id)
+        status = sub_response.get('status')
+        error = None
+        if status != 202:
+            error = json.dumps(sub_response.get('body')) if sub_response.get('body') else f"HTTP {status}"
+        results.append({'id': request_id, 'recipients': groups[request_id], 'status': status, 'error': error,
+                        'headers': sub_response.get('headers') or {}})
+    for request_id, group in groups.items():
+        if request_id not in seen:
+            results.append({'id': request_id, 'recipients': group, 'status': None,
+                            'error': "No response for sub-request in $batch reply", 'headers': {}})
+    return results
+
+RETRYABLE_STATUSES = (429, 503, 504)
+DEFAULT_CONCURRENCY = 4 # Exchange Online allows 4 concurrent requests per mailbox
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+def create_session(pool_size=DEFAULT_CONCURRENCY):
+    # Build a requests session whose keep-alive pool fits pool_size concurrent requests.
+    # requests is imported on first use so runs that stop before sending never load it.
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def parse_retry_after(headers):
+    # Return the Retry-After delay in seconds from a header mapping, or None.
+    value = None
+    for key, header_value in (headers or {}).items():
+        if key.lower() == 'retry-after':
+            value = header_value
+            break
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+class SendEngine:
+    # Runs Graph requests over one pooled session with at most max_workers in flight.
+    # 429/503/504 replies are retried after Retry-After (or a jittered exponential
+    # backoff) and the engine keeps throughput counters for the run summary.
+    def __init__(self, access_token=None, token_provider=None, session=None, max_workers=None,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=BACKOFF_BASE_SECONDS, backoff_max=BACKOFF_MAX_SECONDS,
+                 sleep=time.sleep, metrics=None, compress=None):
+        if not access_token and not token_provider:
+            raise ValueError("SendEngine needs an access_token or a token_provider")
+        if max_workers is None:
+            max_workers = int(os.environ.get('NEWSLETTER_CONCURRENCY', DEFAULT_CONCURRENCY))
+        self.access_token = access_token
+        self.token_provider = token_provider
+        self.max_workers = max(1, max_workers)
+        self.session = session if session is not None else create_session(self.max_workers)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.metrics = metrics if metrics is not None else get_metrics()
+        if compress is None:
+            compress = os.environ.get('NEWSLETTER_GZIP_REQUESTS', '').lower() in ('1', 'true', 'yes')
+        self.compress = compress
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'messages': 0, 'recipients': 0, 'failed_recipients': 0, 'retries': 0}
+        self.started_at = None
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+        self.metrics.count(**increments)
+
+    def headers(self):
+        token = self.token_provider.get_token() if self.token_provider else self.access_token
+        return {
+            'Authorization': 'Bearer ' + token, # MS Graph Token
+            'Content-Type': 'application/json'
+        }
+
+    def backoff_delay(self, attempt, headers=None):
+        # Prefer the server's Retry-After; otherwise back off exponentially with full jitter.
+        retry_after = parse_retry_after(headers)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, url, data, extra_headers=None):
+        # POST with retries on throttling, transient errors and one token refresh on 401.
+        import requests
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        refreshed = False
+        attempt = 0
+        endpoint = 'POST ' + url.rsplit('/', 1)[-1]
+        while True:
+            self._count(requests=1)
+            headers = self.headers()
+            if extra_headers:
+                headers.update(extra_headers)
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, headers=headers, data=data)
+            except requests.ConnectionError as e:
+                self.metrics.observe_http(endpoint, type(e).__name__, time.perf_counter() - started, len(data))
+                if attempt >= self.max_retries:
+                    raise
+                self._count(retries=1)
+                self.sleep(self.backoff_delay(attempt))
+                attempt += 1
+                continue
+            self.metrics.observe_http(endpoint, response.status_code, time.perf_counter() - started, len(data))
+            if response.status_code == 401 and self.token_provider and not refreshed:
+                self.token_provider.invalidate()
+                refreshed = True
+                continue
+            if response.status_code in RETRYABLE_STATUSES and attempt < self.max_retries:
+                self._count(retries=1)
+                self.sleep(self.backoff_delay(attempt, response.headers))
+                attempt += 1
+                continue
+            return response
+
+    def encode_body(self, batch):
+        # Request bytes and headers for an EncodedBatch, gzip-compressed when enabled.
+        data = batch.body()
+        if not self.compress:
+            return data, None
+        return gzip.compress(data, compresslevel=6, mtime=0), {'Content-Encoding': 'gzip'}
+
+    def send_batch(self, payload, groups):
+        # Send one $batch (an EncodedBatch or a build_batch_requests payload dict), re-sending
+        # only the throttled sub-requests until they succeed or retries run out.
+        # Returns the final per-sub-request results.
+        if isinstance(payload, dict):
+            payload = EncodedBatch.from_payload(payload)
+        final = []
+        for attempt in range(self.max_retries + 1):
+            with self.metrics.span('serialize'):
+                data, extra_headers = self.encode_body(payload)
+            response = self.post(GRAPH_BATCH_URL, data, extra_headers)
+            results = parse_batch_response(response, groups)
+            retryable = []
+            if response.status_code == 200:
+                retryable = [r for r in results if r['status'] in RETRYABLE_STATUSES]
+            if not retryable or attempt == self.max_retries:
+                final.extend(results)
+                break
+            final.extend(r for r in results if r['status'] not in RETRYABLE_STATUSES)
+            self._count(retries=len(retryable))
+            self.sleep(max(self.backoff_delay(attempt, r['headers']) for r in retryable))
+            retry_ids = {r['id'] for r in retryable}
+            payload = payload.subset(retry_ids)
+            groups = {request_id: groups[request_id] for request_id in retry_ids}
+
+        failed = [r for r in final if r['error']]
+        self._count(messages=len(final) - len(failed),
+                    recipients=sum(len(r['recipients']) for r in final if not r['error']),
+                    failed_recipients=sum(len(r['recipients']) for r in failed))
+        return final
+
+    def run_batches(self, batches, on_results=None):
+        # Send (payload, groups) pairs concurrently, keeping at most 2 * max_workers
+        # batches queued so large lists are never fully materialized.
+        # Each batch's results go to on_results(results) if given (nothing is kept);
+        # otherwise all results are collected and returned. A (payload, groups, handler)
+        # triple sends that batch's results to its own handler instead.
+        results = []
+        handle = on_results if on_results is not None else results.extend
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for batch in batches:
+                if len(in_flight) >= self.max_workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        in_flight.pop(future)(future.result())
+                in_flight[pool.submit(self.send_batch, batch[0], batch[1])] = batch[2] if len(batch) > 2 else handle
+            for future in as_completed(in_flight):
+                in_flight[future](future.result())
+        return results
+
+    def report(self):
+        # Print and return a throughput summary for everything sent so far.
+        elapsed = time.monotonic() - self.started_at if self.started_at is not None else 0.0
+        summary = dict(self.stats)
+        summary['elapsed_seconds'] = round(elapsed, 3)
+        summary['recipients_per_second'] = round(summary['recipients'] / elapsed, 1) if elapsed > 0 else 0.0
+        print(f"Sent to {summary['recipients']} recipient(s) in {summary['messages']} message(s) over "
+              f"{summary['requests']} request(s) in {elapsed:.2f}s ({summary['recipients_per_second']} recipients/sec, "
+              f"{summary['retries']} retries, {summary['failed_recipients']} failed).")
+        return summary
+
+def prepare_batches(from_address, subject, content_html, recipients, delivery_mode=DEFAULT_DELIVERY_MODE,
+                    chunk_size=DEFAULT_CHUNK_SIZE, render_body=None, journal=None, scheduler=None):
+    # The lazy stream of (payload, groups) batches send_in_batches sends: recipients the
+    # journal records as sent are dropped, the scheduler admits and paces the rest, and
+    # each batch is journaled as pending just before it is handed on.
+    if journal is not None:
+        recipients = journal.unsent(recipients)
+    if scheduler is not None:
+        recipients = scheduler.admit(recipients)
+    groups = plan_messages(recipients, delivery_mode, chunk_size)
+    batches = build_encoded_batches(from_address, subject, content_html, groups, delivery_mode, render_body)
+    if scheduler is not None:
+        batches = scheduler.pace(batches)
+    if journal is not None:
+        batches = journal.track_batches(batches)
+    return batches
+
+def send_in_batches(engine, from_address, subject, content_html, recipients,
+                    delivery_mode=DEFAULT_DELIVERY_MODE, chunk_size=DEFAULT_CHUNK_SIZE, render_body=None, on_results=None,
+                    journal=None, scheduler=None):
+    # Deliver recipients (any iterable, consumed lazily) through Graph $batch calls on the
+    # given SendEngine, continuing past failed sub-requests. Returns the per-sub-request
+    # results, or streams them to on_results instead. With a DeliveryJournal, recipients
+    # it already records as sent are skipped and every outcome is journaled. With a
+    # QuotaScheduler, batches are paced and only today's allowance of recipients is sent.
+    batches = prepare_batches(from_address, subject, content_html, recipients, delivery_mode, chunk_size, render_body,
+                              journal, scheduler)
+    if journal is not None or scheduler is not None:
+        handle = on_results
+        collected = []
+        def on_results(results):
+            if journal is not None:
+                journal.record(results)
+            if scheduler is not None:
+                scheduler.refund(results)
+            (handle or collected.extend)(results)
+        engine.run_batches(batches, on_results)
+        return collected
+    return engine.run_batches(batches, on_results)
+
+class DeliveryJournal:
+    # Append-only JSON-lines journal of delivery state for one campaign. Every batch is
+    # written as 'pending' before it is sent and as 'sent'/'failed' once its results are
+    # in, each append fsync'd. Reopening the journal of the same campaign lets a rerun
+    # skip everything already delivered and retry only failed or never-attempted
+    # recipients. Recipients still 'pending' after a crash are retried (at-least-once).
+    def __init__(self, path, campaign_id):
+        self.path = path
+        self.campaign_id = campaign_id
+        self.state = {}
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._load()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # Torn final line from a crash mid-append
+                if entry.get('campaign') != self.campaign_id:
+                    continue
+                for addr in entry.get('recipients', []):
+                    self.state[addr] = entry['state']
+
+    def counts(self):
+        counts = {'sent': 0, 'failed': 0, 'pending': 0}
+        for state in self.state.values():
+            counts[state] += 1
+        return counts
+
+    def is_sent(self, address):
+        return self.state.get(address) == 'sent'
+
+    def _append(self, entries):
+        with self._lock:
+            for entry in entries:
+                entry['campaign'] = self.campaign_id
+                entry['ts'] = round(time.time(), 3)
+                self._file.write(json.dumps(entry) + '\n')
+                for addr in entry['recipients']:
+                    self.state[addr] = entry['state']
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def unsent(self, recipients):
+        # Yield only recipients that have not been delivered in an earlier attempt.
+        for addr in recipients:
+            if self.is_sent(addr.strip()):
+                self.skipped += 1
+                continue
+            yield addr
+
+    def track_batches(self, batches):
+        # Mark each (payload, groups) batch as pending before handing it on for sending.
+        for payload, groups in batches:
+            self._append([{'state': 'pending', 'recipients': group} for group in groups.values()])
+            yield payload, groups
+
+    def record(self, results):
+        # Persist the outcome of one batch's sub-requests.
+        self._append([{'state': 'failed' if r['error'] else 'sent', 'recipients': r['recipients'], 'status': r['status']}
+                      for r in results])
+
+    def close(self):
+        self._file.close()
+
+def campaign_id_for(subject, content):
+    # Stable campaign id, so rerunning the same newsletter resumes its journal.
+    return hashlib.sha256(f"{subject}\0{content}".encode('utf-8')).hexdigest()[:16]
+
+def open_journal(journal_dir, campaign_id):
+    # Open (or resume) the journal for a campaign inside journal_dir.
+    journal = DeliveryJournal(os.path.join(journal_dir, f"{campaign_id}.jsonl"), campaign_id)
+    counts = journal.counts()
+    if any(counts.values()):
+        print(f"Resuming campaign {campaign_id}: {counts['sent']} already sent, "
+              f"{counts['failed']} failed and {counts['pending']} unconfirmed recipient(s) will be retried.")
+    return journal
+
+# Exchange Online sending limits for one mailbox
+DEFAULT_MESSAGES_PER_MINUTE = 30
+DEFAULT_RECIPIENTS_PER_DAY = 10000
+
+class DeferredDelivery(Exception):
+    # Raised when the mailbox's daily recipient allowance ran out before every recipient
+    # was sent. Sent recipients are in the delivery journal, so a later run resumes.
+    def __init__(self, message, next_window_at=None):
+        super().__init__(message)
+        self.next_window_at = next_window_at
+
+class TokenBucket:
+    # capacity tokens, refilled continuously at capacity per period seconds.
+    def __init__(self, capacity, period, tokens=None, updated_at=None, clock=time.time):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.clock = clock
+        self.tokens = self.capacity if tokens is None else min(self.capacity, float(tokens))
+        self.updated_at = clock() if updated_at is None else updated_at
+
+    def refill(self):
+        now = self.clock()
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return self.tokens
+
+    def take(self, count=1):
+        # Take count tokens if available; returns whether they were taken.
+        if self.refill() < count:
+            return False
+        self.tokens -= count
+        return True
+
+    def put(self, count):
+        # Return count tokens to the bucket (never beyond capacity).
+        self.tokens = min(self.capacity, self.refill() + count)
+
+    def wait_time(self, count=1):
+        # Seconds until count tokens are available (count is capped at capacity).
+        missing = min(count, self.capacity) - self.refill()
+        return max(0.0, missing / self.rate)
+
+    def to_dict(self):
+        return {'tokens': round(self.tokens, 3), 'updated_at': self.updated_at}
+
+class QuotaScheduler:
+    # Paces batched sends to the mailbox limits with two token buckets (messages per minute,
+    # recipients per day) whose levels are saved to state_path, so back-to-back runs share
+    # one allowance. Recipients beyond today's allowance are not sent: the run stops with
+    # DeferredDelivery and a later run picks up where the delivery journal left off.
+    def __init__(self, state_path=None, messages_per_minute=None, recipients_per_day=None,
+                 clock=time.time, sleep=time.sleep):
+        if messages_per_minute is None:
+            messages_per_minute = int(os.environ.get('NEWSLETTER_MESSAGES_PER_MINUTE') or DEFAULT_MESSAGES_PER_MINUTE)
+        if recipients_per_day is None:
+            recipients_per_day = int(os.environ.get('NEWSLETTER_RECIPIENTS_PER_DAY') or DEFAULT_RECIPIENTS_PER_DAY)
+        self.state_path = state_path
+        self.clock = clock
+        self.sleep = sleep
+        state = {}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+        self.messages = TokenBucket(messages_per_minute, 60, clock=clock, **state.get('messages', {}))
+        self.recipients = TokenBucket(recipients_per_day, 86400, clock=clock, **state.get('recipients', {}))
+        self.admitted = 0
+        self.deferred = False
+        self.waited = 0.0
+
+    def save(self):
+        if not self.state_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'messages': self.messages.to_dict(), 'recipients': self.recipients.to_dict()}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def allowance(self):
+        return int(self.recipients.refill())
+
+    def next_window_at(self, message_size=DEFAULT_CHUNK_SIZE):
+        # When enough of the daily allowance has refilled for one more message of message_size recipients.
+        return self.clock() + self.recipients.wait_time(message_size)
+
+    def admit(self, recipients):
+        # Yield recipients while the daily allowance lasts, then stop (setting deferred). Once
+        # deferred, nothing more is admitted this run, even as the allowance trickles back.
+        for addr in recipients:
+            if self.deferred or not self.recipients.take(1):
+                self.deferred = True
+                return
+            self.admitted += 1
+            yield addr
+
+    def refund(self, results):
+        # Give back the allowance taken for recipients of failed sub-requests, which were
+        # never delivered. Returns how many recipients were refunded.
+        failed = sum(len(r['recipients']) for r in results if r['error'])
+        if failed:
+            self.recipients.put(failed)
+            self.admitted -= failed
+        return failed
+
+    def pace(self, batches):
+        # Hold each (payload, groups) batch until the per-minute message bucket covers it. A
+        # batch larger than the bucket is paid for a bucketful at a time.
+        for payload, groups in batches:
+            needed = len(groups)
+            while needed > 0:
+                chunk = min(needed, int(self.messages.capacity) or 1)
+                while not self.messages.take(chunk):
+                    delay = self.messages.wait_time(chunk)
+                    self.waited += delay
+                    self.sleep(delay)
+                needed -= chunk
+            self.save()
+            yield payload, groups
+
+    def plan(self, total=None):
+        # One-line summary of what fits in the current window.
+        allowance = self.allowance()
+        line = (f"Quota: {allowance} of {int(self.recipients.capacity)} recipients left today, "
+                f"{int(self.messages.capacity)} messages/minute")
+        if total is not None and total > allowance:
+            per_window = int(self.recipients.capacity)
+            line += (f"; {total - allowance} recipient(s) will be deferred "
+                     f"(about {-(-(total - allowance) // per_window)} more day(s) at the daily cap)")
+        return line + "."
+
+def open_scheduler(state_dir):
+    # QuotaScheduler whose state lives in state_dir/quota.json.
+    return QuotaScheduler(os.path.join(state_dir, 'quota.json'))
+
+def load_pending_campaign(state_dir):
+    # The campaign queued by a deferred run ({'subject', 'content_html', 'campaign_id', ...}), or None.
+    path = os.path.join(state_dir, 'pending.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_pending_campaign(state_dir, campaign):
+    os.makedirs(state_dir, exist_ok=True)
+    path = os.path.join(state_dir, 'pending.json')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(campaign, f, indent=2)
+    os.replace(tmp_path, path)
+
+def clear_pending_campaign(state_dir):
+    path = os.path.join(state_dir, 'pending.json')
+    if os.path.exists(path):
+        os.remove(path)
+
+class PrefetchedRecipients:
+    # Drains a recipient stream on a daemon thread into a bounded buffer, so the next
+    # Firestore page (or the snapshot sync) is fetched while earlier addresses are being
+    # sent. Each address is appended under the condition as soon as it arrives and the
+    # consumer takes everything buffered at once, so sending can start on the first page
+    # however the source pages. Iterate it once; errors from the source are re-raised to
+    # the consumer and stopping early (e.g. a deferred campaign) stops the producer.
+    def __init__(self, factory, max_buffered=None):
+        if not max_buffered:
+            max_buffered = 4 * int(os.environ.get('FIRESTORE_PAGE_SIZE', DEFAULT_PAGE_SIZE))
+        self.max_buffered = max_buffered
+        self.started = time.perf_counter()
+        self.first_ready_seconds = None
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._done = False
+        self._error = None
+        self._stop = False
+        self._consumer_waiting = False
+        self._producer_waiting = False
+        self._thread = threading.Thread(target=self._produce, args=(factory,), name='recipient-prefetch', daemon=True)
+        self._thread.start()
+
+    def _produce(self, factory):
+        cond = self._cond
+        buffer = self._buffer
+        try:
+            for address in factory():
+                with cond:
+                    while len(buffer) >= self.max_buffered and not self._stop:
+                        self._producer_waiting = True
+                        cond.wait()
+                    self._producer_waiting = False
+                    if self._stop:
+                        return
+                    buffer.append(address)
+                    if self._consumer_waiting:
+                        cond.notify_all()
+        except BaseException as e:
+            with cond:
+                self._error = e
+        finally:
+            with cond:
+                self._done = True
+                cond.notify_all()
+
+    def __iter__(self):
+        cond = self._cond
+        buffer = self._buffer
+        try:
+            while True:
+                with cond:
+                    while not buffer and not self._done:
+                        self._consumer_waiting = True
+                        cond.wait()
+                    self._consumer_waiting = False
+                    if not buffer:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    ready = list(buffer)
+                    buffer.clear()
+                    if self._producer_waiting:
+                        cond.notify_all()
+                if self.first_ready_seconds is None:
+                    self.first_ready_seconds = time.perf_counter() - self.started
+                yield from ready
+        finally:
+            self.close()
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+class StartupPipeline:
+    # Starts a run's independent startup phases together: the Graph token, the send engine
+    # (importing requests and opening its connection pool), the campaign content and the
+    # recipient stream. Sending can begin as soon as the token and the first page of
+    # recipients are in, so startup takes about as long as the slowest phase instead of
+    # the sum of all of them. Closing it stops the prefetch and closes the engine.
+    def __init__(self, token_provider, prepare_content=None, recipient_source=None, engine_factory=None):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.token_provider = token_provider
+        self._pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix='startup')
+        self._token = self._start('token', token_provider.get_token)
+        self._engine = self._start('engine', engine_factory or (lambda: SendEngine(token_provider=token_provider)))
+        self._content = self._start('content', prepare_content) if prepare_content else None
+        self._pool.shutdown(wait=False)
+        self.recipients = PrefetchedRecipients(lambda: load_recipients(recipient_source))
+
+    def _start(self, name, fn):
+        def run():
+            try:
+                return fn()
+            finally:
+                self.timings[name] = time.perf_counter() - self.started
+                get_metrics().record_span(f'startup.{name}', self.timings[name])
+        return self._pool.submit(run)
+
+    def token(self):
+        return self._token.result()
+
+    def engine(self):
+        engine = self._engine.result()
+        if self.token_provider.session is None:
+            # Token refreshes during long runs reuse the engine's connection pool
+            self.token_provider.session = engine.session
+        return engine
+
+    def content(self):
+        return self._content.result() if self._content is not None else None
+
+    def report(self):
+        # Print when each phase finished, measured from the start of the pipeline.
+        timings = dict(self.timings)
+        if self.recipients.first_ready_seconds is not None:
+            timings['first recipients'] = self.recipients.first_ready_seconds
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(timings.items(), key=lambda item: item[1]))
+        print(f"Startup phases ready after: {phases}.")
+
+    def close(self):
+        self.recipients.close()
+        try:
+            engine = self._engine.result()
+        except Exception:
+            return
+        engine.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def prepare_template(template_path, template_context=None, recipient_data=None):
+    # Returns (content_html, render_body) for a template file. A template using only
+    # campaign-wide values is rendered once and render_body is None; otherwise
+    # content_html is the template source and render_body(group) renders each message.
+    metrics = get_metrics()
+    with metrics.span('template.load'):
+        template = load_compiled_template(template_path)
+    shared_context = default_template_context(template_context)
+    per_recipient_fields = set(template.fields) - set(shared_context)
+    if recipient_data and 'recipient_name' in template.fields:
+        per_recipient_fields.add('recipient_name')
+    if not per_recipient_fields:
+        with metrics.span('template.render'):
+            return template.render(shared_context), None
+    recipient_data = recipient_data or {}
+    def render_body(group):
+        return template.render(recipient_context(group[0], shared_context, recipient_data.get(group[0])))
+    return template.source, render_body
+
+def send_newsletter(recipients=None, subject=None, content_html=None, template_path=None, access_token=None, from_address=None,
+                    delivery_mode=None, chunk_size=None, engine=None, template_context=None, recipient_data=None,
+                    journal=None, campaign_id=None, scheduler=None):
     # Send newsletter to specified recipients.
     # Fetches recipients from Firestore if not provided.
-    if not access_token:
-        access_token = get_access_token() # For MS Graph (sending email)
+    # delivery_mode: 'bcc' (default, chunked BCC groups), 'individual' (one message per
+    # recipient) or 'single' (one sendMail with every address in toRecipients).
+    # engine: SendEngine to send through; one is created (and closed) per call if omitted.
+    # template_context: campaign-wide template values (timestamp is filled in by default).
+    # recipient_data: {address: {field: value}} for templates with per-recipient placeholders.
+    # journal: DeliveryJournal to resume from and record into. If omitted and
+    # NEWSLETTER_JOURNAL_DIR is set, the journal for campaign_id (default: a hash of the
+    # subject and content) is opened there, so a rerun skips recipients already sent.
+    # scheduler: QuotaScheduler pacing batched sends to the mailbox limits (one is opened in
+    # NEWSLETTER_QUOTA_DIR when that is set). Raises DeferredDelivery when the daily
+    # allowance runs out first.
+    token_provider = None
+    if not access_token and engine is None:
+        token_provider = get_token_provider() # For MS Graph (sending email)
     
     if not from_address:
         from_address = os.environ.get('ONEDRIVE_EMAIL') # This is the SENDER email
         if not from_address:
             raise ValueError("from_address parameter or ONEDRIVE_EMAIL environment variable (sender email) must be set")
     
-    if template_path and not content_html:
-        template_content = load_template(template_path)
-        if template_content:
-            content_html = template_content
+    render_body = None
+    if template_path and not content_html and os.path.exists(template_path):
+        content_html, render_body = prepare_template(template_path, template_context, recipient_data)
     
     if not content_html:
         content_html = """
@@ -107,34 +1546,107 @@ def send_newsletter(recipients=None, subject=None, content_html=None, template_p
         subject = "Your Awesome Newsletter!"
     
     if not recipients:
-        print("Recipients not provided directly, attempting to fetch from Firestore...")
+        source = default_recipient_source()
+        print(f"Recipients not provided directly, loading them from the '{source}' source...")
         try:
-            # project_id will be read from FIREBASE_PROJECT_ID env var by fetch_recipients_from_firestore
-            recipients = fetch_recipients_from_firestore() 
+            recipients = ensure_recipients(load_recipients(source))
         except Exception as e:
-            raise ValueError(f"Failed to fetch recipients from Firestore and none were provided: {e}")
+            where = "Firestore" if source == 'firestore' else f"the '{source}' source"
+            raise ValueError(f"Failed to fetch recipients from {where} and none were provided: {e}")
 
-    if not recipients:
-        raise ValueError("No recipients specified or found in Firestore.")
+    recipients = ensure_recipients(recipients)
 
-    send_mail_url = f"https://graph.microsoft.com/v1.0/users/{from_address}/sendMail"
-    
-    email_msg = {
-        'message': {
-            'subject': subject,
-            'body': {'contentType': 'HTML', 'content': content_html},
-            'toRecipients': [{'emailAddress': {'address': addr.strip()}} for addr in recipients]
-        },
-        'saveToSentItems': 'true'
-    }
+    if not delivery_mode:
+        delivery_mode = os.environ.get('NEWSLETTER_DELIVERY_MODE', DEFAULT_DELIVERY_MODE)
+    if delivery_mode not in DELIVERY_MODES:
+        raise ValueError(f"Unknown delivery mode '{delivery_mode}'. Expected one of: {', '.join(DELIVERY_MODES)}")
+    if not chunk_size:
+        chunk_size = int(os.environ.get('NEWSLETTER_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+    if render_body and delivery_mode != 'individual':
+        print(f"Template has per-recipient placeholders; switching from '{delivery_mode}' to 'individual' delivery.")
+        delivery_mode = 'individual'
+
+    owns_journal = journal is None and bool(os.environ.get('NEWSLETTER_JOURNAL_DIR'))
+    if owns_journal:
+        campaign_id = campaign_id or os.environ.get('NEWSLETTER_CAMPAIGN_ID') or campaign_id_for(subject, content_html)
+        journal = open_journal(os.environ['NEWSLETTER_JOURNAL_DIR'], campaign_id)
+    if scheduler is None and os.environ.get('NEWSLETTER_QUOTA_DIR') and delivery_mode != 'single':
+        scheduler = open_scheduler(os.environ['NEWSLETTER_QUOTA_DIR'])
+        if journal is None:
+            print("# WARNING: NEWSLETTER_QUOTA_DIR is set without NEWSLETTER_JOURNAL_DIR; "
+                  "deferred recipients cannot be resumed without a delivery journal.")
+    owns_engine = engine is None
+    if owns_engine:
+        engine = SendEngine(access_token=access_token, token_provider=token_provider)
+    try:
+        with get_metrics().span('send'):
+            return _deliver(engine, recipients, subject, content_html, from_address, delivery_mode, chunk_size, render_body,
+                            journal, scheduler)
+    finally:
+        if owns_engine:
+            engine.close()
+        if owns_journal:
+            journal.close()
+        if scheduler is not None:
+            scheduler.save()
+
+def _deliver(engine, recipients, subject, content_html, from_address, delivery_mode, chunk_size, render_body=None, journal=None,
+             scheduler=None):
+    if delivery_mode != 'single':
+        if hasattr(recipients, '__len__'):
+            print(f"Attempting to send email to {len(recipients)} recipient(s) in '{delivery_mode}' mode...")
+        else:
+            print(f"Attempting to send email to streamed recipients in '{delivery_mode}' mode...")
+        if scheduler is not None:
+            print(scheduler.plan(len(recipients) if hasattr(recipients, '__len__') else None))
+        failures = []
+        message_count = [0]
+        def collect(batch_results):
+            message_count[0] += len(batch_results)
+            failures.extend(r for r in batch_results if r['error'])
+        send_in_batches(engine, from_address, subject, content_html, recipients,
+                        delivery_mode=delivery_mode, chunk_size=chunk_size, render_body=render_body, on_results=collect,
+                        journal=journal, scheduler=scheduler)
+        engine.report()
+        if journal is not None and journal.skipped:
+            print(f"Skipped {journal.skipped} recipient(s) already delivered by an earlier attempt.")
+        deferred_msg = None
+        if scheduler is not None and scheduler.deferred:
+            next_window_at = scheduler.next_window_at(message_size(delivery_mode, chunk_size))
+            next_window = datetime.fromtimestamp(next_window_at, timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+            deferred_msg = (f"Daily recipient allowance reached after {scheduler.admitted} recipient(s); "
+                            f"the rest are queued for the next window (from {next_window}).")
+        if not failures:
+            print(f"Email sent successfully in {message_count[0]} message(s)!")
+            if deferred_msg:
+                print(deferred_msg)
+                raise DeferredDelivery(deferred_msg, next_window_at)
+            return True
+        failed_count = sum(len(r['recipients']) for r in failures)
+        total_count = failed_count + engine.stats['recipients']
+        error_msg = f"Failed to send email to {failed_count} of {total_count} recipient(s) in {len(failures)} message(s)"
+        error_msg += f" - first error: {failures[0]['status']} {failures[0]['error']}"
+        if deferred_msg:
+            error_msg += f". {deferred_msg}"
+        print(f"ERROR: {error_msg}")
+        raise Exception(error_msg)
+
+    send_mail_url = f"{GRAPH_API_URL}/users/{from_address}/sendMail"
     
-    headers = {
-        'Authorization': 'Bearer ' + access_token, # MS Graph Token
-        'Content-Type': 'application/json'
-    }
+    if journal is not None:
+        recipients = journal.unsent(recipients)
+    recipients = [addr.strip() for addr in recipients]
+    if not recipients:
+        print("All recipients were already delivered by an earlier attempt.")
+        return True
+    with engine.metrics.span('serialize'):
+        data = json.dumps(build_message(subject, content_html, to_addresses=recipients))
     
     print(f"Attempting to send email to {len(recipients)} recipient(s)...")
-    response = requests.post(send_mail_url, headers=headers, data=json.dumps(email_msg))
+    response = engine.post(send_mail_url, data)
+    if journal is not None:
+        journal.record([{'recipients': recipients, 'status': response.status_code,
+                         'error': None if response.status_code == 202 else f"HTTP {response.status_code}"}])
     
     if response.status_code == 202:
         print("Email sent successfully!")
@@ -149,28 +1661,163 @@ def send_newsletter(recipients=None, subject=None, content_html=None, template_p
         print(f"ERROR: {error_msg}")
         raise Exception(error_msg)
 
+SITE_URL = "https://wllclngn.github.io/SomeKindofFiction/"
+
+def _baseline_entries(manuscript_path, baseline_ref):
+    # Entries of the manuscript as of a git ref, or None if the ref is unavailable.
+    if not baseline_ref or not baseline_ref.strip('0'):
+        return None
+    result = subprocess.run(['git', 'show', f"{baseline_ref}:./{os.path.basename(manuscript_path)}"],
+                            cwd=os.path.dirname(os.path.abspath(manuscript_path)), capture_output=True)
+    if result.returncode != 0:
+        return None
+    return split_entries(preprocess_text(result.stdout.decode('utf-8')))
+
+def detect_entry_changes(manifest_path, manuscript_path=MANUSCRIPT_PATH, baseline_ref=None):
+    # Compare the manuscript's entries with the announced-entries manifest.
+    # Returns (announced, changes, bootstrapped). Without a manifest, entries present at
+    # baseline_ref (e.g. the commit before the push) count as announced; with no usable
+    # baseline every current entry does, so a first run never mails the whole archive.
+    entries = load_entries(manuscript_path)
+    announced = load_announced_manifest(manifest_path)
+    bootstrapped = announced is None
+    if bootstrapped:
+        baseline = _baseline_entries(manuscript_path, baseline_ref)
+        seed = baseline if baseline is not None else entries
+        announced = mark_announced({}, [(index, entry, 'new') for index, entry in enumerate(seed)])
+        source = f"'{baseline_ref}'" if baseline is not None else "the current manuscript"
+        print(f"No announced-entries manifest at {manifest_path}; seeding it with {len(seed)} entries from {source}.")
+    changes = find_unannounced_entries(entries, announced)
+    print(f"Found {len(changes)} new or edited entr{'y' if len(changes) == 1 else 'ies'} in {os.path.basename(manuscript_path)}.")
+    return announced, changes, bootstrapped
+
+def build_entries_newsletter(changes):
+    # Build (subject, content_html) announcing the given (index, entry, status) changes.
+    titles = [entry_title(entry) for _, entry, _ in changes]
+    if len(changes) == 1:
+        verb = "New" if changes[0][2] == 'new' else "Updated"
+        heading = titles[0].strip('“”"')
+        subject = f"{verb} in The Compendium of Universal Record: {heading}"
+    else:
+        subject = f"{len(changes)} new and updated entries in The Compendium of Universal Record"
+
+    sections = []
+    for (index, entry, status), title in zip(changes, titles):
+        body = entry.lstrip('●').strip()
+        if body.startswith(title):
+            body = body[len(title):].strip()
+        label = "New entry" if status == 'new' else "Updated entry"
+        body_html = escape(body).replace('\n', '<br>')
+        sections.append(
+            f"<h2>{escape(title)}</h2>\n<p><em>{label}</em></p>\n"
+            f"<p>{body_html}</p>\n"
+            f"<p><a href=\"{SITE_URL}?entry={index}\">Read it on the site</a></p>"
+        )
+    content_html = ("<html><body><h1>The Compendium of Universal Record</h1>\n"
+                    + "\n<hr>\n".join(sections) + "\n</body></html>")
+    return subject, content_html
+
+def write_run_metrics(metrics):
+    # Write the run's metrics to NEWSLETTER_METRICS_FILE and the GitHub Actions step summary.
+    if not metrics.enabled:
+        return None
+    summary = metrics.write(os.environ.get('NEWSLETTER_METRICS_FILE'), os.environ.get('GITHUB_STEP_SUMMARY'))
+    spans = ", ".join(f"{name} {span['seconds']:.2f}s" for name, span in summary['spans'].items())
+    print(f"Run metrics: {summary['elapsed_seconds']:.2f}s total ({spans}).")
+    return summary
+
 def main():
     # Main function that runs the script logic.
+    metrics = configure_metrics()
     try:
+        # A campaign deferred by the mailbox quota goes out first, then any new one
+        quota_dir = os.environ.get('NEWSLETTER_QUOTA_DIR')
+        pending = load_pending_campaign(quota_dir) if quota_dir else None
+        campaigns = []
+        if pending:
+            print(f"Resuming campaign {pending.get('campaign_id') or ''} queued on {pending.get('queued_at')}.")
+            campaigns.append(pending)
+
+        # Only mail entries of Fantasy.txt that have not been announced yet, and stop
+        # before any token/Firestore/Graph work when there are none.
+        manifest_path = os.environ.get('NEWSLETTER_ANNOUNCED_MANIFEST')
+        new_campaign = None
+        changes = None
+        if manifest_path:
+            with metrics.span('detect_changes'):
+                announced, changes, bootstrapped = detect_entry_changes(
+                    manifest_path, baseline_ref=os.environ.get('NEWSLETTER_BASELINE_REF'))
+            if changes:
+                new_campaign = {} # Content is built by the startup pipeline
+            else:
+                if bootstrapped:
+                    save_announced_manifest(manifest_path, announced)
+                print("No new or edited entries to announce.")
+        elif not pending:
+            new_campaign = {'subject': None, 'content_html': None, 'campaign_id': None}
+        if new_campaign is not None:
+            campaigns.append(new_campaign)
+        if not campaigns:
+            print("Nothing to send.")
+            return
+
         from_address = os.environ.get('ONEDRIVE_EMAIL') # Sender email
         if not from_address:
             print("ONEDRIVE_EMAIL environment variable (for sender email) is not set.")
             exit(1)
         
-        firebase_project_id = os.environ.get('FIREBASE_PROJECT_ID')
-        if not firebase_project_id:
+        if default_recipient_source() == 'firestore' and not os.environ.get('FIREBASE_PROJECT_ID'):
             print("FIREBASE_PROJECT_ID environment variable is not set. This is required for fetching recipients from Firestore.")
 
-        # Get access token for Microsoft Graph API (to send the email)
-        ms_graph_access_token = get_access_token()
-        print("MS Graph Access token obtained successfully.")
-        
-        # Call send_newsletter. It will fetch recipients from Firestore.
-        send_newsletter(access_token=ms_graph_access_token, from_address=from_address)
+        def prepare_content():
+            if changes:
+                subject, content_html = build_entries_newsletter(changes)
+                new_campaign.update(subject=subject, content_html=content_html, campaign_id=campaign_id_for(subject, content_html))
+            return campaigns
+
+        # Get the access token for Microsoft Graph API (to send the email), the recipients and the
+        # content concurrently; the first campaign starts sending once the token and the first
+        # page of recipients are in.
+        token_provider = get_token_provider()
+        with StartupPipeline(token_provider, prepare_content=prepare_content) as pipeline:
+            engine = pipeline.engine()
+            pipeline.token()
+            print("MS Graph Access token obtained successfully.")
+            pipeline.content()
+
+            # A deferred campaign is queued for the next run; later campaigns wait behind it.
+            new_campaign_queued = False
+            for position, campaign in enumerate(campaigns):
+                # Later campaigns read the recipient source again
+                recipients = pipeline.recipients if position == 0 else None
+                try:
+                    send_newsletter(recipients=recipients, subject=campaign['subject'], content_html=campaign['content_html'],
+                                    from_address=from_address, engine=engine, campaign_id=campaign['campaign_id'])
+                except DeferredDelivery as e:
+                    queued_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+                    save_pending_campaign(quota_dir, dict(campaign, queued_at=campaign.get('queued_at') or queued_at,
+                                                          next_window_at=e.next_window_at))
+                    new_campaign_queued = campaign is new_campaign
+                    print("Run this workflow again after the next window opens to continue the campaign.")
+                    break
+                finally:
+                    if position == 0:
+                        pipeline.report()
+                if campaign is pending:
+                    clear_pending_campaign(quota_dir)
+                if campaign is new_campaign:
+                    new_campaign_queued = True
+
+        # Entries count as announced once their campaign is sent or queued
+        if manifest_path and new_campaign is not None and new_campaign_queued:
+            save_announced_manifest(manifest_path, mark_announced(announced, changes))
+            print(f"Recorded {len(changes)} announced entr{'y' if len(changes) == 1 else 'ies'} in {manifest_path}.")
         
     except Exception as e:
         print(f"Error: {e}")
         exit(1)
+    finally:
+        write_run_metrics(metrics)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,171 @@
+import os
+import re
+import sys
+import mmap
+import struct
+import hashlib
+from array import array
+from bisect import bisect_left
+
+SUPPRESSION_MAGIC = b"SUP1"
+SUPPRESSION_INDEX_SUFFIX = ".idx"
+MAX_ADDRESS_LENGTH = 254
+MAX_LOCAL_PART_LENGTH = 64
+
+# Pragmatic address syntax: a dot-atom local part and a dotted domain (applied after the
+# domain is lower-cased). Non-ASCII characters are accepted for internationalized addresses;
+# quoted local parts and IP-literal domains are not.
+_ATOM = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~\-\u0080-\U0010ffff]+"
+_LABEL = r"[a-z0-9\u0080-\U0010ffff](?:[a-z0-9\-\u0080-\U0010ffff]{0,61}[a-z0-9\u0080-\U0010ffff])?"
+ADDRESS_RE = re.compile(rf"{_ATOM}(?:\.{_ATOM})*@(?:{_LABEL}\.)+{_LABEL}")
+
+# Suppression index layout (little-endian):
+#   magic "SUP1", address count n (uint32)
+#   n uint64 fingerprints, ascending
+#   n + 1 uint32 offsets into the address block
+#   address block: the normalized addresses (UTF-8) in fingerprint order
+# Lookups binary-search the memory-mapped fingerprints and confirm a hit by comparing the
+# stored address, so the index never reports a false positive.
+
+def normalize_address(address):
+    # Trimmed address with a lower-cased domain, or None when it is not a valid address.
+    # The local part keeps its case, which is significant to the receiving server.
+    if not isinstance(address, str):
+        return None
+    address = address.strip()
+    local, at, domain = address.rpartition('@')
+    if not at or len(address) > MAX_ADDRESS_LENGTH or len(local) > MAX_LOCAL_PART_LENGTH:
+        return None
+    address = f"{local}@{domain.lower()}"
+    return address if ADDRESS_RE.fullmatch(address) else None
+
+def fingerprint(address):
+    return int.from_bytes(hashlib.blake2b(address.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def build_suppression_index(addresses, path):
+    # Write the index for an iterable of addresses (normalized here; invalid ones are skipped).
+    # Returns the number of distinct addresses written.
+    unique = {normalize_address(address) for address in addresses}
+    unique.discard(None)
+    ordered = sorted((fingerprint(address), address.encode('utf-8')) for address in unique)
+    fingerprints = array('Q', (fp for fp, _ in ordered))
+    offsets = array('I', [0])
+    blob = bytearray()
+    for _, encoded in ordered:
+        blob += encoded
+        offsets.append(len(blob))
+    if sys.byteorder != 'little':
+        fingerprints.byteswap()
+        offsets.byteswap()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<4sI', SUPPRESSION_MAGIC, len(ordered)))
+        f.write(fingerprints.tobytes())
+        f.write(offsets.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return len(ordered)
+
+def is_suppression_index(path):
+    with open(path, 'rb') as f:
+        return f.read(4) == SUPPRESSION_MAGIC
+
+class SuppressionList:
+    # Read-only, memory-mapped view of a suppression index. Only the pages a lookup touches
+    # are read, so memory stays flat however many addresses are suppressed.
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        header = self._map[:8] if self._map else b""
+        if len(header) < 8 or header[:4] != SUPPRESSION_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a suppression index")
+        self.count = struct.unpack('<I', header[4:])[0]
+        if sys.byteorder == 'little':
+            view = memoryview(self._map)
+            self._fingerprints = view[8:8 + 8 * self.count].cast('Q')
+            self._offsets = view[8 + 8 * self.count:8 + 12 * self.count + 4].cast('I')
+            view.release()
+        else:
+            self._fingerprints = array('Q', self._map[8:8 + 8 * self.count])
+            self._fingerprints.byteswap()
+            self._offsets = array('I', self._map[8 + 8 * self.count:8 + 12 * self.count + 4])
+            self._offsets.byteswap()
+        self._blob_start = 8 + 12 * self.count + 4
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, address):
+        address = normalize_address(address)
+        return address is not None and self.contains_normalized(address)
+
+    def contains_normalized(self, address, address_fingerprint=None):
+        # Membership test for an address already passed through normalize_address.
+        fp = fingerprint(address) if address_fingerprint is None else address_fingerprint
+        fingerprints = self._fingerprints
+        index = bisect_left(fingerprints, fp)
+        if index == self.count or fingerprints[index] != fp:
+            return False
+        encoded = address.encode('utf-8')
+        while index < self.count and fingerprints[index] == fp:
+            start = self._blob_start + self._offsets[index]
+            if self._map[start:self._blob_start + self._offsets[index + 1]] == encoded:
+                return True
+            index += 1
+        return False
+
+    def close(self):
+        if self._map is not None:
+            for view in (getattr(self, '_fingerprints', None), getattr(self, '_offsets', None)):
+                if isinstance(view, memoryview):
+                    view.release()
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def clean_recipients(addresses, suppression=None, stats=None):
+    # Yield each valid, unsuppressed address once, normalized, in input order, in a single
+    # pass. Duplicates are tracked by 64-bit fingerprint rather than by the address itself
+    # (a collision, about one in 10^8 for a million addresses, would drop one address).
+    # The fingerprint set keeps one entry per unique address, so memory is O(unique
+    # recipients), about 90 bytes per address with set overhead, not constant. stats (a
+    # dict) receives accepted/duplicate/invalid/suppressed counts as it goes.
+    stats = {} if stats is None else stats
+    for key in ('accepted', 'duplicate', 'invalid', 'suppressed'):
+        stats.setdefault(key, 0)
+    seen = set()
+    for raw in addresses:
+        address = normalize_address(raw)
+        if address is None:
+            stats['invalid'] += 1
+            continue
+        fp = fingerprint(address)
+        if fp in seen:
+            stats['duplicate'] += 1
+            continue
+        seen.add(fp)
+        if suppression is not None and suppression.contains_normalized(address, fp):
+            stats['suppressed'] += 1
+            continue
+        stats['accepted'] += 1
+        yield address
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python scripts/recipient_filter.py <addresses.txt> <suppression.idx>")
+        sys.exit(1)
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        written = build_suppression_index((line for line in f if not line.startswith('#')), sys.argv[2])
+    print(f"Suppression index written: {written} address(es) → {sys.argv[2]}")
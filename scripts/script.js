@@ -7,43 +7,223 @@ document.addEventListener('DOMContentLoaded', () => {
     const filePath = 'src/Fantasy.txt';
     const rawFileURL = `https://raw.githubusercontent.com/${owner}/${repo}/${branch}/${filePath}`;
 
-    // Fetch the content of Fantasy.txt
-    fetch(rawFileURL)
-        .then(response => {
+    const entriesDir = 'entries';
+    const searchDir = 'search';
+    const params = new URLSearchParams(window.location.search);
+    const entryIndex = params.get('entry');
+    const query = (params.get('q') || '').trim();
+    document.getElementById('search-input').value = query;
+
+    // Prebuilt per-entry shards (scripts/entries.py); fall back to parsing the raw file
+    fetchJSON(`${entriesDir}/manifest.json`)
+        .then(manifest => {
+            if (!manifest.count) {
+                displayErrorMessage('Fantasy.txt appears to be empty.');
+                return;
+            }
+            const shardURL = item => `${entriesDir}/${item.path}?v=${item.hash.slice(0, 12)}`;
+            const lastEntry = manifest.entries[manifest.count - 1];
+            lastEntryLink.href = `?entry=${lastEntry.index}`;
+            lastEntryLink.addEventListener('click', (event) => {
+                event.preventDefault();
+                fetchJSON(shardURL(lastEntry))
+                    .then(shard => renderHTML(shard.html))
+                    .catch(handleError);
+            });
+
+            if (query) {
+                return searchEntries(query)
+                    .then(indexes => renderSearchResults(manifest, indexes))
+                    .catch(error => {
+                        console.error('Error searching entries:', error);
+                        displayErrorMessage('Search is unavailable right now. Please try again later.');
+                    });
+            }
+            const requested = entryIndex !== null ? manifest.entries[entryIndex] : undefined;
+            const url = requested ? shardURL(requested) : `${entriesDir}/all.json?v=${manifest.version}`;
+            return fetchJSON(url).then(shard => renderHTML(shard.html));
+        }, error => {
+            console.warn('Entry shards unavailable, loading Fantasy.txt instead:', error);
+            loadRawManuscript();
+        })
+        .catch(handleError);
+
+    function fetchJSON(url) {
+        return fetch(url).then(response => {
             if (!response.ok) {
                 throw new Error(`Network response was not ok: ${response.status} ${response.statusText}`);
             }
-            return response.text();
-        })
-        .then(text => {
-            if (text.trim() === '') {
-                displayErrorMessage('Fantasy.txt appears to be empty.');
-            } else {
-                const processedText = preprocessText(text);
-                const entries = splitEntries(processedText);
-
-                const lastEntryIndex = entries.length - 1;
-                lastEntryLink.href = `?entry=${lastEntryIndex}`;
-                lastEntryLink.addEventListener('click', (event) => {
-                    event.preventDefault();
-                    renderEntry(entries[lastEntryIndex]);
-                });
-
-                const entryIndex = new URLSearchParams(window.location.search).get('entry');
-                if (entryIndex !== null && entries[entryIndex]) {
-                    renderEntry(entries[entryIndex]);
-                } else {
-                    renderEntry(entries.join('\n\n'));
+            return response.json();
+        });
+    }
+
+    // Prebuilt search index (scripts/search_index.py): only the shards for the query's term
+    // prefixes are downloaded. Keep tokenize() in step with tokenize() in the builder.
+    let searchMeta = null;
+    const searchShards = {};
+
+    function tokenize(text) {
+        return text.normalize('NFKD').replace(/\p{Mn}/gu, '').toLowerCase().match(/[\p{L}\p{N}]+/gu) || [];
+    }
+
+    function searchEntries(text) {
+        const terms = tokenize(text);
+        if (!terms.length) {
+            return Promise.resolve([]);
+        }
+        const metaReady = searchMeta ? Promise.resolve(searchMeta) : fetchJSON(`${searchDir}/meta.json`).then(meta => (searchMeta = meta));
+        return metaReady.then(meta => Promise.all(terms.map((term, position) => {
+            const asPrefix = position === terms.length - 1 && Array.from(term).length >= meta.prefix_length;
+            return lookupTerm(meta, term, asPrefix);
+        }))).then(results => {
+            let scores = results[0];
+            for (const matches of results.slice(1)) {
+                const combined = new Map();
+                for (const [index, frequency] of matches) {
+                    if (scores.has(index)) {
+                        combined.set(index, scores.get(index) + frequency);
+                    }
                 }
+                scores = combined;
             }
-        })
-        .catch(error => {
-            console.error('Error fetching Fantasy.txt:', error);
-            displayErrorMessage(`Error loading content from ${filePath}.<br>Please ensure the file exists at the correct path in the '${branch}' branch, and try again.`);
+            return Array.from(scores.keys()).sort((a, b) => (scores.get(b) - scores.get(a)) || (a - b));
         });
+    }
+
+    function lookupTerm(meta, term, asPrefix) {
+        const info = meta.shards[Array.from(term).slice(0, meta.prefix_length).join('')];
+        if (!info) {
+            return Promise.resolve(new Map());
+        }
+        return loadSearchShard(info).then(terms => {
+            const matches = new Map();
+            for (const [candidate, postings] of terms) {
+                if (candidate === term || (asPrefix && candidate.startsWith(term))) {
+                    for (const [index, frequency] of postings) {
+                        matches.set(index, (matches.get(index) || 0) + frequency);
+                    }
+                }
+            }
+            return matches;
+        });
+    }
+
+    function loadSearchShard(info) {
+        if (!searchShards[info.file]) {
+            searchShards[info.file] = fetch(`${searchDir}/${info.file}?v=${info.hash}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`Network response was not ok: ${response.status} ${response.statusText}`);
+                    }
+                    return response.arrayBuffer();
+                })
+                .then(buffer => decodeSearchShard(new Uint8Array(buffer)));
+        }
+        return searchShards[info.file];
+    }
+
+    function decodeSearchShard(data) {
+        // Layout documented in scripts/search_index.py: front-coded term dictionary, then
+        // varint (entry index delta, term frequency) postings for each term in order.
+        let pos = 4;
+        const varint = () => {
+            let result = 0;
+            let scale = 1;
+            let byte;
+            do {
+                byte = data[pos++];
+                result += (byte & 0x7f) * scale;
+                scale *= 128;
+            } while (byte >= 0x80);
+            return result;
+        };
+        const decoder = new TextDecoder();
+        const count = varint();
+        const header = [];
+        let previous = new Uint8Array(0);
+        for (let i = 0; i < count; i++) {
+            const shared = varint();
+            const suffixLength = varint();
+            const termBytes = new Uint8Array(shared + suffixLength);
+            termBytes.set(previous.subarray(0, shared));
+            termBytes.set(data.subarray(pos, pos + suffixLength), shared);
+            pos += suffixLength;
+            varint(); // document frequency
+            header.push([decoder.decode(termBytes), varint()]);
+            previous = termBytes;
+        }
+        return header.map(([term, blockLength]) => {
+            const postings = [];
+            const end = pos + blockLength;
+            let index = 0;
+            while (pos < end) {
+                index += varint();
+                postings.push([index, varint()]);
+            }
+            return [term, postings];
+        });
+    }
+
+    function renderSearchResults(manifest, indexes) {
+        if (!indexes.length) {
+            contentDisplay.innerHTML = `<p>No entries match “${escapeHTML(query)}”.</p>`;
+            return;
+        }
+        const items = indexes.map(index => {
+            const title = manifest.entries[index] ? manifest.entries[index].title : `Entry ${index}`;
+            return `<li><a href="?entry=${index}">${escapeHTML(title || `Entry ${index}`)}</a></li>`;
+        });
+        contentDisplay.innerHTML = `<p>${indexes.length} entr${indexes.length === 1 ? 'y' : 'ies'} match “${escapeHTML(query)}”:</p><ul class="search-results">${items.join('')}</ul>`;
+    }
+
+    function escapeHTML(text) {
+        return text.replace(/[&<>"']/g, ch => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' })[ch]);
+    }
+
+    function handleError(error) {
+        console.error('Error fetching Fantasy.txt:', error);
+        displayErrorMessage(`Error loading content from ${filePath}.<br>Please ensure the file exists at the correct path in the '${branch}' branch, and try again.`);
+    }
+
+    // Fetch the content of Fantasy.txt
+    function loadRawManuscript() {
+        fetch(rawFileURL)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Network response was not ok: ${response.status} ${response.statusText}`);
+                }
+                return response.text();
+            })
+            .then(text => {
+                if (text.trim() === '') {
+                    displayErrorMessage('Fantasy.txt appears to be empty.');
+                } else {
+                    const processedText = preprocessText(text);
+                    const entries = splitEntries(processedText);
+
+                    const lastEntryIndex = entries.length - 1;
+                    lastEntryLink.href = `?entry=${lastEntryIndex}`;
+                    lastEntryLink.addEventListener('click', (event) => {
+                        event.preventDefault();
+                        renderEntry(entries[lastEntryIndex]);
+                    });
+
+                    if (entryIndex !== null && entries[entryIndex]) {
+                        renderEntry(entries[entryIndex]);
+                    } else {
+                        renderEntry(entries.join('\n\n'));
+                    }
+                }
+            })
+            .catch(handleError);
+    }
 
     function renderEntry(entry) {
-        contentDisplay.innerHTML = `<p>${entry.replace(/\n/g, '<br>')}</p>`;
+        renderHTML(entry.replace(/\n/g, '<br>'));
+    }
+
+    function renderHTML(html) {
+        contentDisplay.innerHTML = `<p>${html}</p>`;
     }
 
     function preprocessText(text) {
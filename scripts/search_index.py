@@ -0,0 +1,219 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+# Sibling scripts are importable both when run directly and as scripts.search_index
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from entries import MANUSCRIPT_PATH, ROOT_DIR, iter_entries
+
+SEARCH_DIR = os.path.join(ROOT_DIR, "search")
+PREFIX_LENGTH = 2
+SHARD_MAGIC = b"CSI1"
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+# Shard layout (all integers are unsigned LEB128 varints):
+#   magic "CSI1", term count
+#   per term, in sorted order: shared-prefix length with the previous term, suffix byte
+#   length, suffix UTF-8 bytes, document frequency, postings byte length
+#   postings for every term, concatenated in the same order: (entry index delta, term frequency) pairs
+
+def tokenize(text):
+    # Lower-cased, accent-stripped alphanumeric tokens; mirrored by tokenize() in scripts/script.js.
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return TOKEN_RE.findall(stripped.lower())
+
+def shard_key(term):
+    return term[:PREFIX_LENGTH]
+
+def shard_filename(key):
+    # Hex of the UTF-8 prefix keeps file names portable for any script
+    return key.encode("utf-8").hex() + ".bin"
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def entry_terms(entry):
+    # Return {term: frequency} for one entry.
+    counts = defaultdict(int)
+    for token in tokenize(entry):
+        counts[token] += 1
+    return counts
+
+def build_postings(entries, term_counts=None):
+    # Return {term: [(entry_index, term_frequency), ...]} with entry indexes ascending.
+    # term_counts (entry_terms() per entry, in order) skips tokenizing the entries again.
+    postings = defaultdict(list)
+    if term_counts is None:
+        term_counts = map(entry_terms, entries)
+    for index, counts in enumerate(term_counts):
+        for term, frequency in counts.items():
+            postings[term].append((index, frequency))
+    return postings
+
+def encode_shard(terms):
+    # Encode [(term, postings)] (sorted by term) into the binary shard layout above.
+    dictionary = bytearray(SHARD_MAGIC)
+    encode_varint(len(terms), dictionary)
+    blocks = bytearray()
+    previous = b""
+    for term, postings in terms:
+        term_bytes = term.encode("utf-8")
+        shared = 0
+        limit = min(len(previous), len(term_bytes))
+        while shared < limit and previous[shared] == term_bytes[shared]:
+            shared += 1
+        block = bytearray()
+        last_index = 0
+        for index, frequency in postings:
+            encode_varint(index - last_index, block)
+            encode_varint(frequency, block)
+            last_index = index
+        encode_varint(shared, dictionary)
+        encode_varint(len(term_bytes) - shared, dictionary)
+        dictionary += term_bytes[shared:]
+        encode_varint(len(postings), dictionary)
+        encode_varint(len(block), dictionary)
+        blocks += block
+        previous = term_bytes
+    return bytes(dictionary + blocks)
+
+def decode_shard(data):
+    # Decode a shard into a sorted list of (term, postings) pairs.
+    if data[:4] != SHARD_MAGIC:
+        raise ValueError("Not a search index shard")
+    count, pos = decode_varint(data, 4)
+    header = []
+    previous = b""
+    for _ in range(count):
+        shared, pos = decode_varint(data, pos)
+        suffix_length, pos = decode_varint(data, pos)
+        term_bytes = previous[:shared] + data[pos:pos + suffix_length]
+        pos += suffix_length
+        doc_frequency, pos = decode_varint(data, pos)
+        block_length, pos = decode_varint(data, pos)
+        header.append((term_bytes.decode("utf-8"), doc_frequency, block_length))
+        previous = term_bytes
+    terms = []
+    for term, doc_frequency, block_length in header:
+        postings = []
+        index = 0
+        end = pos + block_length
+        while pos < end:
+            delta, pos = decode_varint(data, pos)
+            frequency, pos = decode_varint(data, pos)
+            index += delta
+            postings.append((index, frequency))
+        terms.append((term, postings))
+    return terms
+
+def build_search_index(manuscript_path=MANUSCRIPT_PATH, output_dir=SEARCH_DIR, entries=None, term_counts=None):
+    # Write one binary shard per term prefix plus search/meta.json listing the shards with
+    # their content hashes. Unchanged shards are not rewritten; obsolete ones are removed.
+    # entries (already parsed) replaces reading manuscript_path; term_counts see build_postings.
+    # Returns {'documents', 'terms', 'shards', 'written'} counts.
+    os.makedirs(output_dir, exist_ok=True)
+    if entries is None:
+        entries = list(iter_entries(manuscript_path))
+    postings = build_postings(entries, term_counts)
+
+    by_shard = defaultdict(list)
+    for term in sorted(postings):
+        by_shard[shard_key(term)].append((term, postings[term]))
+
+    shards = {}
+    written = 0
+    for key, terms in by_shard.items():
+        data = encode_shard(terms)
+        name = shard_filename(key)
+        path = os.path.join(output_dir, name)
+        shards[key] = {"file": name, "terms": len(terms), "bytes": len(data),
+                       "hash": hashlib.sha256(data).hexdigest()[:12]}
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    continue
+        with open(path, "wb") as f:
+            f.write(data)
+        written += 1
+
+    current = {info["file"] for info in shards.values()}
+    for name in os.listdir(output_dir):
+        if name.endswith(".bin") and name not in current:
+            os.remove(os.path.join(output_dir, name))
+
+    meta = {"version": 1, "prefix_length": PREFIX_LENGTH, "documents": len(entries),
+            "shards": dict(sorted(shards.items()))}
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+    return {"documents": len(entries), "terms": len(postings), "shards": len(shards), "written": written}
+
+@lru_cache(maxsize=64)
+def _load_shard(path, content_hash):
+    # content_hash is part of the cache key so rebuilt shards are re-read
+    with open(path, "rb") as f:
+        return decode_shard(f.read())
+
+def _load_meta(index_dir):
+    with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def lookup(term, index_dir=SEARCH_DIR, prefix=False, meta=None):
+    # Return {entry_index: term_frequency} for a term (or all terms starting with it),
+    # reading only the shard for its prefix.
+    meta = meta or _load_meta(index_dir)
+    info = meta["shards"].get(shard_key(term))
+    if not info:
+        return {}
+    matches = {}
+    for candidate, postings in _load_shard(os.path.join(index_dir, info["file"]), info["hash"]):
+        if candidate == term or (prefix and candidate.startswith(term)):
+            for index, frequency in postings:
+                matches[index] = matches.get(index, 0) + frequency
+    return matches
+
+def search(query, index_dir=SEARCH_DIR):
+    # Return entry indexes containing every query term, best match first. The last term
+    # also matches as a prefix (when at least PREFIX_LENGTH characters long) for partial names.
+    terms = tokenize(query)
+    if not terms:
+        return []
+    meta = _load_meta(index_dir)
+    scores = None
+    for position, term in enumerate(terms):
+        as_prefix = position == len(terms) - 1 and len(term) >= PREFIX_LENGTH
+        matches = lookup(term, index_dir, prefix=as_prefix, meta=meta)
+        if scores is None:
+            scores = matches
+        else:
+            scores = {index: scores[index] + frequency for index, frequency in matches.items() if index in scores}
+        if not scores:
+            return []
+    return sorted(scores, key=lambda index: (-scores[index], index))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(search(" ".join(sys.argv[1:])))
+    else:
+        stats = build_search_index()
+        print(f"Search index built: {stats['documents']} entries, {stats['terms']} terms in "
+              f"{stats['shards']} shard(s), {stats['written']} written → {SEARCH_DIR}")
@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import select
+import struct
+import argparse
+from datetime import datetime
+
+# Sibling scripts are importable both when run directly and as scripts.watch
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from entries import (ENTRIES_DIR, MANUSCRIPT_PATH, ROOT_DIR, ManuscriptCache, entry_title, find_unannounced_entries,
+                     load_announced_manifest, mark_announced, write_entry_shards)
+from generate_sitemap import CACHE_FILE, EXCLUDED_DIRS, OUTPUT_FILE, find_html_files, write_sitemaps
+from search_index import SEARCH_DIR, build_search_index, entry_terms
+
+NEWSLETTER_CACHE_DIR = os.path.join(ROOT_DIR, ".newsletter-cache")
+DEBOUNCE_SECONDS = 0.15
+POLL_INTERVAL_SECONDS = 0.5
+
+# inotify(7) event bits
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+def watched_directories(root_dir, skip=()):
+    # The manuscript and page directories under root_dir, without hidden, test or output ones.
+    skip = {os.path.abspath(path) for path in skip}
+    directories = []
+    for dirpath, dirnames, _ in os.walk(root_dir):
+        dirnames[:] = [d for d in dirnames if d not in EXCLUDED_DIRS and not d.startswith('.')
+                       and os.path.abspath(os.path.join(dirpath, d)) not in skip]
+        directories.append(os.path.abspath(dirpath))
+    return directories
+
+class InotifyWatcher:
+    # Linux inotify through libc (no third-party watcher needed). Directories are watched rather
+    # than files so editors that save by writing a new file and renaming it are still seen.
+    def __init__(self, directories, skip=()):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.skip = {os.path.abspath(path) for path in skip}
+        self.watches = {}
+        for directory in directories:
+            self.add(directory)
+
+    def add(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = directory
+
+    def wait(self, timeout=None):
+        # Return the set of changed paths, or an empty set if nothing changed within timeout.
+        # A queue overflow is reported as the watched directories themselves.
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 65536)
+        changed = set()
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self.watches.values())
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                basename = os.path.basename(path)
+                if basename not in EXCLUDED_DIRS and not basename.startswith('.') and path not in self.skip:
+                    self.add(path)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    # Fallback for platforms without inotify: compares (mtime, size) of the manuscript and the
+    # HTML pages every interval seconds.
+    def __init__(self, root_dir, manuscript_path, interval=POLL_INTERVAL_SECONDS, sleep=time.sleep):
+        self.root_dir = root_dir
+        self.manuscript_path = os.path.abspath(manuscript_path)
+        self.interval = interval
+        self.sleep = sleep
+        self.state = self.snapshot()
+
+    def snapshot(self):
+        paths = [self.manuscript_path] + [os.path.join(self.root_dir, name) for name in find_html_files(self.root_dir)]
+        state = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                state[os.path.abspath(path)] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                pass
+        return state
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.snapshot()
+            changed = {path for path in set(current) | set(self.state) if current.get(path) != self.state.get(path)}
+            self.state = current
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            self.sleep(self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+def open_watcher(root_dir, manuscript_path, skip=(), poll=False):
+    # inotify where available, polling otherwise (or when poll is set).
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            directories = watched_directories(root_dir, skip)
+            manuscript_dir = os.path.dirname(os.path.abspath(manuscript_path))
+            if manuscript_dir not in directories:
+                directories.append(manuscript_dir)
+            return InotifyWatcher(directories, skip)
+        except OSError as e:
+            print(f"# WARNING: inotify unavailable ({e}); falling back to polling.")
+    return PollingWatcher(root_dir, manuscript_path)
+
+class SiteBuilder:
+    # Keeps the parsed manuscript, per-entry search terms and newsletter baseline in memory and
+    # rebuilds only the outputs a change affects: entry shards, the search index and the
+    # newsletter queue for manuscript edits, the sitemap for added, removed or edited pages.
+    def __init__(self, root_dir=ROOT_DIR, manuscript_path=MANUSCRIPT_PATH, entries_dir=ENTRIES_DIR, search_dir=SEARCH_DIR,
+                 sitemap_file=OUTPUT_FILE, sitemap_cache_file=CACHE_FILE, announced_manifest=None, queue_dir=NEWSLETTER_CACHE_DIR):
+        self.root_dir = root_dir
+        self.manuscript_path = os.path.abspath(manuscript_path)
+        self.entries_dir = entries_dir
+        self.search_dir = search_dir
+        self.sitemap_file = sitemap_file
+        self.sitemap_cache_file = sitemap_cache_file
+        self.announced_manifest = announced_manifest or os.environ.get('NEWSLETTER_ANNOUNCED_MANIFEST') or \
+            os.path.join(NEWSLETTER_CACHE_DIR, 'announced.json')
+        self.queue_dir = queue_dir
+        self.manuscript = ManuscriptCache(self.manuscript_path)
+        self.term_counts = []
+        self.baseline = None
+
+    def output_dirs(self):
+        return [self.entries_dir, self.search_dir, self.queue_dir]
+
+    def build_all(self):
+        return self.rebuild(manuscript=True, pages=True)
+
+    def handle(self, paths):
+        # Rebuild what the changed paths affect. A directory (or an overflowed watch queue,
+        # reported as its directories) may hide any change inside it.
+        manuscript = self.manuscript_path in paths or os.path.dirname(self.manuscript_path) in paths
+        pages = any(os.path.splitext(path)[1] in ('.html', '') for path in paths)
+        return self.rebuild(manuscript=manuscript, pages=pages)
+
+    def rebuild(self, manuscript=False, pages=False):
+        # Returns the report line (also printed), or None when there was nothing to do.
+        started = time.perf_counter()
+        report = []
+        if manuscript:
+            report.append(self.update_entries())
+        if pages:
+            report.append(self.update_sitemap())
+        if not report:
+            return None
+        line = (f"[{datetime.now().strftime('%H:%M:%S')}] Rebuilt in {(time.perf_counter() - started) * 1000:.0f} ms: "
+                + "; ".join(report))
+        print(line)
+        return line
+
+    def update_entries(self):
+        previous_count = len(self.manuscript.entries)
+        first_changed, reparsed = self.manuscript.refresh()
+        entries = self.manuscript.entries
+        if first_changed == len(entries) == previous_count and reparsed == 0:
+            return "manuscript unchanged"
+        self.term_counts = self.term_counts[:first_changed] + [entry_terms(entry) for entry in entries[first_changed:]]
+        shards = write_entry_shards(entries, self.entries_dir)
+        search = build_search_index(output_dir=self.search_dir, entries=entries, term_counts=self.term_counts)
+        queued = self.update_queue(entries)
+        return (f"re-parsed {reparsed} of {len(entries)} entries, {shards['written']} entry shard(s) written, "
+                f"{shards['removed']} removed, {search['written']} search shard(s) written, "
+                f"{queued} entr{'y' if queued == 1 else 'ies'} queued for the newsletter")
+
+    def update_queue(self, entries):
+        # Write the newsletter the next send would mail (queue.json, queue.html) without sending
+        # it. Without an announced-entries manifest the entries present at startup count as
+        # announced, like the sender's own first run.
+        from newsletter import build_entries_newsletter
+        announced = load_announced_manifest(self.announced_manifest)
+        if announced is None:
+            if self.baseline is None:
+                self.baseline = mark_announced({}, [(index, entry, 'new') for index, entry in enumerate(entries)])
+            announced = self.baseline
+        changes = find_unannounced_entries(entries, announced)
+        os.makedirs(self.queue_dir, exist_ok=True)
+        queue = {'count': len(changes), 'subject': None,
+                 'entries': [{'index': index, 'title': entry_title(entry), 'status': status} for index, entry, status in changes]}
+        html_path = os.path.join(self.queue_dir, 'queue.html')
+        if changes:
+            queue['subject'], content_html = build_entries_newsletter(changes)
+            with open(html_path, 'w', encoding='utf-8') as f:
+                f.write(content_html)
+        elif os.path.exists(html_path):
+            os.remove(html_path)
+        tmp_path = os.path.join(self.queue_dir, 'queue.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(queue, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.queue_dir, 'queue.json'))
+        return len(changes)
+
+    def update_sitemap(self):
+        html_files = find_html_files(self.root_dir)
+        written = write_sitemaps(html_files, output_file=self.sitemap_file, root_dir=self.root_dir,
+                                 cache_file=self.sitemap_cache_file)
+        return f"sitemap with {len(html_files)} URL(s), {len(written)} file(s) updated"
+
+def watch(builder, watcher, debounce=DEBOUNCE_SECONDS, rebuilds=None):
+    # Build everything once, then rebuild after each burst of changes once the tree has been
+    # quiet for debounce seconds. Stops after rebuilds rebuilds when given (for tests).
+    builder.build_all()
+    done = 0
+    while rebuilds is None or done < rebuilds:
+        changed = watcher.wait()
+        while True:
+            more = watcher.wait(debounce)
+            if not more:
+                break
+            changed |= more
+        if builder.handle(changed):
+            done += 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild entry shards, the search index, the sitemap and the "
+                                                 "newsletter queue as the manuscript and pages change.")
+    parser.add_argument("--debounce-ms", type=float, default=DEBOUNCE_SECONDS * 1000, help="quiet period before a rebuild")
+    parser.add_argument("--poll", action="store_true", help="poll for changes instead of using inotify")
+    parser.add_argument("--once", action="store_true", help="build once and exit")
+    args = parser.parse_args()
+
+    builder = SiteBuilder()
+    if args.once:
+        builder.build_all()
+        return
+    watcher = open_watcher(ROOT_DIR, builder.manuscript_path, skip=builder.output_dirs(), poll=args.poll)
+    print(f"Watching {os.path.relpath(builder.manuscript_path, ROOT_DIR)} and the site's pages (Ctrl+C to stop)...")
+    try:
+        watch(builder, watcher, debounce=args.debounce_ms / 1000)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.close()
+
+if __name__ == "__main__":
+    main()
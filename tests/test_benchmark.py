@@ -0,0 +1,30 @@
+# tests/test_benchmark.py
+# Smoke test for the offline benchmark harness and its local Graph/token stand-ins
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path for importing benchmark.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from scripts.benchmark import run_send_benchmark
+
+def test_send_benchmark_against_stand_ins():
+    print("\n1. Testing send benchmark against local stand-ins...")
+    result = run_send_benchmark({"recipients": 2500, "throttle_rate": 0.2, "concurrency": 2})
+    assert result["error"] is None, result["error"]
+    assert result["server"]["recipients"] == 2500, "Every recipient should reach the stand-in exactly once."
+    assert result["server"]["throttled"] == result["engine"]["retries"] > 0, "Injected 429s should be retried."
+    assert result["token_fetches"] == result["server"]["token_fetches"] == 1
+    assert result["firestore_pages"] == 6
+    assert result["p50_ms"] is not None and result["p99_ms"] >= result["p50_ms"]
+
+    # Messages over the recipient cap are rejected and reported, not retried
+    result = run_send_benchmark({"recipients": 120, "chunk_size": 100, "recipient_cap": 60})
+    assert result["server"]["rejected"] == 1 and result["engine"]["failed_recipients"] == 100
+    assert result["error"] and "100 of 120" in result["error"]
+    print("Send benchmark test completed successfully.")
+
+if __name__ == "__main__":
+    print("Starting benchmark tests...")
+    test_send_benchmark_against_stand_ins()
+    print("\nAll benchmark tests completed successfully!")
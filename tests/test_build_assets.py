@@ -0,0 +1,110 @@
+# tests/test_build_assets.py
+# Static asset pipeline: content-hashed URLs, precompressed variants and incremental rebuilds
+
+import os
+import sys
+import gzip
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+# Add parent directory to Python path for importing build_assets.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from scripts.build_assets import build_assets, collect_glyphs, FONT_PATH, STYLESHEET_PATH, SCRIPT_PATH, PAGE_PATH
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+def make_site_root(tmp):
+    # Copy the real site inputs into a scratch root
+    for rel_path in [FONT_PATH, STYLESHEET_PATH, SCRIPT_PATH, PAGE_PATH, "src/Fantasy.txt", "robots.txt"]:
+        os.makedirs(os.path.join(tmp, os.path.dirname(rel_path)), exist_ok=True)
+        shutil.copy(REPO_ROOT / rel_path, os.path.join(tmp, rel_path))
+    return tmp
+
+def test_build_assets_hashes_and_rewrites():
+    print("\n1. Testing asset pipeline output...")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = make_site_root(os.path.join(tmp, 'root'))
+        site = os.path.join(tmp, 'site')
+        build_assets(root, site)
+
+        with open(os.path.join(site, 'asset-manifest.json'), encoding='utf-8') as f:
+            assets = json.load(f)['assets']
+        with open(os.path.join(site, 'index.html'), encoding='utf-8') as f:
+            html = f.read()
+        for rel_path in (STYLESHEET_PATH, SCRIPT_PATH):
+            assert f'"{assets[rel_path]}"' in html, f"index.html should reference the hashed {rel_path}."
+            assert os.path.exists(os.path.join(site, assets[rel_path]))
+            with gzip.open(os.path.join(site, assets[rel_path] + '.gz'), 'rb') as f:
+                with open(os.path.join(site, assets[rel_path]), 'rb') as original:
+                    assert f.read() == original.read()
+        with open(os.path.join(site, assets[STYLESHEET_PATH]), encoding='utf-8') as f:
+            assert f"url('../{assets[FONT_PATH]}')" in f.read(), "The stylesheet should load the hashed font."
+        assert os.path.exists(os.path.join(site, 'robots.txt'))
+    print("Asset pipeline output test completed successfully.")
+
+def test_build_assets_incremental():
+    print("\n2. Testing incremental asset rebuilds...")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = make_site_root(os.path.join(tmp, 'root'))
+        site = os.path.join(tmp, 'site')
+        build_assets(root, site)
+        assert build_assets(root, site)['written'] == 0, "A rebuild with unchanged inputs should write nothing."
+
+        with open(os.path.join(site, 'asset-manifest.json'), encoding='utf-8') as f:
+            before = json.load(f)['assets']
+        with open(os.path.join(root, SCRIPT_PATH), 'a', encoding='utf-8') as f:
+            f.write("\n// changed\n")
+        build_assets(root, site)
+        with open(os.path.join(site, 'asset-manifest.json'), encoding='utf-8') as f:
+            after = json.load(f)['assets']
+
+        assert after[SCRIPT_PATH] != before[SCRIPT_PATH], "Changed script must get a new hashed name."
+        assert after[STYLESHEET_PATH] == before[STYLESHEET_PATH] and after[FONT_PATH] == before[FONT_PATH]
+        assert not os.path.exists(os.path.join(site, before[SCRIPT_PATH])), "Superseded assets should be removed."
+    print("Incremental asset rebuild test completed successfully.")
+
+def test_build_assets_prunes_passthrough():
+    print("\n3. Testing pass-through pruning...")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = make_site_root(os.path.join(tmp, 'root'))
+        site = os.path.join(tmp, 'site')
+        for rel_path in ['entries/000.json', 'entries/001.json', 'search/terms-a.json', 'search/terms-b.json']:
+            os.makedirs(os.path.join(root, os.path.dirname(rel_path)), exist_ok=True)
+            with open(os.path.join(root, rel_path), 'w', encoding='utf-8') as f:
+                f.write('{}')
+        for name in ['sitemap-1.xml.gz', 'sitemap-2.xml.gz']:
+            with open(os.path.join(root, name), 'wb') as f:
+                f.write(gzip.compress(b'<urlset/>'))
+        build_assets(root, site)
+        assert os.path.exists(os.path.join(site, 'entries', '001.json.gz'))
+        assert os.path.exists(os.path.join(site, 'sitemap-2.xml.gz'))
+
+        os.remove(os.path.join(root, 'entries', '001.json'))
+        shutil.rmtree(os.path.join(root, 'search'))
+        os.remove(os.path.join(root, 'sitemap-2.xml.gz'))
+        os.remove(os.path.join(root, 'robots.txt'))
+        build_assets(root, site)
+
+        assert os.path.exists(os.path.join(site, 'entries', '000.json')), "Current shards must be kept."
+        assert os.path.exists(os.path.join(site, 'sitemap-1.xml.gz'))
+        leftovers = [p for p in ['entries/001.json', 'entries/001.json.gz', 'search', 'sitemap-2.xml.gz',
+                                 'robots.txt', 'robots.txt.gz'] if os.path.exists(os.path.join(site, p))]
+        assert not leftovers, f"Deleted pass-through outputs should be pruned, found {leftovers}."
+        assert os.path.exists(os.path.join(site, PAGE_PATH)), "Pruning must not touch the built page."
+    print("Pass-through pruning test completed successfully.")
+
+def test_collect_glyphs():
+    print("\n4. Testing glyph collection...")
+    glyphs = collect_glyphs(str(REPO_ROOT))
+    assert "●" in glyphs and "’" in glyphs and "A" in glyphs
+    assert "\n" not in glyphs
+    print("Glyph collection test completed successfully.")
+
+if __name__ == "__main__":
+    print("Starting asset pipeline tests...")
+    for test_func in [test_build_assets_hashes_and_rewrites, test_build_assets_incremental, test_build_assets_prunes_passthrough,
+                      test_collect_glyphs]:
+        test_func()
+    print("\nAll asset pipeline tests completed successfully!")
@@ -0,0 +1,252 @@
+# tests/test_campaigns.py
+# Checks campaign manifests, segment filters and the shared multi-campaign runner
+
+import os
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+# Add parent directory to Python path for importing campaigns.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent))
+from scripts.campaigns import Segment, RecipientCache, load_campaigns, run_campaigns, interleave
+# The runner imports its sibling scripts as top-level modules; register sources there
+from newsletter import RECIPIENT_SOURCES, SendEngine, QuotaScheduler
+from test_newsletter import FakeGraphSession
+
+class FakeTokenProvider:
+    session = None
+    def __init__(self):
+        self.calls = 0
+    def get_token(self):
+        self.calls += 1
+        return 'token'
+    def invalidate(self):
+        pass
+
+class RecordingGraphSession(FakeGraphSession):
+    # Also records the subject of each message in the order the $batch calls arrive
+    def __init__(self):
+        super().__init__()
+        self.subjects = []
+    def post(self, url, headers=None, data=None, **kwargs):
+        payload = json.loads(data)
+        self.subjects.append([req['body']['message']['subject'] for req in payload['requests']])
+        return super().post(url, headers=headers, data=data, **kwargs)
+
+def write_manifest(tmp, campaigns):
+    path = os.path.join(tmp, 'campaigns.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'campaigns': campaigns}, f)
+    return path
+
+def test_segments_and_manifest_validation():
+    print("\n1. Testing campaign segments and manifest validation...")
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'vip.csv'), 'w', encoding='utf-8') as f:
+            f.write("email,name\nAnn@Example.com,Ann\nbob@example.org,Bob\n")
+        segment = Segment({'include': 'vip.csv', 'exclude_domains': ['Example.ORG']}, tmp)
+        assert segment("Ann@example.com") and not segment("bob@example.org") and not segment("cy@example.com")
+        segment = Segment({'domains': ['example.com'], 'match': r'^reader\d+@'})
+        assert segment("reader7@example.com") and not segment("writer@example.com") and not segment("reader7@example.org")
+        assert Segment()("anyone@example.net"), "An empty segment matches everyone."
+
+        with open(os.path.join(tmp, 'note.html'), 'w', encoding='utf-8') as f:
+            f.write("<p>{timestamp}</p>")
+        for spec, message in [({'content_html': '<p>Hi</p>'}, "no subject"),
+                              ({'subject': 'Hi'}, "needs a template or content_html"),
+                              ({'subject': 'Hi', 'template': 'missing.html'}, "does not exist"),
+                              ({'subject': 'Hi', 'content_html': 'x', 'delivery_mode': 'single'}, "'bcc' or 'individual'"),
+                              ({'subject': 'Hi', 'content_html': 'x', 'segment': {'country': 'NZ'}}, "Unknown segment rule"),
+                              ({'subject': 'Hi', 'content_html': 'x', 'id': '../escape'}, "may only contain"),
+                              ({'subject': 'Hi', 'content_html': 'x', 'id': 'news', 'segment': {'domains': 'example.com'}},
+                               "Campaign 'news': Segment rule 'domains' must be a list"),
+                              ({'subject': 'Hi', 'content_html': 'x', 'segment': {'exclude_domains': [3]}}, "must be a list"),
+                              ({'subject': 'Hi', 'content_html': 'x', 'id': 'news', 'segment': {'match': '(unclosed'}},
+                               "Campaign 'news': Segment rule 'match' is not a valid regular expression")]:
+            try:
+                load_campaigns(write_manifest(tmp, [spec]))
+                assert False, f"Expected a ValueError mentioning {message!r}"
+            except ValueError as e:
+                assert message in str(e), str(e)
+        try:
+            load_campaigns(write_manifest(tmp, [{'id': 'a', 'subject': 'A', 'content_html': 'x'},
+                                                {'id': 'a', 'subject': 'B', 'template': 'note.html'}]))
+            assert False, "Duplicate ids should be rejected."
+        except ValueError as e:
+            assert "Duplicate campaign id(s)" in str(e)
+    assert list(interleave([[1, 2, 3], [], ['a'], ['x', 'y']])) == [1, 'a', 'x', 2, 'y', 3]
+
+    # Readers share one pass over the source and only the gap between them is kept
+    pulled = []
+    def source():
+        for i in range(1000):
+            pulled.append(i)
+            yield i
+    cache = RecipientCache(source())
+    fast, slow = cache.readers(2)
+    for step in range(1000):
+        assert next(fast) == step
+        if step % 2:
+            assert next(slow) == step // 2
+        assert len(cache._buffer) <= step // 2 + 1
+    assert list(slow) == list(range(500, 1000)) and list(fast) == []
+    assert cache.loaded == len(pulled) == 1000 and len(cache._buffer) == 0
+    print("Campaign manifest test completed successfully.")
+
+def test_campaign_runner_shares_startup():
+    print("\n2. Testing multi-campaign runner...")
+    loads = []
+    def counting_source():
+        loads.append(1)
+        for i in range(200):
+            yield f"reader{i}@{'example.com' if i % 2 else 'example.org'}"
+        yield "reader3@example.com" # Duplicates are dropped once for every campaign
+        yield "not-an-address"
+    RECIPIENT_SOURCES['campaign-test'] = counting_source
+    saved = {key: os.environ.pop(key, None) for key in ('NEWSLETTER_JOURNAL_DIR', 'NEWSLETTER_QUOTA_DIR', 'NEWSLETTER_SUPPRESSION_LIST')}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'announcement.html'), 'w', encoding='utf-8') as f:
+                f.write("<h1>{headline}</h1><p>Sent {timestamp}</p>")
+            with open(os.path.join(tmp, 'personal.html'), 'w', encoding='utf-8') as f:
+                f.write("<p>Hello {recipient_email}</p>")
+            with open(os.path.join(tmp, 'opted-out.txt'), 'w', encoding='utf-8') as f:
+                f.write("".join(f"reader{i}@example.com\n" for i in range(1, 20, 2)))
+            manifest = write_manifest(tmp, [
+                {'id': 'announcement', 'subject': "Announcement", 'template': 'announcement.html',
+                 'context': {'headline': "New entries"}, 'chunk_size': 2, 'segment': {'exclude': 'opted-out.txt'}},
+                {'id': 'digest', 'subject': "Digest", 'content_html': "<p>This week</p>", 'chunk_size': 5,
+                 'segment': {'domains': ['example.org']}},
+                {'subject': "Personal", 'template': 'personal.html', 'segment': {'match': r'^reader1'}},
+            ])
+            journal_dir = os.path.join(tmp, 'journal')
+
+            def run():
+                provider = FakeTokenProvider()
+                engines = []
+                def engine_factory():
+                    engines.append(SendEngine(token_provider=provider, session=RecordingGraphSession(), max_workers=1))
+                    return engines[0]
+                campaigns = load_campaigns(manifest)
+                stats = run_campaigns(campaigns, 'sender@example.com', token_provider=provider,
+                                      recipient_source='campaign-test', engine_factory=engine_factory,
+                                      journal_dir=journal_dir)
+                return campaigns, stats, engines[0].session
+
+            campaigns, stats, session = run()
+            assert len(loads) == 1, "Recipients should be loaded once for every campaign."
+            assert stats['announcement'] == {'sent': 190, 'failed': 0, 'messages': 95, 'deferred': False}
+            assert stats['digest'] == {'sent': 100, 'failed': 0, 'messages': 20, 'deferred': False}
+            # reader1, reader10..19 and reader100..199
+            assert stats['campaign 3'] == {'sent': 111, 'failed': 0, 'messages': 111, 'deferred': False}
+            assert campaigns[2].delivery_mode == 'individual', "Per-recipient templates are sent individually."
+            assert session.bodies[('reader11@example.com',)] == "<p>Hello reader11@example.com</p>"
+
+            # Batches are taken from each campaign in turn, so the small digest goes out second
+            first = [subjects[0] for subjects in session.subjects]
+            assert first == ["Announcement", "Digest", "Personal"] + ["Announcement", "Personal"] * 4 + ["Personal"], first
+            assert all(len(set(subjects)) == 1 for subjects in session.subjects), "A batch holds one campaign's messages."
+            assert session.batch_calls == 5 + 1 + 6
+
+            # A rerun resumes every campaign's journal and sends nothing twice
+            campaigns, stats, session = run()
+            assert session.batch_calls == 0
+            assert [campaign.journal.skipped for campaign in campaigns] == [190, 100, 111]
+    finally:
+        RECIPIENT_SOURCES.pop('campaign-test', None)
+        for key, value in saved.items():
+            if value is not None:
+                os.environ[key] = value
+    print("Multi-campaign runner test completed successfully.")
+
+def test_campaigns_share_quota():
+    print("\n3. Testing a daily quota shared across campaigns...")
+    RECIPIENT_SOURCES['campaign-quota-test'] = lambda: (f"reader{i:03d}@{'example.com' if i % 2 else 'example.org'}"
+                                                        for i in range(200))
+    saved = {key: os.environ.pop(key, None) for key in ('NEWSLETTER_JOURNAL_DIR', 'NEWSLETTER_QUOTA_DIR', 'NEWSLETTER_SUPPRESSION_LIST')}
+    now = [1_000_000.0]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = write_manifest(tmp, [
+                {'id': 'everyone', 'subject': "Everyone", 'content_html': "<p>All</p>", 'chunk_size': 10},
+                {'id': 'org', 'subject': "Org", 'content_html': "<p>Org</p>", 'chunk_size': 10,
+                 'segment': {'domains': ['example.org']}},
+            ])
+            journal_dir = os.path.join(tmp, 'journal')
+            state_path = os.path.join(tmp, 'quota', 'quota.json')
+
+            def run(reject=()):
+                provider = FakeTokenProvider()
+                session = FakeGraphSession(reject=reject)
+                # An hour passes as soon as the allowance runs out, refilling five recipients
+                schedulers = []
+                def clock():
+                    return now[0] + (3600 if schedulers and schedulers[0].deferred else 0)
+                scheduler = QuotaScheduler(state_path, messages_per_minute=1000, recipients_per_day=120,
+                                           clock=clock, sleep=lambda delay: None)
+                schedulers.append(scheduler)
+                campaigns = load_campaigns(manifest)
+                try:
+                    stats = run_campaigns(campaigns, 'sender@example.com', token_provider=provider,
+                                          recipient_source='campaign-quota-test', journal_dir=journal_dir, scheduler=scheduler,
+                                          engine_factory=lambda: SendEngine(token_provider=provider, session=session))
+                except Exception as e:
+                    stats = str(e)
+                return campaigns, stats, scheduler
+
+            # Day one: 'everyone' uses the whole allowance and 'org' gets nothing, even though
+            # the allowance refills a little while the run goes on
+            campaigns, stats, scheduler = run()
+            assert stats['everyone'] == {'sent': 120, 'failed': 0, 'messages': 12, 'deferred': True}, stats
+            assert stats['org'] == {'sent': 0, 'failed': 0, 'messages': 0, 'deferred': True}, stats
+
+            # Day two: 'everyone' finishes its last 80 and 'org' starts with what is left
+            now[0] += 86400
+            campaigns, stats, scheduler = run()
+            assert stats['everyone'] == {'sent': 80, 'failed': 0, 'messages': 8, 'deferred': False}, stats
+            assert stats['org'] == {'sent': 40, 'failed': 0, 'messages': 4, 'deferred': True}, stats
+            assert campaigns[0].journal.skipped == 120
+
+            # Day three: 'org' resumes after the 40 it already sent; a rejected message is refunded
+            now[0] += 86400
+            campaigns, stats, scheduler = run(reject={'reader080@example.org'})
+            assert "Failed to send to 10 recipient(s) in 1 campaign(s): org" in stats, stats
+            assert campaigns[0].journal.skipped == 200 and campaigns[1].journal.skipped == 40
+            assert campaigns[1].stats == {'sent': 50, 'failed': 10, 'messages': 5}
+            assert scheduler.allowance() == 120 - 50, "Recipients of the failed message get their allowance back."
+    finally:
+        RECIPIENT_SOURCES.pop('campaign-quota-test', None)
+        for key, value in saved.items():
+            if value is not None:
+                os.environ[key] = value
+    print("Shared quota test completed successfully.")
+
+def test_recipient_cache_bounded_for_sparse_segments():
+    print("\n4. Testing the recipient cache with a sparse segment...")
+    with tempfile.TemporaryDirectory() as tmp:
+        broad, sparse = load_campaigns(write_manifest(tmp, [
+            {'id': 'everyone', 'subject': "Everyone", 'content_html': "<p>All</p>"},
+            {'id': 'nomatch', 'subject': "Nobody", 'content_html': "<p>None</p>", 'segment': {'domains': ['nomatch.org']}}]))
+    for campaign in (broad, sparse):
+        campaign.prepare()
+    # The sparse campaign scans the whole list for its first batch while the broad one has sent one
+    cache = RecipientCache((f"reader{i}@example.com" for i in range(100000)), max_buffered=5000)
+    batches = interleave(campaign.batches(reader, 'sender@example.com')
+                         for campaign, reader in zip((broad, sparse), cache.readers(2)))
+    sent = 0
+    for payload, groups, handler in batches:
+        sent += sum(len(group) for group in groups.values())
+        assert len(cache._buffer) <= 5000, f"The cache holds {len(cache._buffer)} addresses in memory."
+    assert sent == 100000 and broad.exhausted and sparse.exhausted
+    assert cache.loaded == 100000 and cache.spilled > 90000
+    assert len(cache._buffer) == 0 and cache._spill is None, "Finished readers should release the cache."
+    print("Sparse segment recipient cache test completed successfully.")
+
+if __name__ == "__main__":
+    print("Starting campaign tests...")
+    for test_func in [test_segments_and_manifest_validation, test_campaign_runner_shares_startup,
+                      test_campaigns_share_quota, test_recipient_cache_bounded_for_sparse_segments]:
+        test_func()
+    print("\nAll campaign tests completed successfully!")
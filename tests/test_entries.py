@@ -0,0 +1,112 @@
+# tests/test_entries.py
+# Checks that the Python entry splitting matches the reader page's rules in scripts/script.js
+
+import os
+import sys
+import json
+import random
+import tempfile
+from pathlib import Path
+
+# Add parent directory to Python path for importing entries.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from scripts.entries import preprocess_text, split_entries, entry_title, load_entries, MANUSCRIPT_PATH
+from scripts.entries import iter_preprocessed, iter_split_entries, build_entry_shards, ManuscriptCache
+
+def test_split_entries_matches_reader_rules():
+    print("\n1. Testing entry splitting...")
+    text = "Preamble\n●\n\n“Title One.”\n\nLine one\nline two.\n\n●  \n“Title Two.”\nBody\n\n●\n"
+    entries = split_entries(preprocess_text(text))
+    assert entries == ["Preamble", "●\n\n“Title One.”\n\nLine one line two.", "●   “Title Two.” Body", "●"]
+    assert entry_title(entries[1]) == "“Title One.”"
+    print("Entry splitting test completed successfully.")
+
+def test_manuscript_entries():
+    print("\n2. Testing manuscript entries...")
+    entries = load_entries(MANUSCRIPT_PATH)
+    assert entries, "Fantasy.txt should contain entries."
+    assert all(entry.startswith("●") for entry in entries), "Every entry should begin with the marker."
+    print(f"Manuscript entries test completed successfully ({len(entries)} entries).")
+
+def test_streaming_split_matches_whole_text():
+    print("\n3. Testing streaming entry splitting...")
+    rng = random.Random(1234)
+    alphabet = ['a', 'b', ' ', '\n', '\n', '\n', '●', 'xyz']
+    for _ in range(2000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        lines = text.splitlines(keepends=True)
+        assert ''.join(iter_preprocessed(lines)) == preprocess_text(text), repr(text)
+        assert list(iter_split_entries(iter_preprocessed(lines))) == split_entries(preprocess_text(text)), repr(text)
+    print("Streaming entry splitting test completed successfully.")
+
+def test_entry_shards_rebuild_only_changed():
+    print("\n4. Testing entry shard build...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manuscript = os.path.join(tmp, 'Fantasy.txt')
+        output_dir = os.path.join(tmp, 'entries')
+        with open(manuscript, 'w', encoding='utf-8') as f:
+            f.write("●\n\n“One.”\n\nFirst\nbody.\n\n●\n\n“Two.”\n\nSecond body.\n\n●\n\n“Three.”\n\nThird.\n")
+        assert build_entry_shards(manuscript, output_dir) == {'entries': 3, 'written': 3, 'removed': 0}
+        assert build_entry_shards(manuscript, output_dir)['written'] == 0, "Unchanged entries must not be rewritten."
+
+        with open(manuscript, 'w', encoding='utf-8') as f:
+            f.write("●\n\n“One.”\n\nFirst\nbody.\n\n●\n\n“Two.”\n\nSecond body, revised.\n")
+        assert build_entry_shards(manuscript, output_dir) == {'entries': 2, 'written': 1, 'removed': 1}
+
+        with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        assert [item['title'] for item in manifest['entries']] == ["“One.”", "“Two.”"]
+        with open(os.path.join(output_dir, '0.json'), encoding='utf-8') as f:
+            assert json.load(f)['html'] == "●<br><br>“One.”<br><br>First body."
+        with open(os.path.join(output_dir, 'all.json'), encoding='utf-8') as f:
+            assert "Second body, revised." in json.load(f)['html']
+        assert not os.path.exists(os.path.join(output_dir, '2.json'))
+    print("Entry shard build test completed successfully.")
+
+def test_manuscript_cache_reparses_changed_tail():
+    print("\n5. Testing incremental manuscript parsing...")
+    rng = random.Random(99)
+    pieces = ["●", "\n", "\n\n", "●\n\n“Of X.”\n\n", "word ", "a", "\r\n", "é", "\n\n●"]
+    with tempfile.TemporaryDirectory() as tmp:
+        manuscript = os.path.join(tmp, 'Fantasy.txt')
+        for _ in range(100):
+            text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 40)))
+            with open(manuscript, 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+            cache = ManuscriptCache(manuscript)
+            cache.refresh()
+            for _ in range(10):
+                position = rng.randint(0, len(text))
+                if rng.random() < 0.5:
+                    text = text[:position] + ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 5))) + text[position:]
+                else:
+                    text = text[:position] + text[position + rng.randint(1, 8):]
+                with open(manuscript, 'w', encoding='utf-8', newline='') as f:
+                    f.write(text)
+                previous = list(cache.entries)
+                first_changed, _ = cache.refresh()
+                expected = load_entries(manuscript)
+                assert cache.entries == expected, repr(text)
+                unchanged = 0
+                while unchanged < min(len(previous), len(expected)) and previous[unchanged] == expected[unchanged]:
+                    unchanged += 1
+                assert first_changed == unchanged, repr(text)
+
+        # Appending an entry re-parses only the last known entry and the new one
+        with open(manuscript, 'w', encoding='utf-8') as f:
+            f.write("".join(f"●\n\n“Of {i}.”\n\nBody {i}.\n\n" for i in range(50)))
+        cache = ManuscriptCache(manuscript)
+        assert cache.refresh() == (0, 50)
+        with open(manuscript, 'a', encoding='utf-8') as f:
+            f.write("●\n\n“Of 50.”\n\nBody 50.\n")
+        assert cache.refresh() == (50, 2)
+        assert cache.refresh() == (51, 0)
+    print("Incremental manuscript parsing test completed successfully.")
+
+if __name__ == "__main__":
+    print("Starting entries tests...")
+    for test_func in [test_split_entries_matches_reader_rules, test_manuscript_entries,
+                      test_streaming_split_matches_whole_text, test_entry_shards_rebuild_only_changed,
+                      test_manuscript_cache_reparses_changed_tail]:
+        test_func()
+    print("\nAll entries tests completed successfully!")
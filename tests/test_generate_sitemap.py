@@ -0,0 +1,87 @@
+# tests/test_generate_sitemap.py
+# Sitemap generation: git-backed lastmod dates and sharding past the per-file URL limit
+
+import os
+import sys
+import gzip
+import subprocess
+import tempfile
+from pathlib import Path
+
+# Add parent directory to Python path for importing generate_sitemap.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from scripts.generate_sitemap import find_html_files, git_lastmod_index, resolve_lastmods, write_sitemaps, SHARD_PREFIX
+
+def commit_file(repo, path, content, date):
+    with open(os.path.join(repo, path), 'w', encoding='utf-8') as f:
+        f.write(content)
+    env = dict(os.environ, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date,
+               GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com',
+               GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+    subprocess.run(['git', 'add', path], cwd=repo, check=True, env=env)
+    subprocess.run(['git', 'commit', '-q', '-m', f"Update {path}"], cwd=repo, check=True, env=env)
+
+def test_git_lastmod_index():
+    print("\n1. Testing git-backed lastmod dates...")
+    with tempfile.TemporaryDirectory() as repo:
+        subprocess.run(['git', 'init', '-q'], cwd=repo, check=True)
+        commit_file(repo, 'index.html', '<p>v1</p>', '2025-01-02T10:00:00Z')
+        commit_file(repo, 'about.html', '<p>about</p>', '2025-02-03T10:00:00Z')
+        commit_file(repo, 'index.html', '<p>v2</p>', '2025-03-04T10:00:00Z')
+        assert git_lastmod_index(repo) == {'index.html': '2025-03-04', 'about.html': '2025-02-03'}
+
+        cache = {}
+        assert resolve_lastmods(['index.html', 'about.html'], repo, cache)['index.html'] == '2025-03-04'
+        commit_file(repo, 'about.html', '<p>about v2</p>', '2025-04-05T10:00:00Z')
+        lastmods = resolve_lastmods(['index.html', 'about.html'], repo, cache)
+        assert lastmods == {'index.html': '2025-03-04', 'about.html': '2025-04-05'}, "New commits must be picked up incrementally."
+
+        # Files git does not track fall back to their mtime under the given root
+        with open(os.path.join(repo, 'draft.html'), 'w', encoding='utf-8') as f:
+            f.write('<p>draft</p>')
+        os.utime(os.path.join(repo, 'draft.html'), (1736942400, 1736942400)) # 2025-01-15T12:00:00Z
+        assert resolve_lastmods(['draft.html'], repo, cache)['draft.html'] == '2025-01-15'
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'page.html'), 'w', encoding='utf-8') as f:
+            f.write('<p>page</p>')
+        assert resolve_lastmods(['page.html'], root_dir=tmp, cache={})['page.html'] is not None, \
+            "Pages outside a git repository still get a lastmod."
+    print("Git-backed lastmod test completed successfully.")
+
+def test_sitemap_sharding():
+    print("\n2. Testing sitemap index and shards...")
+    with tempfile.TemporaryDirectory() as tmp:
+        # The build_assets output and hidden directories are not pages of the site
+        for path in ('index.html', '_site/index.html', '.cache/page.html', 'archive/old.html'):
+            os.makedirs(os.path.dirname(os.path.join(tmp, path)), exist_ok=True)
+            with open(os.path.join(tmp, path), 'w', encoding='utf-8') as f:
+                f.write('<p>page</p>')
+        assert sorted(find_html_files(tmp)) == ['archive/old.html', 'index.html']
+    with tempfile.TemporaryDirectory() as tmp:
+        output_file = os.path.join(tmp, 'sitemap.xml')
+        cache_file = os.path.join(tmp, 'cache.json')
+        files = [f"entries/{i}.html" for i in range(5)]
+
+        written = write_sitemaps(files, output_file, root_dir=tmp, cache_file=cache_file, max_urls=2)
+        shards = sorted(name for name in os.listdir(tmp) if name.startswith(SHARD_PREFIX))
+        assert shards == ['sitemap-1.xml.gz', 'sitemap-2.xml.gz', 'sitemap-3.xml.gz']
+        assert len(written) == 4
+        with open(output_file, encoding='utf-8') as f:
+            assert '<sitemapindex' in f.read()
+        with gzip.open(os.path.join(tmp, 'sitemap-3.xml.gz'), 'rt', encoding='utf-8') as f:
+            assert f.read().count('<url>') == 1
+
+        assert write_sitemaps(files, output_file, root_dir=tmp, cache_file=cache_file, max_urls=2) == [], \
+            "Unchanged sitemaps must not be rewritten."
+
+        write_sitemaps(files[:2], output_file, root_dir=tmp, cache_file=cache_file, max_urls=2)
+        assert not [name for name in os.listdir(tmp) if name.startswith(SHARD_PREFIX)], "Stale shards must be removed."
+        with open(output_file, encoding='utf-8') as f:
+            assert f.read().count('<url>') == 2
+    print("Sitemap sharding test completed successfully.")
+
+if __name__ == "__main__":
+    print("Starting sitemap tests...")
+    for test_func in [test_git_lastmod_index, test_sitemap_sharding]:
+        test_func()
+    print("\nAll sitemap tests completed successfully!")
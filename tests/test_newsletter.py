@@ -6,13 +6,29 @@
 import os
 import json
 import sys
+import time
+import base64
+import gzip
+import tempfile
+import subprocess
+import threading
+import itertools
 from datetime import datetime, timezone
 from pathlib import Path
 import unittest
 
 # Add parent directory to Python path for importing newsletter.py
 sys.path.append(str(Path(__file__).resolve().parent.parent))
-from scripts.newsletter import send_newsletter, get_access_token
+from scripts.newsletter import send_newsletter, get_access_token, TokenProvider
+from scripts.newsletter import plan_messages, build_batch_requests, parse_batch_response, GRAPH_BATCH_LIMIT
+from scripts.newsletter import SendEngine, send_in_batches, parse_retry_after
+from scripts.newsletter import CompiledTemplate, load_compiled_template, render_many
+from scripts.newsletter import stream_recipients_from_firestore, RecipientSnapshot
+from scripts.newsletter import DeliveryJournal, QuotaScheduler, DeferredDelivery
+from scripts.newsletter import load_recipients, default_recipient_source, RECIPIENT_SOURCES, StartupPipeline, PrefetchedRecipients
+from scripts.newsletter import build_encoded_batches, timed_stream
+from scripts.newsletter import detect_entry_changes, build_entries_newsletter, save_announced_manifest, mark_announced
+from scripts.metrics import Metrics, NullMetrics, format_markdown
 
 # Firestore functionality commented out - will be restored later
 """
@@ -90,6 +106,151 @@ def create_test_template_file(template_filename="test_email_template.html"):
     
     return str(template_path)
 
+def make_fake_jwt(claims):
+    # Build an unsigned JWT-shaped token carrying the given claims
+    def encode(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode('utf-8')).decode('ascii').rstrip('=')
+    return f"{encode({'alg': 'none'})}.{encode(claims)}.sig"
+
+class FakeResponse:
+    # Minimal stand-in for requests.Response used by the offline tests
+    def __init__(self, status_code=200, payload=None, headers=None, text=''):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+        self.text = text or (json.dumps(payload) if payload is not None else '')
+
+    def json(self):
+        if self._payload is None:
+            raise json.JSONDecodeError("No JSON payload", self.text, 0)
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}")
+
+class FakeTokenSession:
+    # Records token requests and hands out tokens expiring after lifetime seconds
+    def __init__(self, lifetime=3600):
+        self.lifetime = lifetime
+        self.calls = 0
+
+    def post(self, url, data=None, **kwargs):
+        self.calls += 1
+        token = make_fake_jwt({'exp': int(time.time()) + self.lifetime, 'appid': (data or {}).get('client_id'), 'n': self.calls})
+        return FakeResponse(200, {'access_token': token, 'expires_in': self.lifetime})
+
+
+class FakeGraphSession:
+    # Answers $batch calls, throttling each sub-request throttle_first times before accepting it
+    def __init__(self, throttle_first=0, retry_after='2', reject=(), crash_after_calls=None):
+        self.throttle_first = throttle_first
+        self.retry_after = retry_after
+        self.reject = set(reject)
+        self.crash_after_calls = crash_after_calls
+        self.attempts = {}
+        self.batch_calls = 0
+        self.delivered = []
+        self.bodies = {}
+        self.lock = threading.Lock()
+
+    def post(self, url, headers=None, data=None, **kwargs):
+        if (headers or {}).get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        payload = json.loads(data)
+        responses = []
+        with self.lock:
+            if self.crash_after_calls is not None and self.batch_calls >= self.crash_after_calls:
+                raise RuntimeError("Simulated crash")
+            self.batch_calls += 1
+            for req in payload['requests']:
+                message = req['body']['message']
+                key = tuple(r['emailAddress']['address'] for r in message.get('bccRecipients', message.get('toRecipients', [])))
+                self.attempts[key] = self.attempts.get(key, 0) + 1
+                if self.reject & set(key):
+                    responses.append({'id': req['id'], 'status': 400, 'body': {'error': {'code': 'ErrorInvalidRecipients'}}})
+                elif self.attempts[key] <= self.throttle_first:
+                    responses.append({'id': req['id'], 'status': 429, 'headers': {'Retry-After': self.retry_after}})
+                else:
+                    self.delivered.extend(key)
+                    self.bodies[key] = message['body']['content']
+                    responses.append({'id': req['id'], 'status': 202})
+        return FakeResponse(200, {'responses': responses})
+
+    def close(self):
+        pass
+
+class FakeFirestoreDocument:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+class FakeFirestoreQuery:
+    # Supports the where/order_by/limit/start_after/stream subset used by the recipient sources
+    OPERATORS = {'==': lambda a, b: a == b, '>': lambda a, b: a > b, '>=': lambda a, b: a >= b,
+                 '<': lambda a, b: a < b, '<=': lambda a, b: a <= b}
+
+    def __init__(self, client, docs, order_field=None, limit_count=None, after=None, filters=()):
+        self.client = client
+        self.docs = docs
+        self.order_field = order_field
+        self.limit_count = limit_count
+        self.after = after
+        self.filters = filters
+
+    def _copy(self, **changes):
+        state = dict(order_field=self.order_field, limit_count=self.limit_count, after=self.after, filters=self.filters)
+        state.update(changes)
+        return FakeFirestoreQuery(self.client, self.docs, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self.filters + ((field, op, value),))
+
+    def order_by(self, field):
+        return self._copy(order_field=field)
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def start_after(self, doc):
+        return self._copy(after=doc)
+
+    def stream(self):
+        # Firestore orders numbers before strings
+        def order_key(doc):
+            value = doc.to_dict()[self.order_field]
+            return (isinstance(value, str), value)
+        docs = [d for d in self.docs if self.order_field in d.to_dict()]
+        for field, op, value in self.filters:
+            docs = [d for d in docs if field in d.to_dict() and self.OPERATORS[op](d.to_dict()[field], value)]
+        docs.sort(key=order_key)
+        if self.after is not None:
+            cursor = order_key(self.after)
+            docs = [d for d in docs if order_key(d) > cursor]
+        if self.limit_count is not None:
+            docs = docs[:self.limit_count]
+        self.client.pages_read += 1
+        self.client.documents_read += len(docs)
+        return iter(docs)
+
+class FakeFirestoreClient:
+    def __init__(self, collections):
+        self.collections = {name: [FakeFirestoreDocument(str(i), data) for i, data in enumerate(docs)]
+                            for name, docs in collections.items()}
+        self.pages_read = 0
+        self.documents_read = 0
+
+    def set_document(self, collection_name, doc_id, data):
+        docs = self.collections.setdefault(collection_name, [])
+        docs[:] = [d for d in docs if d.id != doc_id]
+        docs.append(FakeFirestoreDocument(doc_id, data))
+
+    def collection(self, name):
+        return FakeFirestoreQuery(self, self.collections.setdefault(name, []))
+
 def test_template_rendering():
     print("\n1. Testing template rendering...")
     setup_test_environment() 
@@ -276,6 +437,588 @@ def test_send_to_firestore_recipients():
         raise
 """
 
+def test_token_provider_caches_until_expiry():
+    print("\n6. Testing token provider caching...")
+    session = FakeTokenSession(lifetime=3600)
+    provider = TokenProvider(client_id='cid', client_secret='secret', tenant_id='tid', session=session, cache_path='')
+
+    tokens = set()
+    threads = [threading.Thread(target=lambda: tokens.add(provider.get_token())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(tokens) == 1, "Concurrent callers should share one token."
+    assert session.calls == 1, f"Expected one token request, got {session.calls}."
+
+    # A token inside the refresh margin is replaced proactively
+    short_session = FakeTokenSession(lifetime=60)
+    short_provider = TokenProvider(client_id='cid', client_secret='secret', tenant_id='tid',
+                                   session=short_session, cache_path='', refresh_margin=300)
+    short_provider.get_token()
+    short_provider.get_token()
+    assert short_session.calls == 2, "Token near expiry should be refreshed."
+    print("Token provider caching test completed successfully.")
+
+def test_token_provider_disk_cache():
+    print("\n7. Testing token provider disk cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'token_cache.json')
+        first_session = FakeTokenSession()
+        first = TokenProvider(client_id='cid', client_secret='secret', tenant_id='tid',
+                              session=first_session, cache_path=cache_path)
+        token = first.get_token()
+
+        second_session = FakeTokenSession()
+        second = TokenProvider(client_id='cid', client_secret='secret', tenant_id='tid',
+                               session=second_session, cache_path=cache_path)
+        assert second.get_token() == token, "Disk-cached token should be reused."
+        assert second_session.calls == 0, "Disk cache hit should not hit the token endpoint."
+
+        other_client = TokenProvider(client_id='other', client_secret='secret', tenant_id='tid',
+                                     session=second_session, cache_path=cache_path)
+        assert other_client.get_token() != token, "Cache entries are keyed by client id."
+
+        # A 401 must not reload the rejected token from the disk cache
+        class RejectOnceSession:
+            def __init__(self):
+                self.authorizations = []
+
+            def post(self, url, headers=None, data=None, **kwargs):
+                self.authorizations.append(headers['Authorization'])
+                return FakeResponse(401 if len(self.authorizations) == 1 else 202)
+
+        graph_session = RejectOnceSession()
+        engine = SendEngine(token_provider=second, session=graph_session, sleep=lambda s: None)
+        response = engine.post('https://graph.example/sendMail', b'{}')
+        assert response.status_code == 202, "The retry after a 401 should go through."
+        assert graph_session.authorizations[0] == 'Bearer ' + token
+        assert graph_session.authorizations[1] != graph_session.authorizations[0], "The retry must use a new token."
+        assert second_session.calls == 2, "A 401 should fetch a new token, not reuse the cached one."
+        third = TokenProvider(client_id='cid', client_secret='secret', tenant_id='tid',
+                              session=FakeTokenSession(), cache_path=cache_path)
+        assert third.get_token() != token, "The rejected token should be gone from the disk cache."
+    print("Token provider disk cache test completed successfully.")
+
+def test_batch_request_packing():
+    print("\n8. Testing chunked $batch request packing...")
+    recipients = [f"user{i}@example.com" for i in range(1005)]
+    groups = plan_messages(recipients, delivery_mode='bcc', chunk_size=50)
+    batches = list(build_batch_requests('sender@example.com', 'Subject', '<p>Hi</p>', groups, 'bcc'))
+
+    sub_requests = [req for payload, _ in batches for req in payload['requests']]
+    assert len(sub_requests) == 21, f"Expected 21 BCC messages, got {len(sub_requests)}."
+    assert len(batches) == 2, "21 messages should fit in two $batch calls."
+    assert all(len(payload['requests']) <= GRAPH_BATCH_LIMIT for payload, _ in batches)
+    first_message = sub_requests[0]['body']['message']
+    assert 'toRecipients' not in first_message, "BCC mode must not expose recipients in To."
+    assert len(first_message['bccRecipients']) == 50
+    sent = [addr for _, batch_groups in batches for group in batch_groups.values() for addr in group]
+    assert sent == recipients, "Every recipient should appear exactly once, in order."
+
+    individual = list(build_batch_requests('sender@example.com', 'Subject', '<p>Hi</p>',
+                                           plan_messages(recipients[:3], 'individual'), 'individual'))
+    messages = [req['body']['message'] for req in individual[0][0]['requests']]
+    assert [m['toRecipients'][0]['emailAddress']['address'] for m in messages] == recipients[:3]
+    print("Batch packing test completed successfully.")
+
+def test_batch_partial_failure_parsing():
+    print("\n9. Testing $batch partial-failure parsing...")
+    groups = {'1': ['a@example.com'], '2': ['b@example.com'], '3': ['c@example.com']}
+    response = FakeResponse(200, {'responses': [
+        {'id': '2', 'status': 429, 'headers': {'Retry-After': '5'}, 'body': {'error': {'code': 'TooManyRequests'}}},
+        {'id': '1', 'status': 202}
+    ]})
+    results = {r['id']: r for r in parse_batch_response(response, groups)}
+    assert results['1']['error'] is None
+    assert results['2']['status'] == 429 and results['2']['headers']['Retry-After'] == '5'
+    assert results['3']['error'], "Missing sub-responses must be reported as failures."
+
+    failed = parse_batch_response(FakeResponse(503, text='Service Unavailable'), groups)
+    assert all(r['status'] == 503 for r in failed), "A failed $batch call fails every sub-request."
+    print("Batch partial-failure parsing test completed successfully.")
+
+def test_send_engine_retries_throttled_sub_requests():
+    print("\n10. Testing send engine throttling retries...")
+    session = FakeGraphSession(throttle_first=1, retry_after='2')
+    sleeps = []
+    engine = SendEngine(access_token='token', session=session, max_workers=4, sleep=sleeps.append)
+    recipients = [f"user{i}@example.com" for i in range(2000)]
+
+    results = send_in_batches(engine, 'sender@example.com', 'Subject', '<p>Hi</p>', recipients,
+                              delivery_mode='bcc', chunk_size=25)
+    summary = engine.report()
+
+    assert all(r['error'] is None for r in results), "Throttled messages should succeed on retry."
+    assert sorted(session.delivered) == sorted(recipients), "Each recipient should be delivered exactly once."
+    assert summary['recipients'] == len(recipients)
+    assert summary['retries'] == 80, f"Expected one retry per message, got {summary['retries']}."
+    assert sleeps and all(delay >= 2 for delay in sleeps), "Retry-After must be honored."
+    print("Send engine throttling test completed successfully.")
+
+def test_retry_after_parsing():
+    print("\n11. Testing Retry-After parsing...")
+    assert parse_retry_after({'Retry-After': '7'}) == 7.0
+    assert parse_retry_after({'retry-after': '0'}) == 0.0
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0.0, "Past dates mean retry now."
+    assert parse_retry_after({'Retry-After': 'soon'}) is None
+    print("Retry-After parsing test completed successfully.")
+
+def test_compiled_template_matches_format():
+    print("\n12. Testing compiled template rendering...")
+    template_path = create_test_template_file()
+    with open(template_path, 'r', encoding='utf-8') as f:
+        template_str = f.read()
+    context = {'recipient_name': "Test User", 'timestamp': "2025-06-28 12:00:00 UTC"}
+    assert CompiledTemplate(template_str).render(context) == template_str.format(**context)
+
+    tricky = "{{literal}} {name!r} {count:05d} {user[first]} {price:.{digits}f}"
+    tricky_context = {'name': 'Ann', 'count': 42, 'user': {'first': 'Bo'}, 'price': 3.14159, 'digits': 2}
+    compiled = CompiledTemplate(tricky)
+    assert compiled.render(tricky_context) == tricky.format(**tricky_context)
+    assert compiled.fields == {'name', 'count', 'user', 'price', 'digits'}
+
+    bodies = list(render_many(compiled, [dict(tricky_context, count=i) for i in range(50)], processes=2, chunksize=7))
+    assert bodies == [tricky.format(**dict(tricky_context, count=i)) for i in range(50)], "Pool rendering must keep order."
+    print("Compiled template rendering test completed successfully.")
+
+def test_compiled_template_cache_invalidation():
+    print("\n13. Testing compiled template cache invalidation...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'template.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("<p>Hello {recipient_name}</p>")
+        first = load_compiled_template(path)
+        assert load_compiled_template(path) is first, "Unchanged file should hit the cache."
+
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 5_000_000_000))
+        assert load_compiled_template(path) is first, "Touched but identical content keeps the compiled template."
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("<p>Goodbye {recipient_name}, see you soon</p>")
+        second = load_compiled_template(path)
+        assert second is not first and "Goodbye" in second.source, "Edited file must be recompiled."
+    print("Compiled template cache invalidation test completed successfully.")
+
+def test_personalized_send():
+    print("\n14. Testing personalized send...")
+    template_path = create_test_template_file()
+    session = FakeGraphSession()
+    engine = SendEngine(access_token='token', session=session, sleep=lambda delay: None)
+    recipients = ['ann@example.com', 'bo@example.com']
+
+    success = send_newsletter(recipients=recipients, subject="Personalized", template_path=template_path,
+                              from_address='sender@example.com', engine=engine,
+                              recipient_data={'ann@example.com': {'name': 'Ann'}})
+    assert success
+    assert "Hello Ann!" in session.bodies[('ann@example.com',)]
+    assert "Hello Valued Subscriber!" in session.bodies[('bo@example.com',)]
+    assert "{timestamp}" not in session.bodies[('bo@example.com',)]
+    print("Personalized send test completed successfully.")
+
+def test_firestore_recipient_streaming():
+    print("\n15. Testing paged Firestore recipient streaming...")
+    subscribers = [{'email': f" user{i:04d}@example.com "} for i in range(1234)]
+    subscribers += [{'email': ''}, {'email': 42}, {'name': 'no email'}]
+    client = FakeFirestoreClient({'subscribers': subscribers})
+
+    stream = stream_recipients_from_firestore(client=client, page_size=100)
+    first = list(itertools.islice(stream, 10))
+    assert first[0] == 'user0000@example.com', "Addresses should be stripped and ordered."
+    assert client.pages_read == 1, "Only the first page should be read before it is consumed."
+
+    rest = list(stream)
+    assert len(first) + len(rest) == 1234, "Invalid entries should be dropped."
+    assert client.pages_read == 13, f"Expected 13 pages, read {client.pages_read}."
+    print("Paged Firestore recipient streaming test completed successfully.")
+
+def test_recipient_snapshot_incremental_sync():
+    print("\n16. Testing incremental recipient snapshot sync...")
+    base = datetime(2025, 6, 1, tzinfo=timezone.utc)
+    subscribers = [{'email': f"user{i:04d}@example.com", 'updated_at': base.replace(minute=i % 60, hour=i // 60)}
+                   for i in range(500)]
+    client = FakeFirestoreClient({'subscribers': subscribers})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'snapshot', 'recipients.sqlite3')
+        with RecipientSnapshot(path) as snapshot:
+            first = snapshot.sync(client, page_size=100)
+            assert first['read'] == 500 and snapshot.count() == 500
+
+        later = datetime(2025, 7, 1, tzinfo=timezone.utc)
+        client.set_document('subscribers', '3', {'email': 'user0003@example.com', 'subscribed': False, 'updated_at': later})
+        client.set_document('subscribers', 'new', {'email': 'Newcomer@example.com ', 'updated_at': later})
+        client.documents_read = 0
+
+        with RecipientSnapshot(path) as snapshot:
+            second = snapshot.sync(client, page_size=100)
+            addresses = list(snapshot.iter_addresses())
+        # Two changed documents plus the one sitting on the previous marker
+        assert client.documents_read == 3, f"Incremental sync should only read changed documents, read {client.documents_read}."
+        assert second['removed'] == 1 and second['upserted'] == 2
+        assert 'user0003@example.com' not in addresses and 'Newcomer@example.com' in addresses
+        assert addresses == sorted(addresses) and len(addresses) == 500
+    print("Incremental recipient snapshot sync test completed successfully.")
+
+def test_delivery_journal_resume():
+    print("\n17. Testing delivery journal resume...")
+    recipients = [f"user{i:03d}@example.com" for i in range(200)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'journal', 'campaign.jsonl')
+
+        # First attempt crashes after two $batch calls (40 messages) and rejects one address
+        crashing = FakeGraphSession(reject={'user005@example.com'}, crash_after_calls=2)
+        journal = DeliveryJournal(path, 'campaign')
+        engine = SendEngine(access_token='token', session=crashing, max_workers=1, sleep=lambda delay: None)
+        try:
+            send_newsletter(recipients=recipients, subject="Journal", content_html="<p>Hi</p>", from_address='sender@example.com',
+                            delivery_mode='individual', engine=engine, journal=journal)
+            assert False, "The simulated crash should propagate."
+        except RuntimeError:
+            pass
+        journal.close()
+
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"state": "sent", "recipi') # Torn write from the crash
+
+        resumed = DeliveryJournal(path, 'campaign')
+        counts = resumed.counts()
+        assert counts['sent'] == 39 and counts['failed'] == 1, f"Unexpected journal state: {counts}"
+
+        healthy = FakeGraphSession()
+        engine = SendEngine(access_token='token', session=healthy, max_workers=4, sleep=lambda delay: None)
+        assert send_newsletter(recipients=recipients, subject="Journal", content_html="<p>Hi</p>", from_address='sender@example.com',
+                               delivery_mode='individual', engine=engine, journal=resumed)
+        resumed.close()
+        assert len(healthy.delivered) == 161, f"Only unsent recipients should be retried, sent {len(healthy.delivered)}."
+        assert 'user005@example.com' in healthy.delivered and 'user000@example.com' not in healthy.delivered
+        final = DeliveryJournal(path, 'campaign')
+        assert final.counts()['sent'] == 200
+        final.close()
+    print("Delivery journal resume test completed successfully.")
+
+def test_entry_change_detection():
+    print("\n18. Testing Fantasy.txt change detection...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manuscript = os.path.join(tmp, 'Fantasy.txt')
+        manifest = os.path.join(tmp, 'cache', 'announced.json')
+        with open(manuscript, 'w', encoding='utf-8') as f:
+            f.write("●\n\n“First Entry.”\n\nOnce upon\na time.\n\n●\n\n“Second Entry.”\n\nThe end.\n")
+
+        announced, changes, bootstrapped = detect_entry_changes(manifest, manuscript)
+        assert bootstrapped and not changes, "A first run without a baseline must not announce the archive."
+        save_announced_manifest(manifest, announced)
+
+        with open(manuscript, 'w', encoding='utf-8') as f:
+            f.write("●\n\n“First Entry.”\n\nOnce upon\na time, edited.\n\n●\n\n“Second Entry.”\n\nThe end.\n"
+                    "\n●\n\n“Third Entry.”\n\nA <new> beginning.\n")
+        announced, changes, bootstrapped = detect_entry_changes(manifest, manuscript)
+        assert not bootstrapped
+        assert [(index, status) for index, _, status in changes] == [(0, 'updated'), (2, 'new')]
+
+        subject, content_html = build_entries_newsletter(changes)
+        assert "2 new and updated entries" in subject
+        assert "A &lt;new&gt; beginning." in content_html and "?entry=2" in content_html
+        save_announced_manifest(manifest, mark_announced(announced, changes))
+        assert not detect_entry_changes(manifest, manuscript)[1], "Announced entries must not be mailed again."
+    print("Fantasy.txt change detection test completed successfully.")
+
+def test_run_metrics():
+    print("\n19. Testing run metrics...")
+    metrics = Metrics()
+    session = FakeGraphSession(throttle_first=1, retry_after='0')
+    engine = SendEngine(access_token='token', session=session, max_workers=2, sleep=lambda delay: None, metrics=metrics)
+    recipients = [f"user{i}@example.com" for i in range(100)]
+    with metrics.span('send'):
+        send_in_batches(engine, 'sender@example.com', 'Subject', '<p>Hi</p>', recipients, delivery_mode='bcc', chunk_size=10)
+
+    summary = metrics.summary()
+    assert summary['spans']['send']['count'] == 1
+    assert summary['spans']['serialize']['count'] == 2, "One serialization per $batch call, including the retry."
+    batch_calls = summary['http']['POST $batch']
+    assert batch_calls['count'] == 2 and batch_calls['statuses'] == {'200': 2}
+    assert sum(batch_calls['buckets_ms'].values()) == 2
+    assert summary['counters']['recipients'] == 100 and summary['counters']['retries'] == 10
+    assert summary['counters']['bytes_sent'] > 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'metrics.json')
+        step_summary = os.path.join(tmp, 'step_summary.md')
+        metrics.write(json_path, step_summary)
+        with open(json_path, encoding='utf-8') as f:
+            assert json.load(f)['counters']['recipients'] == 100
+        with open(step_summary, encoding='utf-8') as f:
+            assert "| POST $batch | 2 |" in f.read()
+    assert "| serialize |" in format_markdown(summary)
+
+    # A streamed source is timed while it is drained, not when its generator is created
+    now = [0.0]
+    def slow_source():
+        for i in range(3):
+            now[0] += 0.05
+            yield f"reader{i}@example.com"
+    for address in timed_stream(slow_source, 'recipients.slow', metrics, clock=lambda: now[0]):
+        now[0] += 0.1 # Sending, which is not the source's time
+    source_seconds = metrics.summary()['spans']['recipients.slow']['seconds']
+    assert abs(source_seconds - 0.15) < 1e-6, f"Expected 0.15s fetching recipients, got {source_seconds:.2f}s."
+
+    disabled = NullMetrics()
+    with disabled.span('send'):
+        disabled.observe_http('POST $batch', 200, 0.1, 100)
+    assert disabled.summary() is None
+    print("Run metrics test completed successfully.")
+
+def test_recipient_sources():
+    print("\n20. Testing pluggable recipient sources...")
+    saved = {key: os.environ.pop(key, None) for key in
+             ('NEWSLETTER_RECIPIENT_SOURCE', 'NEWSLETTER_RECIPIENTS_FILE', 'NEWSLETTER_RECIPIENT_SNAPSHOT',
+              'FIRESTORE_RECIPIENTS_COLLECTION', 'NEWSLETTER_SUPPRESSION_LIST')}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            text_path = os.path.join(tmp, 'recipients.txt')
+            with open(text_path, 'w', encoding='utf-8') as f:
+                f.write("# subscribers\n a@example.com \n\nb@example.com\n")
+            os.environ['NEWSLETTER_RECIPIENTS_FILE'] = text_path
+            assert default_recipient_source() == 'file'
+            assert list(load_recipients()) == ['a@example.com', 'b@example.com']
+
+            csv_path = os.path.join(tmp, 'recipients.csv')
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write("name,Email\nAnn,ann@example.com\nBo, bo@example.com\n")
+            os.environ['NEWSLETTER_RECIPIENTS_FILE'] = csv_path
+            assert list(load_recipients('file')) == ['ann@example.com', 'bo@example.com']
+
+            # A snapshot without a configured collection is read offline
+            snapshot_path = os.path.join(tmp, 'recipients.sqlite3')
+            with RecipientSnapshot(snapshot_path) as snapshot:
+                snapshot.sync(FakeFirestoreClient({'subscribers': [{'email': 'c@example.com', 'updated_at': 1}]}))
+            os.environ['NEWSLETTER_RECIPIENT_SNAPSHOT'] = snapshot_path
+            assert list(load_recipients('snapshot')) == ['c@example.com']
+
+            try:
+                load_recipients('carrier-pigeon')
+                assert False, "Unknown sources must be rejected."
+            except ValueError as e:
+                assert "file, firestore, snapshot" in str(e)
+    finally:
+        for key, value in saved.items():
+            os.environ.pop(key, None)
+            if value is not None:
+                os.environ[key] = value
+
+    # Importing the sender must not load the Firestore or HTTP client libraries
+    scripts_dir = Path(__file__).resolve().parent.parent / 'scripts'
+    code = ("import sys, newsletter; print(','.join(m for m in ('google.cloud.firestore', 'grpc', 'requests') "
+            "if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=scripts_dir, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '', f"Eagerly imported: {result.stdout.strip()}"
+    print("Recipient sources test completed successfully.")
+
+def test_encoded_batches_match_payloads():
+    print("\n21. Testing pre-encoded $batch payloads...")
+    recipients = [f"user{i}@example.com" for i in range(45)] + ["zoë@exämple.com"]
+    subject = 'Entries “new” & <updated>'
+    html = '<p>Caf\u00e9 "quoted" \\ backslash\n\u25cf</p>'
+    for mode, chunk_size in (('bcc', 10), ('individual', 1)):
+        expected = list(build_batch_requests('sender@example.com', subject, html,
+                                             plan_messages(recipients, mode, chunk_size), mode))
+        encoded = list(build_encoded_batches('sender@example.com', subject, html,
+                                             plan_messages(recipients, mode, chunk_size), mode))
+        assert [groups for _, groups in encoded] == [groups for _, groups in expected]
+        assert [json.loads(batch.body()) for batch, _ in encoded] == [payload for payload, _ in expected], mode
+
+    def render_body(group):
+        return f"<p>Hello {group[0]}</p>"
+    expected = list(build_batch_requests('sender@example.com', subject, html, plan_messages(recipients, 'individual'),
+                                         'individual', render_body))
+    encoded = list(build_encoded_batches('sender@example.com', subject, html, plan_messages(recipients, 'individual'),
+                                         'individual', render_body))
+    assert [json.loads(batch.body()) for batch, _ in encoded] == [payload for payload, _ in expected]
+    retry = encoded[0][0].subset({'2', '5'})
+    assert [req['id'] for req in json.loads(retry.body())['requests']] == ['2', '5']
+
+    # Compressed requests carry the same messages and are retried the same way
+    session = FakeGraphSession(throttle_first=1, retry_after='0')
+    engine = SendEngine(access_token='token', session=session, sleep=lambda delay: None, compress=True)
+    results = send_in_batches(engine, 'sender@example.com', subject, html, recipients, delivery_mode='bcc', chunk_size=10)
+    assert all(r['error'] is None for r in results)
+    assert sorted(session.delivered) == sorted(recipients)
+    assert set(session.bodies.values()) == {html}
+    print("Pre-encoded $batch payload test completed successfully.")
+
+def test_quota_scheduler_defers_overflow():
+    print("\n22. Testing quota-aware send scheduling...")
+    recipients = [f"user{i:03d}@example.com" for i in range(250)]
+    now = [1_000_000.0]
+    sleeps = []
+    def clock():
+        return now[0]
+    def sleep(delay):
+        sleeps.append(delay)
+        now[0] += delay
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, 'quota', 'quota.json')
+        journal_path = os.path.join(tmp, 'journal', 'campaign.jsonl')
+
+        # 120 recipients a day in 10-address BCC messages, 4 messages a minute
+        session = FakeGraphSession()
+        engine = SendEngine(access_token='token', session=session, sleep=lambda delay: None)
+        scheduler = QuotaScheduler(state_path, messages_per_minute=4, recipients_per_day=120, clock=clock, sleep=sleep)
+        journal = DeliveryJournal(journal_path, 'campaign')
+        try:
+            send_newsletter(recipients=recipients, subject="Quota", content_html="<p>Hi</p>", from_address='sender@example.com',
+                            delivery_mode='bcc', chunk_size=10, engine=engine, journal=journal, scheduler=scheduler)
+            assert False, "Recipients beyond the daily allowance should be deferred."
+        except DeferredDelivery as e:
+            # The window opens when one more 10-address message fits, at 120 a day one per 720s
+            wait = e.next_window_at - now[0]
+            assert 9 * 720 < wait <= 10 * 720, f"Expected the next window in about 2 hours, got {wait:.0f}s."
+        journal.close()
+        assert len(session.delivered) == 120, f"Only today's allowance should be sent, sent {len(session.delivered)}."
+        assert sleeps and sum(sleeps) >= 60, "12 messages at 4 a minute should be paced over at least two minutes."
+        with open(state_path, 'r', encoding='utf-8') as f:
+            assert json.load(f)['recipients']['tokens'] < 1
+
+        # A run later the same day sends nothing new
+        session = FakeGraphSession()
+        engine = SendEngine(access_token='token', session=session, sleep=lambda delay: None)
+        journal = DeliveryJournal(journal_path, 'campaign')
+        try:
+            send_newsletter(recipients=recipients, subject="Quota", content_html="<p>Hi</p>", from_address='sender@example.com',
+                            delivery_mode='bcc', chunk_size=10, engine=engine, journal=journal,
+                            scheduler=QuotaScheduler(state_path, 4, 120, clock=clock, sleep=sleep))
+            assert False, "The persisted allowance should still be spent."
+        except DeferredDelivery:
+            pass
+        journal.close()
+        assert session.delivered == []
+
+        # Two days later the journal resumes with the remaining 130 recipients
+        now[0] += 2 * 86400
+        session = FakeGraphSession()
+        engine = SendEngine(access_token='token', session=session, sleep=lambda delay: None)
+        journal = DeliveryJournal(journal_path, 'campaign')
+        try:
+            send_newsletter(recipients=recipients, subject="Quota", content_html="<p>Hi</p>", from_address='sender@example.com',
+                            delivery_mode='bcc', chunk_size=10, engine=engine, journal=journal,
+                            scheduler=QuotaScheduler(state_path, 4, 120, clock=clock, sleep=sleep))
+        except DeferredDelivery:
+            pass
+        assert len(session.delivered) == 120 and not set(session.delivered) & set(recipients[:120])
+        journal.close()
+        assert DeliveryJournal(journal_path, 'campaign').counts()['sent'] == 240
+
+        # Recipients of failed messages get their share of the allowance back
+        session = FakeGraphSession(reject={'user000@example.com'})
+        engine = SendEngine(access_token='token', session=session, sleep=lambda delay: None)
+        scheduler = QuotaScheduler(None, messages_per_minute=100, recipients_per_day=30, clock=clock, sleep=sleep)
+        try:
+            send_newsletter(recipients=recipients, subject="Quota", content_html="<p>Hi</p>", from_address='sender@example.com',
+                            delivery_mode='bcc', chunk_size=10, engine=engine, scheduler=scheduler)
+            assert False, "The rejected message should be reported."
+        except DeferredDelivery:
+            assert False, "Failures should be raised ahead of the deferral."
+        except Exception as e:
+            assert "Failed to send email to 10 of 30" in str(e) and "queued for the next window" in str(e), str(e)
+        assert len(session.delivered) == 20
+        assert scheduler.admitted == 20 and scheduler.allowance() == 10, "The failed message's 10 recipients are refunded."
+    print("Quota-aware send scheduling test completed successfully.")
+
+def test_startup_pipeline_overlaps_phases():
+    print("\n23. Testing overlapped startup pipeline...")
+    # Each startup phase waits at the barrier, which only opens once all four run at the same time
+    phases_running = threading.Barrier(4, timeout=10)
+    class StartupTokenProvider:
+        session = None
+        fetched = False
+        def get_token(self):
+            if not self.fetched:
+                self.fetched = True
+                phases_running.wait()
+            return 'token'
+        def invalidate(self):
+            pass
+    pages_read = []
+    first_received = threading.Event()
+    handed_over = []
+    def startup_source():
+        phases_running.wait()
+        for page in range(4):
+            if page == 2:
+                # The sender must already have the first page before the source goes any further
+                handed_over.append(first_received.wait(timeout=10))
+            pages_read.append(page)
+            yield from (f"reader{page}-{i}@example.com" for i in range(250))
+    def failing_source():
+        raise ValueError("subscriber collection is unreachable")
+        yield
+    def start_engine():
+        phases_running.wait()
+        return SendEngine(token_provider=provider, session=FakeGraphSession(), sleep=lambda delay: None)
+    def start_content():
+        phases_running.wait()
+        return "<p>Hi</p>"
+    def receiving(recipients):
+        for address in recipients:
+            first_received.set()
+            yield address
+
+    RECIPIENT_SOURCES['startup-test'] = startup_source
+    RECIPIENT_SOURCES['failing-test'] = failing_source
+    try:
+        provider = StartupTokenProvider()
+        with StartupPipeline(provider, prepare_content=start_content, recipient_source='startup-test',
+                             engine_factory=start_engine) as pipeline:
+            engine = pipeline.engine()
+            assert send_newsletter(recipients=receiving(pipeline.recipients), subject="Pipeline",
+                                   content_html=pipeline.content(), from_address='sender@example.com',
+                                   delivery_mode='bcc', engine=engine)
+            pipeline.report()
+            assert len(engine.session.delivered) == 1000
+            assert provider.session is engine.session, "Token refreshes should reuse the engine's pool."
+            assert not phases_running.broken, "Token, engine, content and recipients should start together."
+            assert set(pipeline.timings) == {'token', 'engine', 'content'}
+            assert pages_read == [0, 1, 2, 3] and handed_over == [True], "Sending should start on the first page."
+            assert pipeline.recipients.first_ready_seconds is not None
+
+        with StartupPipeline(provider, recipient_source='failing-test', engine_factory=lambda: SendEngine(
+                token_provider=provider, session=FakeGraphSession(), sleep=lambda delay: None)) as pipeline:
+            try:
+                send_newsletter(recipients=pipeline.recipients, subject="Pipeline", content_html="<p>Hi</p>",
+                                from_address='sender@example.com', engine=pipeline.engine())
+                assert False, "Recipient source errors should reach the sender."
+            except ValueError as e:
+                assert "unreachable" in str(e)
+
+        # Every page is handed over as soon as it arrives, and the buffer stays bounded: the
+        # source only produces the next page once the consumer has received the previous one
+        produced = []
+        received = [threading.Event() for page in range(20)]
+        handed_over = []
+        def paged_source():
+            for page in range(20):
+                if page:
+                    handed_over.append(received[page - 1].wait(timeout=10))
+                for i in range(10):
+                    produced.append(i)
+                    yield f"page{page}-{i}@example.com"
+        stream = PrefetchedRecipients(paged_source, max_buffered=5)
+        for count, address in enumerate(stream, 1):
+            received[(count - 1) // 10].set()
+            assert len(produced) <= count + 2 * 5 + 1, "The producer should not run ahead of the buffer."
+        assert count == 200
+        assert handed_over == [True] * 19, "Each page should reach the consumer before the next one is fetched."
+        stream = PrefetchedRecipients(lambda: itertools.count(), max_buffered=5)
+        next(iter(stream))
+        stream.close()
+        stream._thread.join(timeout=1)
+        assert not stream._thread.is_alive(), "Closing the stream should stop the producer."
+    finally:
+        RECIPIENT_SOURCES.pop('startup-test', None)
+        RECIPIENT_SOURCES.pop('failing-test', None)
+    print("Overlapped startup pipeline test completed successfully.")
+
 if __name__ == "__main__":
     print("Starting newsletter tests...")
     
@@ -283,7 +1026,25 @@ if __name__ == "__main__":
     test_functions = [
         test_template_rendering,
         test_single_recipient_send,
-        test_multiple_recipients_send_from_file
+        test_multiple_recipients_send_from_file,
+        test_token_provider_caches_until_expiry,
+        test_token_provider_disk_cache,
+        test_batch_request_packing,
+        test_batch_partial_failure_parsing,
+        test_send_engine_retries_throttled_sub_requests,
+        test_retry_after_parsing,
+        test_compiled_template_matches_format,
+        test_compiled_template_cache_invalidation,
+        test_personalized_send,
+        test_firestore_recipient_streaming,
+        test_recipient_snapshot_incremental_sync,
+        test_delivery_journal_resume,
+        test_entry_change_detection,
+        test_run_metrics,
+        test_recipient_sources,
+        test_encoded_batches_match_payloads,
+        test_quota_scheduler_defers_overflow,
+        test_startup_pipeline_overlaps_phases
     ]
 
     all_passed = True
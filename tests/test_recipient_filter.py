@@ -0,0 +1,106 @@
+# tests/test_recipient_filter.py
+# Checks recipient normalization, validation, single-pass dedup and the suppression index
+
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+# Add parent directory to Python path for importing recipient_filter.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from scripts.recipient_filter import normalize_address, clean_recipients, build_suppression_index, SuppressionList
+from scripts.newsletter import load_recipients
+
+def test_clean_recipients():
+    print("\n1. Testing recipient cleaning...")
+    assert normalize_address("  Ann.Lee+news@Example.COM\n") == "Ann.Lee+news@example.com"
+    assert normalize_address("zoë@EXÄMPLE.com") == "zoë@exämple.com"
+    for invalid in (None, 42, "", "ann", "ann@", "@example.com", "ann@example", "a b@example.com", "ann..lee@example.com",
+                    ".ann@example.com", "ann@-example.com", "ann@example..com", "x" * 65 + "@example.com"):
+        assert normalize_address(invalid) is None, f"{invalid!r} should be rejected."
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, 'suppression.idx')
+        written = build_suppression_index(["gone@example.com", "BOUNCED@Example.com", "Bounced@example.com", "junk"], index_path)
+        assert written == 3
+        with SuppressionList(index_path) as suppression:
+            assert len(suppression) == 3
+            assert " gone@EXAMPLE.com" in suppression
+            assert "BOUNCED@example.com" in suppression and "bounced@example.com" not in suppression
+            assert "kept@example.com" not in suppression and "junk" not in suppression
+
+            stats = {}
+            addresses = ["a@example.com", "A@EXAMPLE.COM", " a@example.com ", "gone@example.com", "not-an-address",
+                         None, "b@example.com", "a@example.com"]
+            assert list(clean_recipients(addresses, suppression, stats)) == ["a@example.com", "A@example.com", "b@example.com"]
+            assert stats == {'accepted': 3, 'duplicate': 2, 'invalid': 2, 'suppressed': 1}
+
+        empty_path = os.path.join(tmp, 'empty.idx')
+        build_suppression_index([], empty_path)
+        with SuppressionList(empty_path) as suppression:
+            assert "a@example.com" not in suppression
+
+        # A large list is cleaned in one pass without materializing it
+        count = 200000
+        build_suppression_index((f"user{i}@example.com" for i in range(0, count, 100)), index_path)
+        started = time.perf_counter()
+        with SuppressionList(index_path) as suppression:
+            stats = {}
+            kept = sum(1 for _ in clean_recipients((f"user{i % (count // 2)}@example.com" for i in range(count)), suppression, stats))
+        elapsed = time.perf_counter() - started
+        assert kept == count // 2 - count // 200 and stats['duplicate'] == count // 2
+        assert elapsed < 10, f"Cleaning {count} addresses took {elapsed:.1f}s."
+    print("Recipient cleaning test completed successfully.")
+
+def test_load_recipients_applies_suppression_list():
+    print("\n2. Testing suppression list for recipient sources...")
+    saved = {key: os.environ.pop(key, None) for key in
+             ('NEWSLETTER_RECIPIENT_SOURCE', 'NEWSLETTER_RECIPIENTS_FILE', 'NEWSLETTER_SUPPRESSION_LIST')}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            recipients_path = os.path.join(tmp, 'recipients.txt')
+            with open(recipients_path, 'w', encoding='utf-8') as f:
+                f.write("a@example.com\nB@Example.com\nb@example.com\ninvalid\nc@example.com\n")
+            suppression_path = os.path.join(tmp, 'unsubscribed.csv')
+            with open(suppression_path, 'w', encoding='utf-8') as f:
+                f.write("email,reason\nc@example.com,unsubscribed\n")
+            os.environ['NEWSLETTER_RECIPIENTS_FILE'] = recipients_path
+            os.environ['NEWSLETTER_SUPPRESSION_LIST'] = suppression_path
+            assert list(load_recipients('file')) == ['a@example.com', 'B@example.com', 'b@example.com']
+            assert os.path.exists(suppression_path + '.idx'), "The list should be compiled to an index."
+
+            # A newer list replaces the compiled index
+            with open(suppression_path, 'w', encoding='utf-8') as f:
+                f.write("email\na@example.com\n")
+            stale = os.path.getmtime(suppression_path) - 10
+            os.utime(suppression_path + '.idx', (stale, stale))
+            assert list(load_recipients('file')) == ['B@example.com', 'b@example.com', 'c@example.com']
+
+            # The compiled index can be configured directly
+            os.environ['NEWSLETTER_SUPPRESSION_LIST'] = suppression_path + '.idx'
+            assert list(load_recipients('file')) == ['B@example.com', 'b@example.com', 'c@example.com']
+
+            # The list is only compiled and opened once the source has produced an address
+            os.environ['NEWSLETTER_SUPPRESSION_LIST'] = suppression_path
+            os.remove(suppression_path + '.idx')
+            load_recipients('file')
+            os.environ['NEWSLETTER_RECIPIENTS_FILE'] = os.path.join(tmp, 'missing.txt')
+            try:
+                list(load_recipients('file'))
+                assert False, "A missing recipients file should be reported."
+            except FileNotFoundError:
+                pass
+            assert not os.path.exists(suppression_path + '.idx'), "No index for a stream that never produced an address."
+    finally:
+        for key, value in saved.items():
+            os.environ.pop(key, None)
+            if value is not None:
+                os.environ[key] = value
+    print("Suppression list test completed successfully.")
+
+if __name__ == "__main__":
+    print("Starting recipient filter tests...")
+    for test_func in [test_clean_recipients, test_load_recipients_applies_suppression_list]:
+        test_func()
+    print("\nAll recipient filter tests completed successfully!")
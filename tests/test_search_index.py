@@ -0,0 +1,62 @@
+# tests/test_search_index.py
+# Checks the prebuilt search index: shard encoding round-trips and queries only touch their shards
+
+import os
+import sys
+import json
+import random
+import tempfile
+from pathlib import Path
+
+# Add parent directory to Python path for importing search_index.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from scripts.search_index import tokenize, encode_shard, decode_shard, build_search_index, search, shard_filename
+
+def test_shard_round_trip():
+    print("\n1. Testing search shard encoding...")
+    assert tokenize("Cassisus’ Élan, naïve_2024!") == ["cassisus", "elan", "naive", "2024"]
+    rng = random.Random(42)
+    terms = sorted({"ca" + "".join(rng.choice("abcé") for _ in range(rng.randint(0, 6))) for _ in range(200)})
+    shard = [(term, sorted((rng.randint(0, 100000), rng.randint(1, 500)) for _ in range(rng.randint(1, 20))))
+             for term in terms]
+    # Postings are per entry, so entry indexes are unique and ascending
+    shard = [(term, sorted(dict(postings).items())) for term, postings in shard]
+    data = encode_shard(shard)
+    assert decode_shard(data) == shard
+    assert len(data) < len(json.dumps(shard)) / 2, "Front coding and varints should beat JSON comfortably."
+    print("Search shard encoding test completed successfully.")
+
+def test_build_and_query_index():
+    print("\n2. Testing search index build and query...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manuscript = os.path.join(tmp, 'Fantasy.txt')
+        output_dir = os.path.join(tmp, 'search')
+        with open(manuscript, 'w', encoding='utf-8') as f:
+            f.write("●\n\n“Of Cassisus.”\n\nCassisus the elder.\n\n●\n\n“Of Tyrannius.”\n\nTyrannius met Cassisus twice. Cassisus left; Cassisus returned.\n\n"
+                    "●\n\n“Of the Sea.”\n\nNo names here.\n")
+        stats = build_search_index(manuscript, output_dir)
+        assert stats['documents'] == 3
+        assert build_search_index(manuscript, output_dir)['written'] == 0, "Unchanged shards must not be rewritten."
+
+        assert search("cassisus", output_dir) == [1, 0], "Entries should be ranked by term frequency."
+        assert search("Cassisus Tyrannius", output_dir) == [1]
+        assert search("Tyr", output_dir) == [1], "The last term should match as a prefix."
+        assert search("the sea", output_dir) == [2]
+        assert search("dragons", output_dir) == []
+
+        # A lookup reads the shard for its prefix only
+        os.remove(os.path.join(output_dir, shard_filename("se")))
+        assert search("tyrannius", output_dir) == [1]
+
+        with open(manuscript, 'w', encoding='utf-8') as f:
+            f.write("●\n\n“Of Cassisus.”\n\nCassisus the elder.\n")
+        build_search_index(manuscript, output_dir)
+        assert search("tyrannius", output_dir) == []
+        assert not os.path.exists(os.path.join(output_dir, shard_filename("ty"))), "Obsolete shards should be removed."
+    print("Search index build and query test completed successfully.")
+
+if __name__ == "__main__":
+    print("Starting search index tests...")
+    for test_func in [test_shard_round_trip, test_build_and_query_index]:
+        test_func()
+    print("\nAll search index tests completed successfully!")
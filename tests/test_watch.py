@@ -0,0 +1,116 @@
+# tests/test_watch.py
+# Checks that watch mode rebuilds only what a change affects and debounces bursts of edits
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+
+# Add parent directory to Python path for importing watch.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from scripts.watch import SiteBuilder, InotifyWatcher, watch, watched_directories
+from scripts.search_index import search
+
+ENTRY = "●\n\n“Of {name}.”\n\n{name} kept the record.\n\n"
+
+def make_site(tmp, names):
+    os.makedirs(os.path.join(tmp, 'src'))
+    manuscript = os.path.join(tmp, 'src', 'Fantasy.txt')
+    with open(manuscript, 'w', encoding='utf-8') as f:
+        f.write("".join(ENTRY.format(name=name) for name in names))
+    with open(os.path.join(tmp, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write("<html></html>")
+    return SiteBuilder(root_dir=tmp, manuscript_path=manuscript, entries_dir=os.path.join(tmp, 'entries'),
+                       search_dir=os.path.join(tmp, 'search'), sitemap_file=os.path.join(tmp, 'sitemap.xml'),
+                       sitemap_cache_file=os.path.join(tmp, '.sitemap-cache.json'),
+                       announced_manifest=os.path.join(tmp, '.newsletter-cache', 'announced.json'),
+                       queue_dir=os.path.join(tmp, '.newsletter-cache'))
+
+def read_queue(builder):
+    with open(os.path.join(builder.queue_dir, 'queue.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+def test_site_builder_incremental_rebuild():
+    print("\n1. Testing incremental site rebuild...")
+    with tempfile.TemporaryDirectory() as tmp:
+        builder = make_site(tmp, ["Cassisus", "Tyrannius"])
+        report = builder.build_all()
+        assert "re-parsed 2 of 2 entries" in report and "sitemap with 1 URL(s)" in report
+        assert read_queue(builder)['count'] == 0, "Entries present at startup count as announced."
+
+        with open(builder.manuscript_path, 'a', encoding='utf-8') as f:
+            f.write(ENTRY.format(name="Orsolya"))
+        report = builder.handle({builder.manuscript_path})
+        assert "re-parsed 2 of 3 entries, 1 entry shard(s) written" in report, report
+        assert "sitemap" not in report, "Manuscript edits should not touch the sitemap."
+        assert search("orsolya", builder.search_dir) == [2]
+        queue = read_queue(builder)
+        assert queue['count'] == 1 and queue['entries'][0]['title'] == "“Of Orsolya.”"
+        assert "Orsolya" in queue['subject']
+        assert os.path.exists(os.path.join(builder.queue_dir, 'queue.html'))
+
+        assert builder.handle({builder.manuscript_path}).endswith("manuscript unchanged")
+        assert builder.handle({os.path.join(tmp, 'notes.txt')}) is None
+
+        os.makedirs(os.path.join(tmp, 'archive'))
+        with open(os.path.join(tmp, 'archive', 'old.html'), 'w', encoding='utf-8') as f:
+            f.write("<html></html>")
+        report = builder.handle({os.path.join(tmp, 'archive', 'old.html')})
+        assert "sitemap with 2 URL(s), 1 file(s) updated" in report and "entries" not in report
+        with open(builder.sitemap_file, encoding='utf-8') as f:
+            sitemap = f.read()
+        assert "archive/old.html" in sitemap
+        assert sitemap.count("<lastmod>") == 2, "Untracked pages get their mtime as lastmod."
+    print("Incremental site rebuild test completed successfully.")
+
+def test_watch_debounces_inotify_events():
+    print("\n2. Testing inotify watch with debounce...")
+    if not sys.platform.startswith('linux'):
+        print("inotify is Linux-only; skipping.")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        builder = make_site(tmp, ["Cassisus"])
+        os.makedirs(os.path.join(tmp, '_site', 'assets'))
+        directories = watched_directories(tmp, builder.output_dirs())
+        assert not [d for d in directories if '_site' in d], "The build_assets output is not watched."
+        watcher = InotifyWatcher(directories, builder.output_dirs())
+        rebuilds = []
+        original_rebuild = builder.rebuild
+        def counting_rebuild(**kwargs):
+            line = original_rebuild(**kwargs)
+            if line:
+                rebuilds.append(line)
+            return line
+        builder.rebuild = counting_rebuild
+        thread = threading.Thread(target=watch, args=(builder, watcher), kwargs={'debounce': 0.3, 'rebuilds': 1})
+        thread.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not rebuilds and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # A burst of saves, one written to a temporary file and renamed into place
+            for name in ("Tyrannius", "Orsolya"):
+                with open(builder.manuscript_path, 'a', encoding='utf-8') as f:
+                    f.write(ENTRY.format(name=name))
+            tmp_path = builder.manuscript_path + '.swp'
+            with open(builder.manuscript_path, encoding='utf-8') as f:
+                text = f.read()
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text + ENTRY.format(name="Vesna"))
+            os.replace(tmp_path, builder.manuscript_path)
+            thread.join(timeout=10)
+        finally:
+            watcher.close()
+        assert not thread.is_alive(), "The watcher should rebuild once after the burst."
+        assert len(rebuilds) == 2, f"Expected the initial build plus one debounced rebuild, got {rebuilds}"
+        assert "of 4 entries" in rebuilds[1] and "3 entries queued" in rebuilds[1], rebuilds[1]
+    print("Inotify watch test completed successfully.")
+
+if __name__ == "__main__":
+    print("Starting watch tests...")
+    for test_func in [test_site_builder_incremental_rebuild, test_watch_debounces_inotify_events]:
+        test_func()
+    print("\nAll watch tests completed successfully!")